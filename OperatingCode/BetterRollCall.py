@@ -1,46 +1,104 @@
-import subprocess
+import asyncio
+import argparse
+import math
+import re
 import os
 import sys
 import csv
 import socket
 from datetime import datetime
 import logging
+from fleetConfig import FLEET_FILE, load_fleet_config
 
-def check_online(hostname):
+PROBE_TIMEOUT = 2.0  # Seconds before an unanswered host is marked offline
+SSH_PORT = 22
+
+PING_ADDRESS = re.compile(r"^PING [^(]*\(([^)]+)\)")
+
+
+# Function to resolve a hostname to its first IPv4 address without blocking the loop
+async def resolve(hostname, timeout=PROBE_TIMEOUT):
+    loop = asyncio.get_running_loop()
+    try:
+        infos = await asyncio.wait_for(loop.getaddrinfo(hostname, None, family=socket.AF_INET), timeout)
+        return infos[0][4][0]
+    except (OSError, asyncio.TimeoutError):
+        return ""
+
+# Function to ping a host once; ping prints the address it resolved, so the IP comes for free
+async def ping_probe(hostname, timeout=PROBE_TIMEOUT):
+    process = await asyncio.create_subprocess_exec(
+        'ping', '-c', '1', '-W', str(max(1, math.ceil(timeout))), hostname,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+    try:
+        # Hard deadline on top of -W, which does not cover slow name lookups
+        output, _ = await asyncio.wait_for(process.communicate(), timeout + 1)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return False, ""
+    output = output.decode(errors="replace")
+    match = PING_ADDRESS.search(output)
+    return " 1 received" in output, match.group(1) if match else ""
+
+# Function to try an SSH (TCP) connection, which also shows sshd is accepting logins
+async def tcp_probe(hostname, timeout=PROBE_TIMEOUT, port=SSH_PORT):
+    ip_address = await resolve(hostname, timeout)
+    if not ip_address:
+        return False, ""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip_address, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False, ip_address
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True, ip_address
+
+async def check_online(hostname, probe="ping", timeout=PROBE_TIMEOUT, port=SSH_PORT):
     """
-    Check if a device is online by pinging it and return its IP address if available.
+    Check if a device is online and return its IP address if available.
+
+    `probe` is "ping" (one ICMP echo) or "tcp" (connect to the SSH port).
     """
     try:
-        output = subprocess.check_output(['ping', '-c', '1', hostname], stderr=subprocess.STDOUT, universal_newlines=True)
-        if "1 received" in output:
-            logging.info(f"{hostname} is online.")
-            # Try to fetch IP using 'dig' command
-            try:
-                dig_output = subprocess.check_output(['dig', '+short', hostname], stderr=subprocess.STDOUT, universal_newlines=True).strip()
-                ip_address = dig_output.split('\n')[0] if dig_output else "Unknown"
-            except Exception:
-                # Fallback to socket lookup
-                try:
-                    ip_address = socket.gethostbyname(hostname)
-                except socket.gaierror:
-                    ip_address = "Unknown"
-            return True, ip_address
+        if probe == "tcp":
+            is_online, ip_address = await tcp_probe(hostname, timeout, port)
         else:
-            logging.error(f"{hostname} is offline.")
-            return False, ""
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Failed to ping {hostname}: {e.output}")
-        return False, ""
+            is_online, ip_address = await ping_probe(hostname, timeout)
     except Exception as e:
         logging.error(f"An error occurred for {hostname}: {e}")
         return False, ""
+    if not is_online:
+        logging.error(f"{hostname} is offline.")
+        return False, ""
+    logging.info(f"{hostname} is online.")
+    if not ip_address:
+        ip_address = await resolve(hostname, timeout) or "Unknown"
+    return True, ip_address
+
+# Function to probe every host at once, so the roll call takes about one timeout
+async def roll_call(hosts, probe="ping", timeout=PROBE_TIMEOUT, port=SSH_PORT):
+    return await asyncio.gather(*(check_online(host, probe, timeout, port) for host in hosts))
 
 if __name__ == "__main__":
-    pi_hosts = [f"pi{i}.wifi.etsu.edu" for i in range(1, 21)]
+    parser = argparse.ArgumentParser(description="Check which Pis are online and append the results to RpiConnectionData.csv.")
+    parser.add_argument('--probe', choices=["ping", "tcp"], default="ping", help='ping (ICMP) or tcp (connect to the SSH port, default: ping)')
+    parser.add_argument('--timeout', type=float, default=PROBE_TIMEOUT, help=f'Seconds to wait for each Pi (default: {PROBE_TIMEOUT:g})')
+    parser.add_argument('--port', type=int, default=SSH_PORT, help=f'Port for the tcp probe (default: {SSH_PORT})')
+    parser.add_argument('--fleet-config', default=FLEET_FILE, help=f'Fleet file listing the Pis (default: {FLEET_FILE})')
+    args = parser.parse_args()
+
+    pi_hosts = load_fleet_config(args.fleet_config).hostnames
     current_date = datetime.now().strftime("%Y-%m-%d")
     current_time = datetime.now().strftime("%H:%M:%S")
     csv_filename = f"/home/rpimain/RpiConnectionData.csv"
 
+    # Rollcall phase
+    results = asyncio.run(roll_call(pi_hosts, args.probe, args.timeout, args.port))
+
     # Check if the CSV file exists; if not, create it with headers
     file_exists = os.path.isfile(csv_filename)
     with open(csv_filename, mode='a', newline='') as file:
@@ -48,15 +106,13 @@ if __name__ == "__main__":
         if not file_exists:
             writer.writerow(["Date", "Time", "Hostname", "Status", "IP Address"])
 
-        # Rollcall phase
         unresponsive_pis = []
-        for host in pi_hosts:
-            is_online, ip_address = check_online(host)
+        for host, (is_online, ip_address) in zip(pi_hosts, results):
             status = "Online" if is_online else "Offline"
             writer.writerow([current_date, current_time, host, status, ip_address])
             if not is_online:
                 unresponsive_pis.append(host)
-    
+
     # Print unresponsive Pis to console
     if unresponsive_pis:
         print("The following Pis could not connect:")
@@ -67,5 +123,3 @@ if __name__ == "__main__":
         print("All Pis connected successfully.")
         sys.exit(0)
     print("Roll call completed. Results appended to rollCall_results.csv.")
-
-
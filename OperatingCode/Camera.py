@@ -1,88 +1,185 @@
+import argparse  # For the frame size options passed by the control node
 import cv2  # OpenCV library for computer vision tasks
 import imutils  # Utility functions for image processing (not used in this code)
 import datetime  # To work with date and time
+import json  # For the clip sidecar files
 import os  # To interact with the file system (for creating directories, saving files, etc.)
-import numpy as np  # For numerical operations, like calculating means of arrays
-
-# Initialize video capture from the default webcam (device index 0)
-cap = cv2.VideoCapture(0)
-
-# Retrieve the frames per second (FPS) of the capture device (though this value isn't used later)
-fps = cap.get(cv2.CAP_PROP_FPS)
-
-# Set the resolution of the captured frames to 640x480 pixels
-cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-
-# Initialize variables for motion detection and image saving
-last_mean = 0           # Stores the mean brightness of the previous frame
-detected_motion = False # Flag to indicate if motion has been detected
-frame_rec_count = 0     # Counter for the number of frames saved during a motion event
-dirName = ""            # Name of the directory where images will be saved
-
-# Get the current date and time; format it into a string (this one isn't used later)
-now = datetime.datetime.now()
-date = now.strftime("%Y-%m-%d_%H:%M:%S") + f".{now.microsecond:06d}"
-
-dirFlag = True  # Flag to control creation of a new directory when a new motion event is detected
-
-print("Start")  # Notify that the program has started
-
-# Main loop: continuously capture and process frames from the webcam
-while True:
-    # Capture a frame from the webcam
-    ret, frame = cap.read()
-
-    # If a frame wasn't successfully captured, log the issue and skip to the next loop iteration
-    if not ret:
-        print("Frame not captured")
-        continue
-
-    # Convert the captured frame to grayscale to simplify brightness calculations
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    
-    # Calculate the absolute difference between the current frame's mean brightness and the previous frame's
-    result = np.abs(np.mean(gray) - last_mean)
-    
-    # Update the last_mean for the next iteration's comparison
-    last_mean = np.mean(gray)
-    
-    # Determine if the brightness change qualifies as motion:
-    # - Change greater than 0.7 (to avoid noise)
-    # - And less than 30.0 (to ignore extreme changes like sudden light flashes)
-    if result > 0.7 and result < 30.0:
-        detected_motion = True  # Set the flag indicating that motion is detected
-        
-        # If this is the first frame of the new motion event, create a directory to store the images
-        if dirFlag:
-            now = datetime.datetime.now()  # Get the current date and time for naming the directory
-            dirName = f"{now}"             # Use the current timestamp as the directory name
-            
-            # Create the main folder "BeeImages" if it doesn't already exist
-            if not os.path.exists("BeeImages"):
-                os.mkdir("BeeImages")
-            
-            # Create a subdirectory within "BeeImages" using the timestamp
-            dirLoc = f"BeeImages/{dirName}"
-            os.mkdir(dirLoc)
-            
-            # Reset the flag to prevent creating multiple directories during the same motion event
-            dirFlag = False
-
-    # If motion has been detected, save the current frame as an image
-    if detected_motion:
-        # Define the location and filename for the saved image
-        saveLoc = f"BeeImages/{dirName}/Image_{frame_rec_count}.png"
-        cv2.imwrite(saveLoc, frame)  # Save the current frame as a PNG file
-        
-        # Increment the frame counter after saving the image
-        frame_rec_count += 1
-
-    # After saving 50 frames, reset the system to be ready for a new motion event
-    if frame_rec_count == 50:
-        cap.release()  # Release the current capture (helps reset any internal buffers)
-        cap = cv2.VideoCapture(0)  # Reinitialize video capture from the webcam
-        frame_rec_count = 0  # Reset the frame counter for the next motion event
-        detected_motion = False  # Reset the motion detection flag
-        dirFlag = True  # Reset the directory creation flag for the next motion event
+import signal  # For shutting down cleanly when the screen session is killed
+import socket  # For getting the Raspberry Pi's hostname
+import time  # For waiting in the main thread while the pipeline runs
+from collections import deque  # Fixed-size ring buffer of recent frames
+from cameraPipeline import CameraPipeline  # Capture/detect/write threads
+from motionDetection import make_detector  # Downscaled, ROI-based motion detectors
+from telemetry import TelemetryPublisher  # Live clip events and heartbeats to the control node
 
+# Clip settings: frames kept from before the trigger, and frames recorded after the last motion
+PRE_TRIGGER_FRAMES = 25
+POST_TRIGGER_FRAMES = 50
+CLIP_FOURCC = "MJPG"  # Motion-JPEG is cheap to encode on a Pi Zero; use "avc1" for H.264 where available
+CLIP_EXTENSION = ".avi"
+CLIP_INFO_EXTENSION = ".json"  # Sidecar with the clip's first/last frame times, read by visitIndex
+
+# Motion detection settings (see motionDetection.py). DETECTOR is "background"
+# (running average), "difference" (previous frame) or "mean" (the original
+# whole-frame brightness test). ROI_CIRCLES / ROI_RECTS restrict detection to
+# the flower top, as fractions of the frame, e.g. [(0.5, 0.5, 0.3)].
+DETECTOR = "background"
+ROI_CIRCLES = []
+ROI_RECTS = []
+
+# Telemetry collector on the control node ("host:port"), or None to only save clips locally;
+# parallel.py passes --telemetry when the run has a collector
+TELEMETRY_ADDRESS = None
+
+# Default frame size; parallel.py passes each Pi's camera settings from the fleet file
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+
+
+class ClipRecorder:
+    """
+    Keep a ring buffer of recent frames and write motion events as video clips.
+
+    Every frame goes through `add_frame` (or `process`, which also triggers on
+    motion). When `trigger` is called the buffered pre-trigger frames start a
+    new clip, and frames keep being appended until POST_TRIGGER_FRAMES frames
+    pass without another trigger. This runs on the pipeline's writer thread,
+    so encoding never blocks capture. Clips are named after the capture time
+    of the frame that triggered them, not the time the writer gets to it.
+
+    When a clip is closed a sidecar `{clip}.json` records the capture times of
+    its first and last frames, so visitIndex knows the span it really covers
+    (pre-trigger frames included, and however long motion kept it going).
+    """
+
+    def __init__(self, output_folder, fps, frame_size, pre_frames=PRE_TRIGGER_FRAMES, post_frames=POST_TRIGGER_FRAMES,
+                 publisher=None):
+        self.output_folder = output_folder
+        self.publisher = publisher
+        self.fps = fps
+        self.frame_size = frame_size
+        self.post_frames = post_frames
+        self.buffer = deque(maxlen=pre_frames)  # (timestamp, frame) pairs
+        self.writer = None
+        self.frames_left = 0
+        self.clip = None  # Path, trigger time, first and last frame times and frame count of the open clip
+
+    def clip_path(self, timestamp):
+        # HH-MM-SS of the trigger frame, with _1, _2, ... for further clips started in the same second
+        time_stamp = datetime.datetime.fromtimestamp(timestamp).strftime("%H-%M-%S")
+        clip_path = os.path.join(self.output_folder, f"{time_stamp}{CLIP_EXTENSION}")
+        suffix = 0
+        while os.path.exists(clip_path):
+            suffix += 1
+            clip_path = os.path.join(self.output_folder, f"{time_stamp}_{suffix}{CLIP_EXTENSION}")
+        return clip_path
+
+    def trigger(self, timestamp):
+        if self.writer is None:
+            # Start a new clip named after the trigger frame, beginning with the buffered frames
+            clip_path = self.clip_path(timestamp)
+            self.writer = cv2.VideoWriter(clip_path, cv2.VideoWriter_fourcc(*CLIP_FOURCC), self.fps, self.frame_size)
+            self.clip = {"path": clip_path, "trigger_epoch": timestamp, "start_epoch": None, "end_epoch": None, "frames": 0}
+            print(f"Recording clip: {clip_path}")
+            if self.publisher:
+                self.publisher.publish("clip", event_time=timestamp, path=clip_path)
+            while self.buffer:
+                self._write(*self.buffer.popleft())
+        self.frames_left = self.post_frames  # Motion keeps extending the clip
+
+    def _write(self, timestamp, frame):
+        self.writer.write(frame)
+        if self.clip["start_epoch"] is None:
+            self.clip["start_epoch"] = timestamp
+        self.clip["end_epoch"] = timestamp
+        self.clip["frames"] += 1
+
+    def add_frame(self, frame, timestamp):
+        if self.writer is None:
+            self.buffer.append((timestamp, frame))
+            return
+        self._write(timestamp, frame)
+        self.frames_left -= 1
+        if self.frames_left <= 0:
+            self.close()
+
+    def process(self, frame, timestamp, motion):
+        if motion:
+            self.trigger(timestamp)
+        self.add_frame(frame, timestamp)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+            clip_path = self.clip.pop("path")
+            with open(os.path.splitext(clip_path)[0] + CLIP_INFO_EXTENSION, "w") as file:
+                json.dump(dict(self.clip, fps=self.fps), file)
+            self.clip = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record motion-triggered clips at the flower.")
+    parser.add_argument('--width', type=int, default=FRAME_WIDTH, help=f'Frame width in pixels (default: {FRAME_WIDTH})')
+    parser.add_argument('--height', type=int, default=FRAME_HEIGHT, help=f'Frame height in pixels (default: {FRAME_HEIGHT})')
+    parser.add_argument('--telemetry', metavar='HOST:PORT', default=TELEMETRY_ADDRESS, help='Also stream clip events and heartbeats to a telemetry collector')
+    args = parser.parse_args()
+
+    # Initialize video capture from the default webcam (device index 0)
+    cap = cv2.VideoCapture(0)
+
+    # Set the resolution of the captured frames (640x480 pixels by default)
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, args.width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, args.height)
+
+    # Retrieve the frames per second (FPS) of the capture device for the clip files
+    fps = cap.get(cv2.CAP_PROP_FPS) or 15.0
+    frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+    # Clips go in a dated folder per Pi, e.g. BeeImages/2025-06-01_pi3/HH-MM-SS.avi
+    today_date = datetime.datetime.now().strftime("%Y-%m-%d")
+    output_folder = os.path.join("BeeImages", f"{today_date}_{socket.gethostname()}")
+    os.makedirs(output_folder, exist_ok=True)
+
+    publisher = None
+    recorder = ClipRecorder(output_folder, fps, frame_size)
+
+    # Every frame goes to the recorder on the writer thread: it is either buffered
+    # as a pre-trigger frame or appended to the clip being recorded. Motion frames
+    # start or extend a clip, so they wait for room on the write queue rather
+    # than being dropped.
+    def handle_frame(pipeline, frame, timestamp, motion):
+        pipeline.submit(recorder.process, frame, timestamp, motion, wait=bool(motion))
+
+    detector = make_detector(DETECTOR, circles=ROI_CIRCLES, rects=ROI_RECTS)
+    pipeline = CameraPipeline(cap, detector, handle_frame)
+
+    # Heartbeats carry the pipeline counters, so dropped frames show up live
+    if args.telemetry:
+        publisher = TelemetryPublisher(args.telemetry, "camera", status=pipeline.stats).start()
+        recorder.publisher = publisher
+
+    # Treat SIGTERM/SIGHUP (e.g. `pkill screen`) like Ctrl+C so the open clip is finished
+    def request_stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGHUP, request_stop)
+
+    print("Start")  # Notify that the program has started
+
+    # Capture, detection and encoding run on their own threads. The camera is
+    # opened once and never reopened, so no frames are lost between events.
+    pipeline.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("Stopping")
+    finally:
+        pipeline.stop()  # Writes out everything already queued
+        recorder.close()
+        cap.release()
+        pipeline.report()
+        if publisher:
+            publisher.stop()
@@ -1,18 +1,27 @@
 import os
 import sys
-import time
+import asyncio
 from datetime import datetime
 import subprocess
 import logging
 import pandas as pd
+from fleetOrchestrator import FleetOrchestrator, report_results
+from scriptDeploy import build_manifest, deploy_scripts, recorder_modules
+from dataCollector import DataCollector, COLLECT_INTERVAL
+from runScheduler import Recorder, RunScheduler, run_window
+from fleetConfig import load_fleet_config
 
 
-#add functionality to provide user input as to the color/treatment of each pi, which is then added to the resulting csv files
+# The Pis, and the color/treatment of each one, are listed in fleet.json (see fleetConfig.py);
+# dataDenoising.py adds the treatment to the resulting csv files
 
 #paths & directories
 IRScript = ''  # Path to the IRscript on the Control Pi
 CameraScript = '' # Path to the Camera on the Control Pi
 
+# Shared SSH sessions for deploying to all Pis at once
+fleet = FleetOrchestrator()
+
 def check_online(hostname):
     """
     Check if a device is online by pinging it.
@@ -29,91 +38,37 @@ def check_online(hostname):
         logging.error(f"Failed to ping {hostname}: {e.output}")
         return False
 
-def send_scripts_to_pi(pi_num, IRScript, CameraScript):
+async def send_scripts_to_pi(hostname, IRScript, CameraScript):
     """
-    Executes a script on a remote Pi using SSH within a screen session.
+    Copies the IR and camera scripts, and the modules they import, to a remote Pi,
+    skipping any whose contents are unchanged.
     """
-    hostname = f"pi{pi_num}.wifi.edu" #replace with hostname pattern
-    username = f"pi{pi_num}"
-    
-    try:
-        #Copy the script to the remote Pi
-        scp_command1 = f"scp {IRScript} {username}@{hostname}:/home/{username}/IRScript.py"
-        subprocess.check_call(scp_command1, shell=True)
-        print(f"IRScript sent to {hostname}.")
-        logging.info(f"IRScript sent to {hostname}.")
-
-        scp_command2 = f"scp {CameraScript} {username}@{hostname}:/home/{username}/CameraScript.py"
-        subprocess.check_call(scp_command2, shell=True)
-        print(f"CameraScript sent to {hostname}.")
-        logging.info(f"CameraScript sent to {hostname}.")
-    except subprocess.CalledProcessError as e:
-        print(f"Error sending scripts to {hostname}: {e}")
-        logging.error(f"Error sending scripts to {hostname}: {e}")
+    username = hostname.split('.')[0]
+
+    scripts = [(IRScript, "IRScript.py"), (CameraScript, "CameraScript.py")]
+    scripts += recorder_modules(os.path.dirname(os.path.abspath(__file__)))
+    manifest = build_manifest(scripts, f"/home/{username}")
+    sent = await deploy_scripts(fleet, username, hostname, manifest)
+    for remote_path in sent:
+        print(f"{os.path.basename(remote_path)} sent to {hostname}.")
+        logging.info(f"{os.path.basename(remote_path)} sent to {hostname}.")
+    return sent
 
 
-def execute_scripts_on_pi(pi_num, IRScript, CameraScript):
+def recorder_commands(pi):
     """
-    Executes IR and camera scripts concurrently on a remote Pi using SSH within a screen session.
+    Screen sessions for the IR and camera scripts on a remote Pi, one per script so the scheduler can see each one stop.
     """
-    hostname = f"pi{pi_num}.wifi.edu"
-    username = f"pi{pi_num}"
-
-    try:
-
-        # Start the script in a detached screen session
-        ssh_command = f"""
-            ssh {username}@{hostname} '
-                screen -dmS Scripts_{pi_num} bash -c "
-                    screen -t IRScript python3 /home/{username}/IRScript.py;
-                    screen -t CameraScript python3 /home/{username}/CameraScript.py
-                "
-            '
-        """
-        subprocess.check_call(ssh_command, shell=True)
-
-        print(f"Scripts executed concurrently on {hostname} in a screen session.")
-        logging.info(f"Scripts executed concurrently on {hostname} in a screen session.")
-    except subprocess.CalledProcessError as e:
-        print(f"Error executing scripts on {hostname}: {e}")
-        logging.error(f"Error executing scripts on {hostname}: {e}")
-
-# Function to fetch CSV files from remote Pis
-def fetch_csv_files(pi_hosts, local_directory):
-    print("\nFetching CSV files from remote Pis for today's date...")
-    current_date = datetime.now().strftime("%Y-%m-%d")
-    for host in pi_hosts:
-        user = host.split('.')[0]  # Extract username from hostname
-        remote_directory = f"/home/{user}/RawData"  # Remote directory where CSV files are stored
-        try:
-            # Use scp to fetch the files
-            subprocess.run(
-                ["scp", f"{user}@{host}:{remote_directory}/{current_date}*.csv", local_directory],
-                check=True
-            )
-            print(f"Fetched files from {host}.")
-        except subprocess.CalledProcessError as e:
-            print(f"Error fetching files from {host}: {e}")
-
-
-# Function to cleanup by terminating all screen sessions on remote Pis
-def cleanup(pi_hosts):
-    print("\nPerforming cleanup...")
-    for host in pi_hosts:
-        user = host.split('.')[0]  # Extract username from hostname
-        try:
-            subprocess.run(
-                ["ssh", f"{user}@{host}", "pkill", "screen"],
-                check=True
-            )
-            print(f"Screen sessions terminated on {host}.")
-        except subprocess.CalledProcessError as e:
-            print(f"Error terminating screen sessions on {host}: {e}")
+    return [
+        Recorder(f"IRScript_{pi.name}", f"screen -dmS IRScript_{pi.name} python3 /home/{pi.name}/IRScript.py", "IRScript"),
+        Recorder(f"CameraScript_{pi.name}", f"screen -dmS CameraScript_{pi.name} python3 /home/{pi.name}/CameraScript.py", "CameraScript"),
+    ]
 
 
 if __name__ == "__main__":
 
-    pi_hosts = [f"pi{i}.wifi.edu" for i in range(1, 21)] #replace with hostname pattern
+    fleet_config = load_fleet_config()
+    pi_hosts = fleet_config.hostnames
     current_date = datetime.now().strftime("%Y-%m-%d")
     current_time = datetime.now().strftime("%H%M%S")
 
@@ -156,28 +111,25 @@ if __name__ == "__main__":
     print("Roll call completed.")
 
     
-     # Send scripts to each Pi
-    for pi_num in range(1, 21):
-        send_scripts_to_pi(pi_num, IRScript, CameraScript)
-
-     # Execute scripts on each Pi
-    for pi_num in range(1, 21):
-        execute_scripts_on_pi(pi_num, IRScript, CameraScript)
-
-    print("All scripts started on Pis.")
-
-    # Wait for the duration of the long-running task
-    duration = 12 * 3600  # 12 hours in seconds (3600 seconds per hour)
-    print("\nWaiting for 12 hours ...")
-    time.sleep(duration)
-
-
-   # Fetch CSV files from remote Pis
-    fetch_csv_files(pi_hosts, local_directory)
-
-    # Perform cleanup by terminating all screen sessions on remote Pis
-    cleanup(pi_hosts)
+    # Send changed scripts to all Pis at once; a Pi whose deploy failed is left out of the run
+    results = fleet.run(pi_hosts, send_scripts_to_pi, IRScript, CameraScript)
+    report_results("Deploy", results)
+    deployed = {result.host for result in results if result.status == "ok"}
+    for result in results:
+        if result.status != "ok":
+            logging.error(f"Deploy {result.status} on {result.host}: {result.error}; not recording there.")
+    if not deployed:
+        print("No Pi received the scripts. Halting execution.")
+        fleet.close()
+        sys.exit(1)
+
+    # Record for 12 hours, checking the recorders every minute and collecting data as it comes in;
+    # Ctrl-C stops the recorders and fetches everything early
+    recorders = {pi.hostname: recorder_commands(pi) for pi in fleet_config if pi.hostname in deployed}
+    collector = DataCollector(fleet, local_directory, data_directories=[".", "RawData"])
+    scheduler = RunScheduler(fleet, recorders, collector, collect_interval=COLLECT_INTERVAL)
+    asyncio.run(scheduler.run(*run_window("now", hours=12)))
+    fleet.close()
 
     print("All screen sessions terminated.")
     logging.info("All screen sessions terminated.")
-
@@ -5,69 +5,255 @@ import RPi.GPIO as GPIO
 import csv
 import os
 import logging
+import argparse
+import signal
+import threading
+from collections import deque
+from eventLog import EventLogWriter, event_log_name
+from telemetry import TelemetryPublisher
 
 # Constants
 BEAM_PIN = 17
 ID = socket.gethostname()  # Use the actual hostname of the Raspberry Pi
 current_date = time.strftime("%Y-%m-%d", time.localtime())
 CSV_FILE = f"{current_date}_{ID}_data.csv"
+EVENT_LOG_FILE = event_log_name(current_date, ID)
+CSV_COLUMNS = ["hostname", "date", "start_time", "end_time", "time_elapsed", "start_epoch", "end_epoch"]
 
+DEBOUNCE_SECONDS = 0.05  # An edge must hold this long before it counts as a real change
+WRITE_INTERVAL = 0.2     # How often the writer thread drains the edge queue
+FSYNC_INTERVAL = 10.0    # How often written rows are forced out to the SD card
 
-# Initialize start_time globally
-start_time = None
+CLOCK_STEP_LOG = 0.5     # Seconds; a wall clock step larger than this is logged
 
-# Ensure the CSV file exists and has the correct header
-if not os.path.exists(CSV_FILE):
-    with open(CSV_FILE, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(["hostname", "date", "start_time", "end_time", "time_elapsed"])
+class ClockAnchor:
+    """
+    Map monotonic edge times to wall-clock epochs.
+
+    Edges are timed with the monotonic clock, so durations are exact even if
+    the wall clock moves. The offset between the two clocks is re-read before
+    every batch of edges is written, so when NTP or a manual fix steps the
+    Pi's clock (a Pi has no RTC) the epochs follow it. The visits then stay on
+    the same clock as the camera's frame times and as clockAudit, which
+    reads the Pi's wall clock.
+    """
+
+    def __init__(self):
+        self.offset = time.time() - time.monotonic()
+
+    def refresh(self):
+        offset = time.time() - time.monotonic()
+        if abs(offset - self.offset) > CLOCK_STEP_LOG:
+            logging.info(f"Wall clock stepped by {offset - self.offset:+.3f} s")
+        self.offset = offset
+
+    def epoch(self, timestamp):
+        return self.offset + timestamp
+
+
+clock_anchor = ClockAnchor()
+
+# Raw (monotonic timestamp, level) edges from the GPIO callback; deque.append is
+# atomic, so the callback never takes a lock or touches the disk
+edge_queue = deque()
+
+
+class EdgeDebouncer:
+    """
+    Filter raw beam edges down to stable state changes.
+
+    A new level is held as pending until it has lasted `debounce` seconds
+    without the beam flipping back; a flip back inside that window is treated
+    as bounce and discarded. Accepted changes keep the time of their first edge.
+    """
+
+    def __init__(self, initial_level, debounce=DEBOUNCE_SECONDS):
+        self.level = initial_level
+        self.debounce = debounce
+        self.pending = None
+
+    def feed(self, timestamp, level):
+        accepted = self.flush(timestamp)
+        if self.pending is None:
+            if level != self.level:
+                self.pending = (timestamp, level)
+        elif level == self.level:
+            self.pending = None  # Bounced back before the debounce window ended
+        return accepted
+
+    def flush(self, now):
+        if self.pending is not None and now - self.pending[0] >= self.debounce:
+            accepted = [self.pending]
+            self.level = self.pending[1]
+            self.pending = None
+            return accepted
+        return []
 
-# Setup logging
-log_filename = f"{ID}_{current_date}_IR.log"
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(message)s',
-    handlers=[
-        logging.FileHandler(log_filename),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
 
 def break_beam_callback(channel):
-    global start_time  # Declare start_time as global
-    if GPIO.input(BEAM_PIN):
-        logging.info("Bee Left")
-        print("Bee Left")
-        if start_time is not None:  # Check if start_time has been initialized
-            end_time = time.time()
-            elapsed_time = end_time - start_time
-            save_data(start_time, end_time, elapsed_time)
-            start_time = None  # Reset start_time after saving data
-        else:
-            logging.info("Timer has not started yet.")
-    else:
+    # Runs on the GPIO callback thread: record the edge and return immediately
+    edge_queue.append((time.monotonic(), GPIO.input(BEAM_PIN)))
+
+
+class VisitWriter(threading.Thread):
+    """
+    Turn queued edges into visits and append them to the CSV file and/or
+    the binary event log.
+
+    Files are opened once; rows are written in batches every WRITE_INTERVAL
+    and flushed/fsynced every FSYNC_INTERVAL, and everything still queued is
+    written when the thread is stopped. With a telemetry `publisher`, each
+    visit is also streamed live to the control node.
+    """
+
+    def __init__(self, debouncer, csv_file=CSV_FILE, event_log=None, publisher=None):
+        super().__init__(name="VisitWriter", daemon=True)
+        self.debouncer = debouncer
+        self.csv_file = csv_file
+        self.event_log = event_log
+        self.publisher = publisher
+        self.start_time = None
+        self.stop_event = threading.Event()
+
+    def run(self):
+        file = open(self.csv_file, mode='a', newline='') if self.csv_file else None
+        writer = csv.DictWriter(file, fieldnames=read_header(self.csv_file), extrasaction='ignore') if file else None
+        try:
+            last_sync = time.monotonic()
+            while not self.stop_event.wait(WRITE_INTERVAL):
+                clock_anchor.refresh()
+                self.write(writer, self.drain(time.monotonic()))
+                if time.monotonic() - last_sync >= FSYNC_INTERVAL:
+                    self.sync(file)
+                    last_sync = time.monotonic()
+
+            # Commit any pending edge and write out what is left
+            clock_anchor.refresh()
+            self.write(writer, self.drain(float('inf')))
+            self.sync(file)
+        finally:
+            if file:
+                file.close()
+            if self.event_log:
+                self.event_log.close()
+
+    @staticmethod
+    def write(writer, rows):
+        if writer:
+            writer.writerows(rows)
+
+    def drain(self, now):
+        rows = []
+        while edge_queue:
+            timestamp, level = edge_queue.popleft()
+            for edge in self.debouncer.feed(timestamp, level):
+                rows.extend(self.handle_edge(*edge))
+        for edge in self.debouncer.flush(now):
+            rows.extend(self.handle_edge(*edge))
+        return rows
+
+    def handle_edge(self, timestamp, level):
+        if self.event_log:
+            self.event_log.write(clock_anchor.epoch(timestamp), level)
+        if level:
+            logging.info("Bee Left")
+            if self.start_time is None:
+                logging.info("Timer has not started yet.")
+                return []
+            row = visit_row(self.start_time, timestamp)
+            self.start_time = None  # Reset start_time after saving data
+            logging.info(f"Data saved: {', '.join(map(str, row.values()))}")
+            if self.publisher:
+                self.publisher.publish("visit", event_time=float(row["start_epoch"]), **row)
+            return [row]
         logging.info("Bee Detected")
-        print("Bee Detected")
-        start_time = time.time()  # Update start_time
-
-def save_data(start, end, elapsed):
-    date = time.strftime("%Y-%m-%d", time.localtime(start))
-    start_str = time.strftime("%H:%M:%S", time.localtime(start))
-    end_str = time.strftime("%H:%M:%S", time.localtime(end))
-    
-    with open(CSV_FILE, mode='a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([ID, date, start_str, end_str, elapsed])
-        logging.info(f"Data saved: {ID}, {date}, {start_str}, {end_str}, {elapsed}")
-
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(BEAM_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-GPIO.add_event_detect(BEAM_PIN, GPIO.BOTH, callback=break_beam_callback)
-logging.info("System ready. Press Ctrl+C to exit.")
-try:
-    while True:
-        time.sleep(1)  # Keep the program running
-except KeyboardInterrupt:
-    logging.info("Program terminated by user.")
-finally:
-    GPIO.cleanup()
+        self.start_time = timestamp
+        return []
+
+    def sync(self, file):
+        if file:
+            file.flush()
+            os.fsync(file.fileno())
+        if self.event_log:
+            self.event_log.sync()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+
+def visit_row(start, end):
+    # `start`/`end` are monotonic times; the epoch columns keep microseconds
+    start_epoch = clock_anchor.epoch(start)
+    end_epoch = clock_anchor.epoch(end)
+    return {
+        "hostname": ID,
+        "date": time.strftime("%Y-%m-%d", time.localtime(start_epoch)),
+        "start_time": time.strftime("%H:%M:%S", time.localtime(start_epoch)),
+        "end_time": time.strftime("%H:%M:%S", time.localtime(end_epoch)),
+        "time_elapsed": f"{end - start:.6f}",
+        "start_epoch": f"{start_epoch:.6f}",
+        "end_epoch": f"{end_epoch:.6f}",
+    }
+
+
+def read_header(csv_file):
+    # Files started by an older version keep their original columns
+    with open(csv_file, newline='') as file:
+        return next(csv.reader(file), CSV_COLUMNS)
+
+
+def request_shutdown(signum, frame):
+    raise KeyboardInterrupt
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record IR beam-break visits to a CSV file.")
+    parser.add_argument('--debounce', type=float, default=DEBOUNCE_SECONDS, help=f'Debounce window in seconds, 0 to disable (default: {DEBOUNCE_SECONDS})')
+    parser.add_argument('--format', choices=['csv', 'events', 'both'], default='csv', help='Write visits to the CSV file, the compact binary event log, or both (default: csv)')
+    parser.add_argument('--telemetry', metavar='HOST:PORT', default=None, help='Also stream visits and heartbeats to a telemetry collector')
+    parser.add_argument('--pin', type=int, default=BEAM_PIN, help=f'BCM pin of the IR beam (default: {BEAM_PIN})')
+    args = parser.parse_args()
+    BEAM_PIN = args.pin
+    csv_file = CSV_FILE if args.format in ('csv', 'both') else None
+    event_log = EventLogWriter(EVENT_LOG_FILE, ID, current_date) if args.format in ('events', 'both') else None
+
+    # Ensure the CSV file exists and has the correct header
+    if csv_file and not os.path.exists(CSV_FILE):
+        with open(CSV_FILE, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(CSV_COLUMNS)
+
+    # Setup logging
+    log_filename = f"{ID}_{current_date}_IR.log"
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s %(message)s',
+        handlers=[
+            logging.FileHandler(log_filename),
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
+
+    # Treat SIGTERM/SIGHUP (e.g. `pkill screen`) like Ctrl+C so queued rows are saved
+    signal.signal(signal.SIGTERM, request_shutdown)
+    signal.signal(signal.SIGHUP, request_shutdown)
+
+    GPIO.setmode(GPIO.BCM)
+    GPIO.setup(BEAM_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    publisher = TelemetryPublisher(args.telemetry, "ir", host=ID).start() if args.telemetry else None
+    visit_writer = VisitWriter(EdgeDebouncer(GPIO.input(BEAM_PIN), args.debounce), csv_file, event_log, publisher)
+    visit_writer.start()
+    GPIO.add_event_detect(BEAM_PIN, GPIO.BOTH, callback=break_beam_callback)
+    logging.info("System ready. Press Ctrl+C to exit.")
+    try:
+        while True:
+            time.sleep(1)  # Keep the program running
+    except KeyboardInterrupt:
+        logging.info("Program terminated by user.")
+    finally:
+        GPIO.remove_event_detect(BEAM_PIN)
+        visit_writer.stop()
+        if publisher:
+            publisher.stop()
+        GPIO.cleanup()
@@ -1,170 +1,144 @@
-import sys
-import time
-from datetime import datetime
-import subprocess
-import logging
-import os
-import RPi.GPIO as GPIO  # Only needed if you're using local GPIO testing
-
-def check_online(hostname):
-    """
-    Check if a device is online by pinging it.
-    """
-    try:
-        output = subprocess.check_output(
-            ['ping', '-c', '1', hostname],
-            stderr=subprocess.STDOUT,
-            universal_newlines=True
-        )
-        if "1 received" in output:
-            logging.info(f"{hostname} is online.")
-            return True
-        else:
-            logging.error(f"{hostname} is offline.")
-            return False
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Failed to ping {hostname}: {e.output}")
-        return False
-
-def check_cameras(pi_num):
-    """
-    Check if a USB camera is connected to a remote device.
-    """
-    hostname = f"pi{pi_num}.wifi.etsu.edu"  
-    username = f"pi{pi_num}"
-    try:
-        lsusb_cmd = f"ssh {username}@{hostname} lsusb"  
-        usb_output = subprocess.check_output(
-            lsusb_cmd, shell=True,
-            stderr=subprocess.STDOUT, 
-            universal_newlines=True
-        )
-        # Look for keywords that indicate a USB camera in the lsusb output.
-        has_camera = any(keyword in usb_output.lower() for keyword in ["camera", "pixel"])
-        if has_camera:
-            logging.info(f"{hostname} has a USB camera connected.")
-        else:
-            logging.warning(f"No USB camera detected on {hostname}.")
-        return has_camera
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Failed to check USB devices on {hostname}: {e.output}")
-        return False
-
-def check_ir_sensor(pi_num):
-    """
-    Check if the IR sensor is functioning on the remote device.
-    This function SSH's into the Pi and runs a remote test script that simulates
-    an IR beam break and verifies sensor output.
-    
-    It expects the remote test script to output a known success message, e.g. 'IR sensor OK'.
-    """
-    hostname = f"pi{pi_num}.wifi.etsu.edu"
-    username = f"pi{pi_num}"
-    # Adjust the path below to point to your remote test script.
-    test_command = "python3 /home/pi/test_ir_sensor.py"
-    
-    try:
-        result = subprocess.check_output(
-            ["ssh", f"{username}@{hostname}", test_command],
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-            timeout=10  # Prevent hanging indefinitely
-        )
-        if "IR sensor OK" in result:
-            logging.info(f"IR sensor on {hostname} is functioning correctly.")
-            return True
-        else:
-            logging.warning(f"IR sensor test on {hostname} did not return expected result.")
-            return False
-    except subprocess.CalledProcessError as e:
-        logging.error(f"IR sensor test failed on {hostname}: {e.output}")
-        return False
-    except Exception as e:
-        logging.error(f"Unexpected error during IR sensor test on {hostname}: {e}")
-        return False
-
-if __name__ == "__main__":
-    # Define hostnames for your Pis.
-    pi_hosts = [f"pi{i}.wifi.etsu.edu" for i in range(1, 21)]
-    current_date = datetime.now().strftime("%Y-%m-%d")
-    current_time = datetime.now().strftime("%H%M%S")
-
-    # Create directories if they don't exist.
-    local_directory = "/home/rpimain/Data"
-    if not os.path.exists(local_directory):
-        os.makedirs(local_directory)
-
-    log_directory = "rollCall_logFiles"
-    if not os.path.exists(log_directory):
-        os.makedirs(log_directory)
-    log_filename = f"{log_directory}/{current_date}_{current_time}_deviceTest.log"
-
-    # Set up logging to file and console.
-    logging.basicConfig(
-        level=logging.INFO, 
-        format='%(asctime)s %(levelname)s: %(message)s', 
-        handlers=[
-            logging.FileHandler(log_filename),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
-
-    # --- Rollcall Phase ---
-    unresponsive_pis = []
-    for host in pi_hosts:
-        try:
-            if not check_online(host):
-                logging.info(f"{host} is unresponsive.")
-                unresponsive_pis.append(host)
-        except Exception as e:
-            logging.error(f"An error occurred for {host}: {e}")
-            unresponsive_pis.append(host)
-
-    if unresponsive_pis:
-        print("The following Pis could not connect:")
-        for pi in unresponsive_pis:
-            print(pi)
-    else:
-        print("All Pis connected successfully.")
-    print("Roll call completed.\n")
-
-    # --- Camera Check Phase ---
-    noncamera_pis = []
-    for pi_num in range(1, 21):
-        try:
-            if not check_cameras(pi_num):
-                logging.info(f"pi{pi_num} has no camera.")
-                noncamera_pis.append(pi_num)
-        except Exception as e:
-            logging.error(f"An error occurred for pi{pi_num}: {e}")
-            noncamera_pis.append(pi_num)
-
-    if noncamera_pis:
-        print("The following Pis detected no camera:")
-        for pi in noncamera_pis:
-            print(f"pi{pi}")
-    else:
-        print("All Pis have cameras attached.")
-    print("Camera check completed.\n")
-
-    # --- IR Sensor Test Phase ---
-    noIR_pis = []
-    for pi_num in range(1, 21):
-        try:
-            if not check_ir_sensor(pi_num):
-                logging.info(f"pi{pi_num} has a non-functioning IR sensor.")
-                noIR_pis.append(pi_num)
-        except Exception as e:
-            logging.error(f"An error occurred during IR sensor test for pi{pi_num}: {e}")
-            noIR_pis.append(pi_num)
-
-    if noIR_pis:
-        print("The following Pis have non-functioning IR sensors:")
-        for pi in noIR_pis:
-            print(f"pi{pi}")
-    else:
-        print("All IR sensors are functioning correctly.")
-    print("IR sensor test completed.\n")
-
-    print("Device tests completed.")
-
+import sys
+import time
+import json
+import argparse
+from datetime import datetime
+import logging
+import os
+from fleetOrchestrator import FleetOrchestrator
+from fleetConfig import FLEET_FILE, load_fleet_config
+from clockAudit import MAX_CLOCK_OFFSET
+
+# Seconds each Pi gets for the whole probe (the IR test alone takes ~2 s)
+PROBE_TIMEOUT = 30.0
+HEALTH_PROBE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "healthProbe.py")
+
+# Warning thresholds
+MIN_FREE_GB = 2.0
+MAX_CPU_TEMPERATURE = 80.0
+
+fleet = FleetOrchestrator(timeout=PROBE_TIMEOUT)
+
+async def check_health(hostname, fleet_config, skip_ir=False):
+    """
+    Run healthProbe.py on a remote device in one SSH round-trip and return its checks.
+
+    The probe is piped over stdin, so nothing has to be copied to the Pi first.
+    `clock_offset` is the Pi's clock minus this machine's, measured when the
+    reply arrives (accurate to the one-way network delay).
+    """
+    pi = fleet_config[hostname]
+    with open(HEALTH_PROBE) as file:
+        probe = file.read()
+    command = "python3 -" + (" --skip-ir" if skip_ir else "")
+    if pi.ir_pin is not None:
+        command += f" --pin {pi.ir_pin}"
+    result = await fleet.ssh(pi.name, hostname, command, input=probe)
+    received = time.time()
+    health = json.loads(result.stdout)
+    health["clock_offset"] = round(health["time"] - received, 3)
+    return health
+
+# Function to list what is wrong with one Pi's health report
+def health_problems(health):
+    problems = []
+    if not health["camera"]["ok"]:
+        problems.append("no camera")
+    if health["ir_sensor"] is not None and not health["ir_sensor"]["ok"]:
+        problems.append("IR sensor failed")
+    if health["disk"]["free_gb"] < MIN_FREE_GB:
+        problems.append(f"low disk ({health['disk']['free_gb']} GB free)")
+    if health["cpu_temperature"] is not None and health["cpu_temperature"] > MAX_CPU_TEMPERATURE:
+        problems.append(f"hot CPU ({health['cpu_temperature']} C)")
+    if abs(health["clock_offset"]) > MAX_CLOCK_OFFSET:
+        problems.append(f"clock off by {health['clock_offset']:+.1f} s")
+    return problems
+
+# Function to print the Pis that failed one check
+def print_phase(pis, failed_message, passed_message, done_message):
+    if pis:
+        print(failed_message)
+        for pi in pis:
+            print(pi)
+    else:
+        print(passed_message)
+    print(done_message)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check camera, IR sensor, disk, temperature and clock on every Pi at once.")
+    parser.add_argument('--skip-ir', action='store_true', help='Skip the ~2 s IR beam test')
+    parser.add_argument('--timeout', type=float, default=PROBE_TIMEOUT, help=f'Seconds each Pi gets (default: {PROBE_TIMEOUT:g})')
+    parser.add_argument('--fleet-config', default=FLEET_FILE, help=f'Fleet file listing the Pis (default: {FLEET_FILE})')
+    args = parser.parse_args()
+    fleet.timeout = args.timeout
+
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    current_time = datetime.now().strftime("%H%M%S")
+
+    # Create directories if they don't exist.
+    local_directory = "/home/rpimain/Data"
+    if not os.path.exists(local_directory):
+        os.makedirs(local_directory)
+
+    log_directory = "rollCall_logFiles"
+    if not os.path.exists(log_directory):
+        os.makedirs(log_directory)
+    log_filename = f"{log_directory}/{current_date}_{current_time}_deviceTest.log"
+    report_filename = f"{log_directory}/{current_date}_{current_time}_deviceTest.json"
+
+    # Set up logging to file and console.
+    logging.basicConfig(
+        level=logging.INFO, 
+        format='%(asctime)s %(levelname)s: %(message)s', 
+        handlers=[
+            logging.FileHandler(log_filename),
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
+
+    # --- Probe Phase: every Pi at once, one SSH round-trip each ---
+    fleet_config = load_fleet_config(args.fleet_config)
+    start = time.monotonic()
+    results = fleet.run(fleet_config.hostnames, check_health, fleet_config, args.skip_ir)
+    fleet.close()
+    print(f"Probed {len(results)} Pis in {time.monotonic() - start:.1f} s.\n")
+
+    report = {}
+    unresponsive_pis, noncamera_pis, noIR_pis, warning_pis = [], [], [], []
+    for result in results:
+        pi_name = fleet_config[result.host].name
+        if result.status != "ok":
+            logging.error(f"{pi_name} is unresponsive ({result.status}): {result.error}")
+            unresponsive_pis.append(pi_name)
+            report[pi_name] = {"status": result.status, "error": result.error}
+            continue
+        health = result.value
+        report[pi_name] = dict(health, status="ok", problems=health_problems(health))
+        if not health["camera"]["ok"]:
+            logging.warning(f"No USB camera detected on {pi_name}.")
+            noncamera_pis.append(pi_name)
+        if health["ir_sensor"] is not None and not health["ir_sensor"]["ok"]:
+            logging.warning(f"IR sensor test on {pi_name} failed: {health['ir_sensor']}")
+            noIR_pis.append(pi_name)
+        other = [p for p in report[pi_name]["problems"] if p not in ("no camera", "IR sensor failed")]
+        if other:
+            logging.warning(f"{pi_name}: {', '.join(other)}")
+            warning_pis.append(pi_name)
+        logging.info(f"{pi_name}: disk {health['disk']['free_gb']} GB free, CPU {health['cpu_temperature']} C, "
+                     f"clock offset {health['clock_offset']:+.3f} s")
+
+    print_phase(unresponsive_pis, "The following Pis could not connect:",
+                "All Pis connected successfully.", "Roll call completed.\n")
+    print_phase(noncamera_pis, "The following Pis detected no camera:",
+                "All Pis have cameras attached.", "Camera check completed.\n")
+    if not args.skip_ir:
+        print_phase(noIR_pis, "The following Pis have non-functioning IR sensors:",
+                    "All IR sensors are functioning correctly.", "IR sensor test completed.\n")
+    print_phase(warning_pis, "The following Pis have disk, temperature or clock warnings:",
+                "Disk, temperature and clock checks passed.", "System check completed.\n")
+
+    with open(report_filename, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Health report saved to: {report_filename}")
+
+    print("Device tests completed.")
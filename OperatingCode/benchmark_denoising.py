@@ -0,0 +1,75 @@
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from dataDenoising import TIME_TOLERANCE, group_events, process_file
+
+
+# Original row-by-row grouping loop, kept here as the reference implementation
+def loop_event_groups(df, time_tolerance=TIME_TOLERANCE):
+    start_times = pd.to_datetime(df['start_time'], format='%H:%M:%S').dt.time
+    end_times = pd.to_datetime(df['end_time'], format='%H:%M:%S').dt.time
+    event_group = [0]
+    for i in range(1, len(df)):
+        time_gap = pd.Timestamp.combine(pd.Timestamp.today(), start_times.iloc[i]) - \
+                   pd.Timestamp.combine(pd.Timestamp.today(), end_times.iloc[i-1])
+        if time_gap <= time_tolerance:
+            event_group.append(event_group[-1])
+        else:
+            event_group.append(event_group[-1] + 1)
+    return np.array(event_group)
+
+# Vectorized grouping, as used by dataDenoising.process_file
+def vectorized_event_groups(df, time_tolerance=TIME_TOLERANCE):
+    start = pd.to_datetime(df['start_time'], format='%H:%M:%S')
+    end = pd.to_datetime(df['end_time'], format='%H:%M:%S')
+    return group_events(start, end, time_tolerance)
+
+# Build a synthetic, start-sorted IR data file with `rows` visits across a 12-hour day
+def make_synthetic_data(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    day_seconds = 12 * 3600
+    starts = np.sort(rng.integers(6 * 3600, 6 * 3600 + day_seconds, size=rows))
+    elapsed = rng.exponential(1.5, size=rows)
+    ends = np.minimum(starts + np.ceil(elapsed).astype(np.int64), 24 * 3600 - 1)
+    base = pd.Timestamp("1900-01-01")
+    return pd.DataFrame({
+        'hostname': "pi1",
+        'date': "2025-01-01",
+        'start_time': (base + pd.to_timedelta(starts, unit='s')).strftime('%H:%M:%S'),
+        'end_time': (base + pd.to_timedelta(ends, unit='s')).strftime('%H:%M:%S'),
+        'time_elapsed': elapsed,
+    })
+
+def timed(label, func, *args):
+    t0 = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<28}{elapsed:>10.3f} s")
+    return result, elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark loop vs vectorized event grouping.")
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Number of synthetic visits (default: 1,000,000)')
+    parser.add_argument('--skip-loop', action='store_true', help='Only time the vectorized path')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        csv_path = tmp / "2025-01-01_pi1_data.csv"
+        make_synthetic_data(args.rows).to_csv(csv_path, index=False)
+        df = pd.read_csv(csv_path)
+        print(f"Synthetic file: {args.rows} rows, {csv_path.stat().st_size / 1e6:.1f} MB")
+
+        vectorized, t_vec = timed("vectorized grouping", vectorized_event_groups, df)
+        if not args.skip_loop:
+            loop, t_loop = timed("loop grouping", loop_event_groups, df)
+            if not np.array_equal(loop, vectorized):
+                raise SystemExit("Mismatch between loop and vectorized event groups!")
+            print(f"Event groups match ({vectorized[-1] + 1} groups), speedup {t_loop / t_vec:.0f}x")
+
+        timed("process_file end-to-end", process_file, csv_path, tmp, tmp)
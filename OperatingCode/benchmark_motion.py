@@ -0,0 +1,53 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from motionDetection import DETECTORS, make_detector
+
+
+# Build a synthetic scene: a textured flower top with sensor noise, a small dark
+# "bee" crossing it during `bee_frames`, and a slow global lighting drift
+def make_frames(count, bee_frames, width=640, height=480, seed=0):
+    rng = np.random.default_rng(seed)
+    base = rng.integers(60, 200, size=(height, width, 3), dtype=np.uint8)
+    base = cv2.GaussianBlur(base, (15, 15), 0)
+    frames = []
+    for i in range(count):
+        drift = int(20 * np.sin(i / count * np.pi))  # Lighting change over the run
+        noise = rng.integers(-3, 4, size=base.shape, dtype=np.int16)
+        frame = np.clip(base.astype(np.int16) + drift + noise, 0, 255).astype(np.uint8)
+        if i in bee_frames:
+            x = width // 3 + 4 * (i - bee_frames.start)
+            cv2.circle(frame, (x, height // 2), 12, (20, 20, 20), thickness=-1)
+        frames.append(frame)
+    return frames
+
+# Time a detector over the frames and count how often it fires with and without the bee
+def run_detector(name, frames, bee_frames, **kwargs):
+    detector = make_detector(name, **kwargs)
+    detector(frames[0])  # Warm up (builds the ROI mask)
+    fired = np.zeros(len(frames), dtype=bool)
+    t0 = time.perf_counter()
+    for i, frame in enumerate(frames):
+        fired[i] = detector(frame)
+    per_frame = (time.perf_counter() - t0) / len(frames)
+    bee = np.zeros(len(frames), dtype=bool)
+    bee[bee_frames.start:bee_frames.stop] = True
+    return per_frame, fired[bee].sum(), fired[~bee].sum()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-frame cost and trigger counts of each motion detector.")
+    parser.add_argument('--frames', type=int, default=300, help='Number of synthetic 640x480 frames (default: 300)')
+    args = parser.parse_args()
+
+    bee_frames = range(args.frames // 2, args.frames // 2 + 30)
+    frames = make_frames(args.frames, bee_frames)
+    roi = dict(circles=[(0.5, 0.5, 0.3)])
+
+    print(f"{'detector':<22}{'us/frame':>10}{'bee hits':>10}{'false hits':>12}")
+    for name in DETECTORS:
+        for label, kwargs in ((name, {}), (f"{name} + ROI", roi)):
+            per_frame, hits, false_hits = run_detector(name, frames, bee_frames, **kwargs)
+            print(f"{label:<22}{per_frame * 1e6:>10.0f}{hits:>10}{false_hits:>12}")
@@ -0,0 +1,142 @@
+import argparse
+import getpass
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from sshPool import SSHConnectionPool
+
+SSHD = shutil.which("sshd") or "/usr/sbin/sshd"
+PORT = 2222
+
+
+# Start a throwaway sshd on localhost that only accepts a freshly generated key.
+# Each "Pi" is a different 127.0.0.x address, so every host gets its own
+# connection just like the real fleet.
+def start_sshd(workdir, port=PORT):
+    workdir = Path(workdir)
+    host_key = workdir / "host_key"
+    client_key = workdir / "client_key"
+    for key in (host_key, client_key):
+        subprocess.run(["ssh-keygen", "-q", "-t", "ed25519", "-N", "", "-f", str(key)], check=True)
+    authorized = workdir / "authorized_keys"
+    shutil.copy(f"{client_key}.pub", authorized)
+    os.chmod(authorized, 0o600)
+
+    config = workdir / "sshd_config"
+    config.write_text(
+        f"Port {port}\n"
+        "ListenAddress 0.0.0.0\n"
+        f"HostKey {host_key}\n"
+        f"AuthorizedKeysFile {authorized}\n"
+        f"PidFile {workdir / 'sshd.pid'}\n"
+        "PasswordAuthentication no\n"
+        "KbdInteractiveAuthentication no\n"
+        "UsePAM no\n"
+        "StrictModes no\n"
+        "MaxStartups 100\n"
+        "MaxSessions 100\n"
+    )
+    sshd = subprocess.Popen([SSHD, "-D", "-e", "-f", str(config)], stderr=subprocess.DEVNULL)
+    time.sleep(0.5)
+    if sshd.poll() is not None:
+        raise RuntimeError("sshd failed to start")
+    options = {
+        "Port": str(port),
+        "IdentityFile": str(client_key),
+        "IdentitiesOnly": "yes",
+        "StrictHostKeyChecking": "no",
+        "UserKnownHostsFile": "/dev/null",
+        "LogLevel": "ERROR",
+    }
+    return sshd, options
+
+# Build some fake scripts to deploy, sized like the real ones
+def make_scripts(workdir, count=3, size=8_000):
+    scripts = []
+    for i in range(count):
+        script = Path(workdir) / f"script{i}.py"
+        script.write_text("#" * size + "\n")
+        scripts.append(script)
+    return scripts
+
+# One Pi's share of a deploy, in the same order as parallel.py: check and copy
+# each script, start the commands, then fetch the data and clean up
+def deploy_host(run, upload, download, hostname, scripts, remote_dir, local_dir, commands):
+    for script in scripts:
+        remote_path = f"{remote_dir}/{hostname}_{script.name}"
+        exists = run(f"[ -f {remote_path} ] && echo Exists || echo Missing").strip() == "Exists"
+        if not exists:
+            upload([str(script)], remote_path)
+    for _ in range(commands):
+        run("true")
+    download([f"{remote_dir}/{hostname}_{scripts[0].name}"], str(Path(local_dir) / f"{hostname}.csv"))
+    run(f"rm -f {remote_dir}/{hostname}_*")
+
+# Current behaviour: a new ssh/scp process (and handshake) for every action
+def deploy_per_command(hostnames, username, options, scripts, remote_dir, local_dir, commands):
+    args = [arg for key, value in options.items() for arg in ("-o", f"{key}={value}")]
+
+    def one_host(hostname):
+        target = f"{username}@{hostname}"
+        deploy_host(
+            lambda command: subprocess.check_output(["ssh", *args, target, command], text=True),
+            lambda sources, destination: subprocess.check_call(["scp", *args, *sources, f"{target}:{destination}"]),
+            lambda sources, destination: subprocess.check_call(["scp", *args, *(f"{target}:{s}" for s in sources), destination]),
+            hostname, scripts, remote_dir, local_dir, commands)
+
+    with ThreadPoolExecutor() as executor:
+        list(executor.map(one_host, hostnames))
+
+# Pooled: one multiplexed session per host shared by every action
+def deploy_pooled(hostnames, username, options, scripts, remote_dir, local_dir, commands):
+    with SSHConnectionPool(options=options) as pool:
+        def one_host(hostname):
+            deploy_host(
+                lambda command: pool.check_output(username, hostname, command),
+                lambda sources, destination: pool.upload(username, hostname, sources, destination),
+                lambda sources, destination: pool.download(username, hostname, sources, destination),
+                hostname, scripts, remote_dir, local_dir, commands)
+
+        with ThreadPoolExecutor() as executor:
+            list(executor.map(one_host, hostnames))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time a full deploy with per-command ssh/scp against the pooled SSH sessions, using a local sshd.")
+    parser.add_argument('--hosts', type=int, default=20, help='Number of fake Pis (127.0.0.x addresses, default: 20)')
+    parser.add_argument('--commands', type=int, default=2, help='Remote commands started per Pi (default: 2)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each mode (default: 3)')
+    parser.add_argument('--port', type=int, default=PORT, help=f'Port for the local sshd (default: {PORT})')
+    args = parser.parse_args()
+
+    if not os.path.exists(SSHD):
+        raise SystemExit("sshd not found; install openssh-server to run this benchmark")
+
+    username = getpass.getuser()
+    hostnames = [f"127.0.0.{i}" for i in range(1, args.hosts + 1)]
+    workdir = tempfile.mkdtemp(prefix="rf-bench-")
+    sshd, options = start_sshd(workdir, args.port)
+    try:
+        scripts = make_scripts(workdir)
+        remote_dir = os.path.join(workdir, "remote")
+        local_dir = os.path.join(workdir, "local")
+        os.makedirs(remote_dir)
+        os.makedirs(local_dir)
+
+        print(f"Deploying {len(scripts)} scripts + {args.commands} commands to {args.hosts} hosts")
+        print(f"{'mode':<14}{'best (s)':>10}{'mean (s)':>10}")
+        for label, deploy in (("per-command", deploy_per_command), ("pooled", deploy_pooled)):
+            times = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                deploy(hostnames, username, options, scripts, remote_dir, local_dir, args.commands)
+                times.append(time.perf_counter() - t0)
+            print(f"{label:<14}{min(times):>10.2f}{sum(times) / len(times):>10.2f}")
+    finally:
+        sshd.terminate()
+        sshd.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
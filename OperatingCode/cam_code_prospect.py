@@ -1,9 +1,23 @@
 import cv2
+import argparse
 import datetime
 import os
-import numpy as np
+import signal  # For shutting down cleanly when the screen session is killed
 import socket  # For getting the Raspberry Pi's hostname
+import threading
 import time
+from cameraPipeline import CameraPipeline  # Capture/detect/write threads
+from motionDetection import make_detector  # Downscaled, ROI-based motion detectors
+from telemetry import TelemetryPublisher  # Live image events and heartbeats to the control node
+
+# Runs headless by default; --preview opens a live window for debugging
+parser = argparse.ArgumentParser(description="Save an image whenever motion is detected at the flower.")
+parser.add_argument('--preview', action='store_true', help='Show a live preview window (needs a display)')
+parser.add_argument('--preview-fps', type=float, default=5.0, help='Preview refresh rate (default: 5)')
+parser.add_argument('--telemetry', metavar='HOST:PORT', default=None, help='Also stream image events and heartbeats to a telemetry collector')
+parser.add_argument('--width', type=int, default=640, help='Frame width in pixels (default: 640)')
+parser.add_argument('--height', type=int, default=480, help='Frame height in pixels (default: 480)')
+args = parser.parse_args()
 
 # Get the Raspberry Pi's hostname
 pi_name = socket.gethostname()
@@ -21,50 +35,92 @@ output_folder = os.path.join(base_folder, f"{today_date}_{pi_name}")
 if not os.path.exists(output_folder):
     os.mkdir(output_folder)
 
-# Initialize video capture (device 0) and set resolution
+# Initialize video capture (device 0) and set resolution (parallel.py passes each Pi's camera settings from the fleet file)
 cap = cv2.VideoCapture(0)
-cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+cap.set(cv2.CAP_PROP_FRAME_WIDTH, args.width)
+cap.set(cv2.CAP_PROP_FRAME_HEIGHT, args.height)
+
+# Motion detection settings (see motionDetection.py). DETECTOR is "background"
+# (running average), "difference" (previous frame) or "mean" (the original
+# whole-frame brightness test). ROI_CIRCLES / ROI_RECTS restrict detection to
+# the flower top, as fractions of the frame, e.g. [(0.5, 0.5, 0.3)].
+DETECTOR = "background"
+ROI_CIRCLES = []
+ROI_RECTS = []
 
 # Motion detection parameters
-last_mean = 0  # Mean brightness of the previous frame
-detected_motion = False
 last_capture_time = time.time()  # Timestamp of last saved image
 cooldown_time = 2  # Time (in seconds) between saved images
+detected_motion = False
+preview_frame = None  # Latest frame, shown by the main thread
+publisher = None
 
-print("Start")
 
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        print("Frame not captured")
-        continue
+def save_image(save_path, frame, timestamp):
+    cv2.imwrite(save_path, frame)
+    print(f"Saved image: {save_path}")
+    if publisher:
+        publisher.publish("image", event_time=timestamp, path=save_path)
+
 
-    # Convert to grayscale for motion detection
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    current_mean = np.mean(gray)
-    diff = abs(current_mean - last_mean)
-    last_mean = current_mean
+# Runs on the detect thread; PNG encoding is handed to the writer thread, waiting
+# for room on its queue as Camera.py does for motion frames
+def handle_frame(pipeline, frame, timestamp, motion):
+    global detected_motion, last_capture_time, preview_frame
 
-    # Detect motion based on brightness change
-    if 0.7 < diff < 30.0:
+    # Detect motion in the region of interest
+    if motion:
         detected_motion = True
 
     # If motion is detected and cooldown has passed, save the image
-    if detected_motion and (time.time() - last_capture_time) > cooldown_time:
-        now = datetime.datetime.now()
+    if detected_motion and (timestamp - last_capture_time) > cooldown_time:
+        now = datetime.datetime.fromtimestamp(timestamp)
         time_stamp = now.strftime("%H-%M-%S")  # Only time in filename
         save_path = os.path.join(output_folder, f"{time_stamp}.png")
-        cv2.imwrite(save_path, frame)
-        print(f"Saved image: {save_path}")
-        last_capture_time = time.time()  # Update last capture time
+        pipeline.submit(save_image, save_path, frame, timestamp, wait=True)  # A motion image must not be dropped
+        last_capture_time = timestamp  # Update last capture time
         detected_motion = False  # Reset motion detection after saving
 
-    # Show live feed (optional)
-    cv2.imshow("Camera Feed", frame)
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
+    if args.preview:
+        preview_frame = frame
+
 
-cap.release()
-cv2.destroyAllWindows()
+# SIGTERM/SIGHUP (`pkill screen`, cleanup) and SIGINT (Ctrl+C) all end the run;
+# the main thread then stops the pipeline, which writes out queued images
+stop_requested = threading.Event()
+
+
+def request_stop(signum, frame):
+    print(f"Received signal {signum}, stopping")
+    stop_requested.set()
+
+
+for sig in (signal.SIGTERM, signal.SIGHUP, signal.SIGINT):
+    signal.signal(sig, request_stop)
+
+print("Start")
 
+# Capture, motion detection and image writing run on separate threads
+detector = make_detector(DETECTOR, circles=ROI_CIRCLES, rects=ROI_RECTS)
+pipeline = CameraPipeline(cap, detector, handle_frame)
+if args.telemetry:
+    publisher = TelemetryPublisher(args.telemetry, "camera", status=pipeline.stats).start()
+pipeline.start()
+try:
+    if args.preview:
+        # Show live feed at a throttled rate; GUI calls stay on the main thread
+        while not stop_requested.wait(1.0 / args.preview_fps):
+            if preview_frame is not None:
+                cv2.imshow("Camera Feed", preview_frame)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+    else:
+        stop_requested.wait()
+finally:
+    pipeline.stop()  # Writes out images that are still queued
+    cap.release()
+    if args.preview:
+        cv2.destroyAllWindows()
+    pipeline.report()
+    if publisher:
+        publisher.stop()
@@ -0,0 +1,167 @@
+import queue
+import threading
+import time
+
+# Queue sizes: a short frame queue keeps detection on the newest frames, and a
+# longer write queue absorbs bursts of encoding work
+FRAME_QUEUE_SIZE = 4
+WRITE_QUEUE_SIZE = 64
+REPORT_INTERVAL = 60.0  # Seconds between pipeline statistics printouts
+
+# Marks the end of a stream on a queue
+_STOP = object()
+
+
+class DroppingQueue:
+    """
+    Bounded queue that never blocks the producer.
+
+    When the queue is full, `put` either discards the oldest item to make room
+    (`drop="oldest"`, for live frames) or discards the new item
+    (`drop="newest"`, for work that must stay in order). Discarded items are
+    counted in `dropped`.
+    """
+
+    def __init__(self, maxsize, drop="oldest"):
+        self.queue = queue.Queue(maxsize)
+        self.drop = drop
+        self.dropped = 0
+
+    def put(self, item):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return True
+            except queue.Full:
+                if self.drop == "newest":
+                    self.dropped += 1
+                    return False
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def put_wait(self, item):
+        # For items that must not be dropped: wait for room instead
+        self.queue.put(item)
+        return True
+
+    def put_stop(self):
+        # The end-of-stream marker must not be dropped: a live queue drops its oldest
+        # item to make room (so a stalled consumer cannot hang shutdown), others wait
+        if self.drop == "oldest":
+            self.put(_STOP)
+        else:
+            self.put_wait(_STOP)
+
+    def get(self):
+        return self.queue.get()
+
+
+class CameraPipeline:
+    """
+    Run capture, motion detection and encoding/writing on separate threads.
+
+    - The capture thread only calls `cap.read()` and queues frames; if detection
+      falls behind, the oldest queued frames are dropped.
+    - The detect thread runs `detector(frame)` and passes each frame to
+      `handler(pipeline, frame, timestamp, motion)`, which decides what to save
+      and queues that work with `submit`. A frame that raises is counted in
+      `errors` and skipped.
+    - The writer thread runs the submitted work (PNG/clip encoding and disk
+      writes) in order; if it falls behind, new work is dropped, unless it
+      was submitted with `wait=True` (the detect thread then waits for room).
+
+    `stop` ends capture and then drains both queues, so everything already
+    submitted is written before it returns.
+    """
+
+    def __init__(self, cap, detector, handler, frame_queue_size=FRAME_QUEUE_SIZE,
+                 write_queue_size=WRITE_QUEUE_SIZE, report_interval=REPORT_INTERVAL):
+        self.cap = cap
+        self.detector = detector
+        self.handler = handler
+        self.frames = DroppingQueue(frame_queue_size, drop="oldest")
+        self.writes = DroppingQueue(write_queue_size, drop="newest")
+        self.report_interval = report_interval
+        self.running = threading.Event()
+        self.counts = {"captured": 0, "failed_reads": 0, "processed": 0, "motion": 0, "written": 0, "write_errors": 0,
+                       "errors": 0}
+        self.threads = [
+            threading.Thread(target=self._capture, name="capture", daemon=True),
+            threading.Thread(target=self._detect, name="detect", daemon=True),
+            threading.Thread(target=self._write, name="writer", daemon=True),
+        ]
+
+    def start(self):
+        self.running.set()
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.running.clear()
+        for thread in self.threads:
+            thread.join()
+
+    def submit(self, func, *args, wait=False):
+        if wait:
+            return self.writes.put_wait((func, args))
+        return self.writes.put((func, args))
+
+    def stats(self):
+        return dict(self.counts, dropped_frames=self.frames.dropped, dropped_writes=self.writes.dropped)
+
+    def report(self):
+        print("Pipeline: " + ", ".join(f"{name}={count}" for name, count in self.stats().items()))
+
+    def _capture(self):
+        try:
+            while self.running.is_set():
+                ret, frame = self.cap.read()
+                if not ret:
+                    self.counts["failed_reads"] += 1
+                    print("Frame not captured")
+                    continue
+                self.counts["captured"] += 1
+                self.frames.put((time.time(), frame))
+        finally:
+            self.frames.put_stop()
+
+    def _detect(self):
+        next_report = time.monotonic() + self.report_interval
+        try:
+            while True:
+                item = self.frames.get()
+                if item is _STOP:
+                    break
+                timestamp, frame = item
+                try:
+                    motion = self.detector(frame)
+                    self.counts["processed"] += 1
+                    self.counts["motion"] += bool(motion)
+                    self.handler(self, frame, timestamp, motion)
+                except Exception as e:
+                    # One bad frame (e.g. a size change or a failed cv2 call) must not end detection for the night
+                    self.counts["errors"] += 1
+                    if self.counts["errors"] == 1 or self.counts["errors"] % 100 == 0:
+                        print(f"Error processing frame ({self.counts['errors']} so far): {e}")
+
+                if self.report_interval and time.monotonic() >= next_report:
+                    self.report()
+                    next_report += self.report_interval
+        finally:
+            self.writes.put_stop()
+
+    def _write(self):
+        while True:
+            item = self.writes.get()
+            if item is _STOP:
+                break
+            func, args = item
+            try:
+                func(*args)
+                self.counts["written"] += 1
+            except Exception as e:
+                self.counts["write_errors"] += 1
+                print(f"Error writing output: {e}")
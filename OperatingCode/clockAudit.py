@@ -0,0 +1,135 @@
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+
+from fleetOrchestrator import FleetOrchestrator, report_results
+from fleetConfig import FLEET_FILE, load_fleet_config
+
+CLOCK_SAMPLES = 5         # Round trips per Pi; the one with the shortest round trip is kept
+CLOCK_INTERVAL = 30 * 60  # Seconds between audits during a run
+MAX_CLOCK_OFFSET = 2.0    # Seconds; larger offsets are flagged
+OFFSETS_FILE = "clock_offsets.csv"
+OFFSET_COLUMNS = ["measured_at", "hostname", "offset", "round_trip"]
+
+
+class ClockAuditor:
+    """
+    Measure every Pi's clock against the control node's and log the offsets.
+
+    Each Pi's clock is read `samples` times over its pooled SSH session
+    (`date +%s.%N`, a few milliseconds per round trip once the session is
+    up). The sample with the shortest round trip is kept, and the offset is
+    the Pi's time minus the midpoint of that round trip, so it is accurate to
+    about half the round trip. All Pis are sampled at once.
+
+    Offsets are positive when the Pi's clock is ahead. Each audit appends one
+    row per Pi to `path` (`measured_at`, `hostname`, `offset`, `round_trip`).
+    `measured_at` is the Pi's own reading, so the offsets can be looked up by
+    the Pi-clock times the recorders write. Both recorders stamp with the
+    Pi's current wall clock (IR_Recording re-anchors its monotonic edge times
+    before every batch), so a step in the Pi's clock shows up here too. dataDenoising and visitIndex read
+    these rows back to correct the visit and media times.
+    """
+
+    def __init__(self, fleet, path, samples=CLOCK_SAMPLES):
+        self.fleet = fleet
+        self.path = path
+        self.samples = samples
+
+    async def measure(self, host):
+        username = host.split('.')[0]
+        await self.fleet.pool.connect_async(username, host)
+        best = None
+        for _ in range(self.samples):
+            sent, start = time.time(), time.monotonic()
+            result = await self.fleet.ssh(username, host, "date +%s.%N")
+            round_trip = time.monotonic() - start
+            if best is None or round_trip < best[1]:
+                pi_time = float(result.stdout)
+                best = (pi_time - (sent + round_trip / 2), round_trip, pi_time)
+        offset, round_trip, measured_at = best
+        return {"offset": offset, "round_trip": round_trip, "measured_at": measured_at}
+
+    def record(self, results):
+        # One row per Pi that answered; the file is created with a header on first use
+        rows = [[f"{result.value['measured_at']:.3f}", result.host.split('.')[0], f"{result.value['offset']:.4f}",
+                 f"{result.value['round_trip']:.4f}"] for result in results if result.status == "ok"]
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        new_file = not os.path.exists(self.path)
+        with open(self.path, "a", newline="") as file:
+            writer = csv.writer(file)
+            if new_file:
+                writer.writerow(OFFSET_COLUMNS)
+            writer.writerows(rows)
+
+    async def audit_async(self, hosts):
+        results = await self.fleet.run_all(hosts, self.measure)
+        self.record(results)
+        return results
+
+    def audit(self, hosts):
+        results = self.fleet.run(hosts, self.measure)
+        self.record(results)
+        return results
+
+# Function to print an audit: failures, then any Pi whose clock is off by more than MAX_CLOCK_OFFSET
+def report_offsets(results, max_offset=MAX_CLOCK_OFFSET, verbose=False):
+    report_results("Clock audit", results)
+    measured = [result for result in results if result.status == "ok"]
+    if not measured:
+        return
+    offsets = [result.value["offset"] for result in measured]
+    print(f"  clock offsets {min(offsets):+.3f} to {max(offsets):+.3f} s")
+    for result in measured:
+        offset, round_trip = result.value["offset"], result.value["round_trip"]
+        if verbose or abs(offset) > max_offset:
+            flag = f"  <-- off by more than {max_offset:g} s" if abs(offset) > max_offset else ""
+            print(f"  {result.host}: {offset:+.3f} s (round trip {round_trip * 1000:.0f} ms){flag}")
+
+# Function to load an offsets file as {hostname: (measured_at array, offset array)}, sorted by time
+def read_offsets(path):
+    measurements = {}
+    with open(path, newline="") as file:
+        for row in csv.DictReader(file):
+            measurements.setdefault(row["hostname"], []).append((float(row["measured_at"]), float(row["offset"])))
+    offsets = {}
+    for hostname, samples in measurements.items():
+        samples.sort()
+        offsets[hostname] = (np.array([t for t, _ in samples]), np.array([offset for _, offset in samples]))
+    return offsets
+
+# Function to get a Pi's clock offset at the given (Pi clock) epoch times
+def offset_at(offsets, hostname, epochs):
+    """
+    Interpolate linearly between the audits, so steady drift is followed;
+    times before the first or after the last audit use the nearest one.
+    Returns None when there are no measurements for `hostname`.
+    """
+    if hostname not in offsets:
+        return None
+    measured_at, offset = offsets[hostname]
+    return np.interp(np.asarray(epochs, dtype=float), measured_at, offset)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure every Pi's clock offset and append it to an offsets file.")
+    parser.add_argument('offsets_file', nargs='?', default=os.path.join("/home/rpimain/Data", OFFSETS_FILE), help=f'Where offsets are appended (default: /home/rpimain/Data/{OFFSETS_FILE})')
+    parser.add_argument('--samples', type=int, default=CLOCK_SAMPLES, help=f'Round trips per Pi (default: {CLOCK_SAMPLES})')
+    parser.add_argument('--interval', type=float, default=None, help='Repeat every this many seconds (default: audit once)')
+    parser.add_argument('--verbose', action='store_true', help='Print every Pi, not only those off by more than the limit')
+    parser.add_argument('--fleet-config', default=FLEET_FILE, help=f'Fleet file listing the Pis (default: {FLEET_FILE})')
+    args = parser.parse_args()
+
+    pi_hosts = load_fleet_config(args.fleet_config).hostnames
+    with FleetOrchestrator() as fleet:
+        auditor = ClockAuditor(fleet, args.offsets_file, args.samples)
+        while True:
+            report_offsets(auditor.audit(pi_hosts), verbose=args.verbose)
+            if args.interval is None:
+                break
+            time.sleep(args.interval)
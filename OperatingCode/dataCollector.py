@@ -0,0 +1,200 @@
+import argparse
+import logging
+import os
+import shlex
+import time
+from datetime import datetime
+
+from fleetOrchestrator import FleetOrchestrator, report_results
+from imageHarvest import HARVEST_CONCURRENCY, ImageHarvester, report_throughput
+from fleetConfig import FLEET_FILE, load_fleet_config
+
+# Remote locations, relative to the Pi user's home directory (where the scripts run)
+DATA_DIRECTORIES = [".", "Data"]
+DATA_PATTERNS = ["????-??-??*.csv", "*.evlog"]
+MEDIA_DIRECTORY = "BeeImages"
+SETTLE_SECONDS = 30  # Media files younger than this may still be being written
+COLLECT_INTERVAL = 15 * 60
+COLLECT_TIMEOUT = 30 * 60  # Per Pi per pass; image harvests wait for a slot and may be rate-capped
+
+
+# Function to build the one remote command that lists data and media files
+def listing_command(data_directories=DATA_DIRECTORIES, media_directory=MEDIA_DIRECTORY):
+    names = " -o ".join(f"-name {shlex.quote(pattern)}" for pattern in DATA_PATTERNS)
+    directories = " ".join(shlex.quote(directory) for directory in data_directories)
+    return (f"date +%s; "
+            f"find {directories} -maxdepth 1 -type f \\( {names} \\) -printf 'D %s %T@ %p\\n' 2>/dev/null; "
+            f"find {shlex.quote(media_directory)} -type f -printf 'M %s %T@ %p\\n' 2>/dev/null; true")
+
+# Function to parse the listing into the Pi's clock and {path: (size, mtime)} per kind
+def parse_listing(output):
+    lines = output.splitlines()
+    remote_now = float(lines[0])
+    files = {"D": {}, "M": {}}
+    for line in lines[1:]:
+        kind, size, mtime, path = line.split(" ", 3)
+        files[kind][os.path.normpath(path)] = (int(size), float(mtime))
+    return remote_now, files
+
+
+class DataCollector:
+    """
+    Copy what is new on each Pi since the last pass, so data reaches the
+    control node throughout a run instead of in one scp at the end.
+
+    - Data files (visit CSVs and event logs) only ever grow, so the local
+      copy's size is the offset to resume from: each pass fetches just the
+      appended bytes of every file, in one SSH call per Pi. No state file is
+      needed and an interrupted pass simply resumes on the next one. A remote
+      file that became shorter than the local copy was rewritten and is
+      fetched again from the start.
+    - Media files are fetched once they have not changed for `settle_seconds`
+      and are missing locally (or differ in size), streamed by `harvester`
+      (an ImageHarvester) as one compressed tar archive.
+
+    Only files modified since `since` (epoch seconds on the control node's
+    clock, or None for every file) are collected, whatever their date, so a
+    run that crosses midnight keeps all its data while files left from
+    earlier runs stay where they are. `since` is moved onto each Pi's clock
+    with the Pi time read in the listing. Data files from the home directory
+    are saved flat in `local_directory` (their names already include date and
+    host), and those from other remote directories in a subdirectory of the
+    same name, so equal names never share a local file; media keep their
+    BeeImages/{date}_{host} layout. A visit CSV is only copied up to its last
+    complete row; the rest waits for the next pass.
+    """
+
+    def __init__(self, fleet, local_directory, settle_seconds=SETTLE_SECONDS, media=True, harvester=None,
+                 timeout=COLLECT_TIMEOUT, data_directories=DATA_DIRECTORIES, since=None):
+        self.fleet = fleet
+        self.since = since
+        self.data_directories = data_directories
+        self.timeout = timeout
+        self.local_directory = local_directory
+        self.settle_seconds = settle_seconds
+        self.media = media
+        self.harvester = harvester if harvester is not None else ImageHarvester(fleet)
+
+    async def collect_host(self, host):
+        """Run one pass for `host`; returns counts of files and bytes fetched."""
+        username = host.split('.')[0]
+        listing = await self.fleet.ssh(username, host, listing_command(self.data_directories))
+        remote_now, files = parse_listing(listing.stdout)
+        if self.since is not None:
+            since = self.since + (remote_now - time.time())
+            files = {kind: {path: stat for path, stat in kind_files.items() if stat[1] >= since}
+                     for kind, kind_files in files.items()}
+        stats = {"data_files": 0, "data_bytes": 0, "media_files": 0, "media_bytes": 0, "media": None}
+
+        ranges = self.pending_ranges(host, files["D"])
+        if ranges:
+            stats["data_files"] = len(ranges)
+            stats["data_bytes"] = await self.fetch_ranges(username, host, ranges)
+
+        if self.media:
+            pending = self.pending_media(files["M"], remote_now)
+            if pending:
+                stats["media"] = await self.harvester.harvest(username, host, pending, self.local_directory)
+                stats["media_files"] = len(pending)
+                stats["media_bytes"] = stats["media"]["bytes"]
+        return stats
+
+    def pending_ranges(self, host, data_files):
+        # (remote path, local path, offset, length) for every file that grew
+        ranges = []
+        for path, (size, _) in sorted(data_files.items()):
+            # Files from the home directory are saved flat; files from other remote
+            # directories keep that subdirectory, so equal names never share a local file
+            local_path = os.path.join(self.local_directory, path)
+            offset = os.path.getsize(local_path) if os.path.exists(local_path) else 0
+            if size < offset:
+                logging.warning(f"{path} on {host} shrank from {offset} to {size} bytes; fetching it again.")
+                offset = 0
+            if size > offset:
+                ranges.append((path, local_path, offset, size - offset))
+        return ranges
+
+    async def fetch_ranges(self, username, host, ranges):
+        # Exact byte counts from the listing, so bytes appended meanwhile wait for the next pass
+        command = "; ".join(f"tail -c +{offset + 1} {shlex.quote(path)} | head -c {length}"
+                            for path, _, offset, length in ranges)
+        result = await self.fleet.ssh(username, host, command, decode=False)
+        data = result.stdout
+        expected = sum(length for *_, length in ranges)
+        if len(data) != expected:
+            raise RuntimeError(f"expected {expected} new bytes from {host}, received {len(data)}")
+
+        position = 0
+        for _, local_path, offset, length in ranges:
+            chunk = data[position:position + length]
+            if local_path.endswith(".csv"):
+                # A row being written is left for the next pass, so readers never see half a record
+                chunk = chunk[:chunk.rfind(b"\n") + 1]
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            with open(local_path, "r+b" if offset else "wb") as file:
+                file.seek(offset)
+                file.write(chunk)
+                file.truncate()
+            position += length
+        return expected
+
+    def pending_media(self, media_files, remote_now):
+        pending = []
+        for path, (size, mtime) in sorted(media_files.items()):
+            if remote_now - mtime < self.settle_seconds:
+                continue
+            local_path = os.path.join(self.local_directory, path)
+            if not os.path.exists(local_path) or os.path.getsize(local_path) != size:
+                pending.append(path)
+        return pending
+
+    async def collect_async(self, hosts):
+        return await self.fleet.run_all(hosts, self.collect_host, timeout=self.timeout)
+
+    def collect(self, hosts):
+        return self.fleet.run(hosts, self.collect_host, timeout=self.timeout)
+
+# Function to print what one pass fetched
+def report_collection(results):
+    report_results("Collect", results)
+    totals = {}
+    for result in results:
+        if result.status == "ok":
+            for name, count in result.value.items():
+                if name != "media":
+                    totals[name] = totals.get(name, 0) + count
+            if result.value["media"]:
+                report_throughput(result.host, result.value["media"])
+    if totals:
+        print(f"  fetched {totals['data_bytes'] / 1e6:.2f} MB of data from {totals['data_files']} files, "
+              f"{totals['media_files']} media files ({totals['media_bytes'] / 1e6:.1f} MB transferred)")
+
+# Function to turn a KB/s command-line cap into bytes/s (None = no cap)
+def kb_per_second(limit):
+    return limit * 1000 if limit else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch new visit data and images from the Pis, resuming where the last pass stopped.")
+    parser.add_argument('local_directory', help='Where collected files are saved')
+    parser.add_argument('--interval', type=float, default=None, help='Repeat every this many seconds (default: run one pass)')
+    parser.add_argument('--since', type=datetime.fromisoformat, default=None, help='Only collect files modified since this time, e.g. "2026-06-01 08:00" (default: all files)')
+    parser.add_argument('--no-media', action='store_true', help='Only collect data files, not BeeImages')
+    parser.add_argument('--harvest-concurrency', type=int, default=HARVEST_CONCURRENCY, help=f'Pis streaming images at once (default: {HARVEST_CONCURRENCY})')
+    parser.add_argument('--bwlimit', type=float, default=None, help='Image bandwidth cap per Pi in KB/s (default: none)')
+    parser.add_argument('--total-bwlimit', type=float, default=None, help='Image bandwidth cap for all Pis together in KB/s (default: none)')
+    parser.add_argument('--fleet-config', default=FLEET_FILE, help=f'Fleet file listing the Pis (default: {FLEET_FILE})')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+    pi_hosts = load_fleet_config(args.fleet_config).hostnames
+    with FleetOrchestrator() as fleet:
+        harvester = ImageHarvester(fleet, args.harvest_concurrency, kb_per_second(args.bwlimit),
+                                   kb_per_second(args.total_bwlimit))
+        collector = DataCollector(fleet, args.local_directory, media=not args.no_media, harvester=harvester,
+                                  since=args.since.timestamp() if args.since else None)
+        while True:
+            report_collection(collector.collect(pi_hosts))
+            if args.interval is None:
+                break
+            time.sleep(args.interval)
@@ -1,9 +1,30 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import numpy as np
 import pandas as pd
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import re
+import visitDataset
+import eventLog
+from fleetConfig import FLEET_FILE, UNASSIGNED, load_fleet_config
+from clockAudit import OFFSETS_FILE, offset_at, read_offsets
 
 # Hard-coded output directory
-OUTPUT_DIRECTORY = # Replace this with the full path to your desired output directory
+OUTPUT_DIRECTORY = Path("/home/rpimain/DenoisedData")  # Replace this with the full path to your desired output directory
+
+# Visits separated by no more than this gap are merged into one event group
+TIME_TOLERANCE = pd.Timedelta(seconds=2)
+
+# Manifest of already-processed inputs, kept in the output directory
+MANIFEST_NAME = "denoise_manifest.json"
+
+# IR_Recording --format both writes the same visits to both of these files
+CSV_DATA_SUFFIX = "_data.csv"
+EVENT_LOG_DATA_SUFFIX = f"_events{eventLog.EVENT_LOG_SUFFIX}"
 
 
 # Function to extract the date from a filename
@@ -15,65 +36,522 @@ def extract_date_from_filename(filename):
         return date_str.replace("-", "")  # Remove hyphens if present (to normalize format)
     return "unknown_date"
 
-# Function to process a single file
-def process_file(filepath, grouped_directory, summed_directory):
+# Function to assign event groups to visits already sorted by start time
+def group_events(start_times, end_times, time_tolerance=TIME_TOLERANCE):
+    """
+    Return an event_group number for each visit.
+
+    A visit joins the previous group when the gap between its start and the
+    previous visit's end is within `time_tolerance`; otherwise it opens a new
+    group. Both inputs are datetime64 arrays/Series in sorted visit order.
+    """
+    start = np.asarray(start_times, dtype='datetime64[ns]')
+    end = np.asarray(end_times, dtype='datetime64[ns]')
+    if len(start) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # Gap between each visit and the one before it; the first visit always opens group 0
+    gaps = start[1:] - end[:-1]
+    new_group = np.empty(len(start), dtype=bool)
+    new_group[0] = False
+    new_group[1:] = gaps > time_tolerance.to_timedelta64()
+    return np.cumsum(new_group)
+
+# Raised by the streaming reader when a file's rows are not in start_time order
+class UnsortedInputError(ValueError):
+    pass
+
+# Function to check whether a file has the high-resolution epoch columns
+def has_epochs(df):
+    return 'start_epoch' in df.columns and 'end_epoch' in df.columns
+
+# Function to get visit start/end times as datetime64 Series
+def parse_times(df):
+    # Newer recordings carry Unix times with sub-second precision; use them as-is
+    if has_epochs(df):
+        start = pd.to_datetime(df['start_epoch'], unit='s')
+        end = pd.to_datetime(df['end_epoch'], unit='s')
+        return start, end
+
+    # Older recordings only have whole-second HH:MM:SS strings
+    start = pd.to_datetime(df['start_time'], format='%H:%M:%S')
+    end = pd.to_datetime(df['end_time'], format='%H:%M:%S')
+    return start, end
+
+# Function to move visit times onto the control node's clock using the audited offsets
+def correct_clock(df, offsets):
+    """
+    Return a copy of `df` with each Pi's measured clock offset removed.
+
+    The offset at each visit's start is interpolated from the clockAudit
+    measurements for its hostname, subtracted from `start_epoch`/`end_epoch`,
+    and kept in a `clock_offset` column. `date`, `start_time` and `end_time`
+    are rewritten from the corrected epochs in the same local time zone the
+    Pi used (recovered from the recorded clock time), so every output and
+    the dataset agree. Pis with no measurements keep their times, with a
+    missing `clock_offset`. Needs the epoch columns.
+    """
+    df = df.copy()
+    start_epoch = df['start_epoch'].to_numpy(dtype=float)
+    offset = np.full(len(df), np.nan)
+    for hostname, rows in df.groupby('hostname').indices.items():
+        measured = offset_at(offsets, hostname, start_epoch[rows])
+        if measured is not None:
+            offset[rows] = measured
+    corrected = ~np.isnan(offset)
+    df['clock_offset'] = offset
+    if not corrected.any():
+        return df
+
+    # The Pi's UTC offset is whatever separates its recorded clock time from its epoch
+    rows = df.loc[corrected]
+    recorded = pd.to_datetime(rows['date'].astype(str) + ' ' + rows['start_time'].astype(str))
+    utc_offset = (recorded - pd.to_datetime(rows['start_epoch'], unit='s')).dt.round('15min')
+    start = rows['start_epoch'] - offset[corrected]
+    end = rows['end_epoch'] - offset[corrected]
+    start_local = pd.to_datetime(start, unit='s') + utc_offset
+    end_local = pd.to_datetime(end, unit='s') + utc_offset
+    df.loc[corrected, 'start_epoch'] = start
+    df.loc[corrected, 'end_epoch'] = end
+    df.loc[corrected, 'date'] = start_local.dt.strftime("%Y-%m-%d")
+    df.loc[corrected, 'start_time'] = start_local.dt.strftime("%H:%M:%S")
+    df.loc[corrected, 'end_time'] = end_local.dt.strftime("%H:%M:%S")
+    return df
+
+# Function to fingerprint the clock offsets, so outputs are redone when new audits arrive
+def offsets_digest(offsets):
+    if offsets is None:
+        return None
+    digest = hashlib.sha256()
+    for hostname in sorted(offsets):
+        digest.update(hostname.encode())
+        for values in offsets[hostname]:
+            digest.update(values.tobytes())
+    return digest.hexdigest()
+
+# Function to add event groups to a frame already in start_time order
+def label_events(df, start, end, first_group=0):
+    df = df.copy()
+    df['event_group'] = group_events(start, end) + first_group
+
+    # Write parsed times back out as datetime.time objects (HH:MM:SS in the CSV);
+    # files with epoch columns keep the clock times the Pi recorded
+    if not has_epochs(df):
+        df['start_time'] = start.dt.time
+        df['end_time'] = end.dt.time
+    return df
+
+# Function to add each visit's treatment from the fleet file as a categorical column
+def add_treatment(df, treatments):
+    """
+    Return a copy of `df` with a `treatment` column after `hostname`.
+
+    The treatment is looked up once per distinct hostname, not once per row,
+    and stored as a categorical over every treatment in the fleet file, so
+    each row holds a small code and every file gets the same categories.
+    Hostnames missing from the fleet file get UNASSIGNED.
+    """
+    dtype = pd.CategoricalDtype(sorted(set(treatments.values()) | {UNASSIGNED}))
+    df = df.drop(columns='treatment', errors='ignore')
+    hosts = df['hostname'].astype('category')
+    per_host = dtype.categories.get_indexer([treatments.get(host, UNASSIGNED) for host in hosts.cat.categories])
+    # Code -1 (no hostname) picks the appended -1, i.e. a missing treatment
+    codes = np.append(per_host, -1)[hosts.cat.codes.to_numpy()]
+    df.insert(df.columns.get_loc('hostname') + 1, 'treatment', pd.Categorical.from_codes(codes, dtype=dtype))
+    return df
+
+# Function to fingerprint the treatment mapping, so outputs are redone when it changes
+def treatment_digest(treatments):
+    if treatments is None:
+        return None
+    return hashlib.sha256(json.dumps(treatments, sort_keys=True).encode()).hexdigest()
+
+# Function to sum the visits of each event group into one row
+def summarize_events(df):
+    columns = dict(hostname=('hostname', 'first'))
+    if 'treatment' in df.columns:
+        columns.update(treatment=('treatment', 'first'))
+    columns.update(
+        date=('date', 'first'),
+        start_time=('start_time', 'first'),
+        end_time=('end_time', 'last'),
+        time_elapsed=('time_elapsed', 'sum')
+    )
+    if has_epochs(df):
+        columns.update(start_epoch=('start_epoch', 'first'), end_epoch=('end_epoch', 'last'))
+    return df.groupby('event_group').agg(**columns).reset_index(drop=True)
+
+# Function to read a file in chunks and yield its visits grouped into events
+def stream_events(filepath, chunksize, offsets=None):
+    """
+    Yield frames of grouped visits for closed event groups, in file order.
+
+    The rows of the last (still open) event group in each chunk are carried over
+    and re-grouped with the next chunk, so events that straddle a chunk boundary
+    come out exactly as they would from the whole file. Memory stays bounded by
+    the chunk size plus the longest single event. Rows must already be in
+    start_time order (as IR_Recording writes them); otherwise
+    UnsortedInputError is raised. With `offsets`, each chunk is clock
+    corrected as it is read.
+    """
+    carry = None
+    first_group = 0
+    for chunk in pd.read_csv(filepath, chunksize=chunksize):
+        if chunk.empty:
+            continue
+        if offsets is not None:
+            chunk = correct_clock(chunk, offsets)
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        start, end = parse_times(chunk)
+        if not start.is_monotonic_increasing:
+            raise UnsortedInputError(f"{filepath} is not sorted by start_time")
+
+        labelled = label_events(chunk, start, end, first_group)
+        open_group = labelled['event_group'].iloc[-1]
+        is_open = (labelled['event_group'] == open_group).to_numpy()
+        if not is_open.all():
+            yield labelled[~is_open]
+        carry = chunk[is_open]
+        first_group = open_group
+
+    # An empty file still yields one (empty) frame so the outputs get headers
+    if carry is None:
+        carry = pd.read_csv(filepath, nrows=0)
+        if offsets is not None:
+            carry = correct_clock(carry, offsets)
+    start, end = parse_times(carry)
+    yield label_events(carry, start, end, first_group)
+
+# Function to process a file in bounded memory with stream_events
+def process_file_streaming(filepath, grouped_filepath, summed_filepath, dataset_directory=None, chunksize=100_000,
+                           treatments=None, offsets=None):
+    dataset_writers = {}
+    with open(grouped_filepath, 'w', newline='') as grouped_file, \
+            open(summed_filepath, 'w', newline='') as summed_file:
+        try:
+            for n, grouped in enumerate(stream_events(filepath, chunksize, offsets)):
+                if treatments is not None:
+                    grouped = add_treatment(grouped, treatments)
+                summed = summarize_events(grouped)
+                grouped.to_csv(grouped_file, index=False, header=(n == 0))
+                summed.to_csv(summed_file, index=False, header=(n == 0))
+
+                if dataset_directory is not None and len(grouped):
+                    if not dataset_writers:
+                        hostname = grouped['hostname'].iloc[0]
+                        dataset_writers = {
+                            table: visitDataset.PartitionWriter(dataset_directory, table, hostname, filepath.stem)
+                            for table in visitDataset.TABLES
+                        }
+                    dataset_writers["grouped"].write(grouped)
+                    dataset_writers["summed"].write(summed)
+        except BaseException:
+            for writer in dataset_writers.values():
+                writer.abort()
+            raise
+    for writer in dataset_writers.values():
+        writer.close()
+
+# Function to load a data file: an IR CSV or a binary event log
+def load_data(filepath):
+    if filepath.suffix.lower() == eventLog.EVENT_LOG_SUFFIX:
+        return eventLog.read_visits(filepath)
+    return pd.read_csv(filepath)
+
+# Function to process a single file; returns "ok", "skipped" or "failed"
+def process_file(filepath, grouped_directory, summed_directory, dataset_directory=None, chunksize=None, treatments=None,
+                 offsets=None):
     try:
-        # Load the data from the CSV file
-        df = pd.read_csv(filepath)
+        grouped_filepath = grouped_directory / f"{filepath.stem}_timesGrouped.csv"
+        summed_filepath = summed_directory / f"{filepath.stem}_timesSummed.csv"
+
+        is_csv = filepath.suffix.lower() == ".csv"
 
         # Ensure required columns exist
+        columns = pd.read_csv(filepath, nrows=0).columns if is_csv else eventLog.VISIT_COLUMNS
         required_columns = {'hostname', 'start_time', 'end_time', 'time_elapsed'}
-        if not required_columns.issubset(df.columns):
+        if not required_columns.issubset(columns):
             print(f"Skipping file {filepath}: Missing required columns.")
-            return
+            return "skipped"
 
-        # Convert `start_time` and `end_time` to datetime.time objects
-        df['start_time'] = pd.to_datetime(df['start_time'], format='%H:%M:%S').dt.time
-        df['end_time'] = pd.to_datetime(df['end_time'], format='%H:%M:%S').dt.time
+        # Clock correction needs the epoch columns; older recordings keep the Pi's times
+        if offsets is not None and not {'start_epoch', 'end_epoch'}.issubset(columns):
+            print(f"Warning: {filepath.name} has no epoch columns; its times are not clock corrected.")
+            offsets = None
 
-        # Sort the data by `start_time`
-        df = df.sort_values(by=['start_time'])
+        # Streaming mode: read CSVs in chunks, falling back to memory for unsorted files
+        # (event logs are compact and loaded without parsing, so they always load whole)
+        if chunksize and is_csv:
+            try:
+                process_file_streaming(filepath, grouped_filepath, summed_filepath, dataset_directory, chunksize,
+                                       treatments, offsets)
+                print(f"Grouped file saved to: {grouped_filepath}")
+                print(f"Summed file saved to: {summed_filepath}")
+                return "ok"
+            except UnsortedInputError as e:
+                print(f"Warning: {e}; processing it in memory instead.")
 
-        # Set time_tolerance to 2 seconds
-        time_tolerance = pd.Timedelta(seconds=2)
+        # Load the data from the file
+        df = load_data(filepath)
+        if offsets is not None:
+            df = correct_clock(df, offsets)
 
-        # Create an event group based on similarity between `end_time` and the next `start_time`
-        event_group = [0]
-        for i in range(1, len(df)):
-            time_gap = pd.Timestamp.combine(pd.Timestamp.today(), df['start_time'].iloc[i]) - \
-                       pd.Timestamp.combine(pd.Timestamp.today(), df['end_time'].iloc[i-1])
-            if time_gap <= time_tolerance:
-                event_group.append(event_group[-1])
-            else:
-                event_group.append(event_group[-1] + 1)
+        # Parse `start_time` and `end_time` once into datetime64 columns
+        start, end = parse_times(df)
 
-        df['event_group'] = event_group
+        # Sort the data by `start_time` (stable, so ties keep their recorded order)
+        order = np.argsort(start.to_numpy(), kind='stable')
+        df = df.iloc[order].reset_index(drop=True)
+        start = start.iloc[order].reset_index(drop=True)
+        end = end.iloc[order].reset_index(drop=True)
+
+        # Create an event group based on similarity between `end_time` and the next `start_time`
+        df = label_events(df, start, end)
+        if treatments is not None:
+            df = add_treatment(df, treatments)
 
         # Save the grouped data
-        grouped_filepath = grouped_directory / f"{filepath.stem}_timesGrouped.csv"
         df.to_csv(grouped_filepath, index=False)
         print(f"Grouped file saved to: {grouped_filepath}")
 
         # Generate and save aggregated data
-        aggregated = df.groupby('event_group').agg(
-            hostname=('hostname', 'first'),
-            date=('date', 'first'),
-            start_time=('start_time', 'first'),
-            end_time=('end_time', 'last'),
-            time_elapsed=('time_elapsed', 'sum')
-        ).reset_index(drop=True)
-
-        summed_filepath = summed_directory / f"{filepath.stem}_timesSummed.csv"
+        aggregated = summarize_events(df)
         aggregated.to_csv(summed_filepath, index=False)
         print(f"Summed file saved to: {summed_filepath}")
 
+        # Optionally add both tables to the partitioned columnar dataset
+        if dataset_directory is not None and len(df):
+            hostname = df['hostname'].iloc[0]
+            for table, frame in (("grouped", df), ("summed", aggregated)):
+                visitDataset.write_partition(frame, dataset_directory, table, hostname, filepath.stem)
+            print(f"Dataset partitions updated in: {dataset_directory}")
+        return "ok"
+
     except Exception as e:
         print(f"Error processing file {filepath}: {e}")
+        return "failed"
+
+# Function to get the "{date}_{host}" a CSV or event log was recorded for (None for other files)
+def recording_key(filename):
+    for suffix in (CSV_DATA_SUFFIX, EVENT_LOG_DATA_SUFFIX):
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    return None
+
+# Function to list the data files in a directory, in a fixed (sorted) order
+def find_data_files(input_directory):
+    """
+    Return the data files to denoise, one source per host and date.
+
+    A Pi recording with `--format both` writes every visit to its CSV and to
+    its event log; the event log is used and the CSV left out, so no visit is
+    counted twice.
+    """
+    filepaths = sorted(
+        filepath for filepath in Path(input_directory).iterdir()
+        if filepath.is_file() and filepath.suffix.lower() in (".csv", eventLog.EVENT_LOG_SUFFIX)
+        and filepath.name != OFFSETS_FILE
+    )
+    logged = {recording_key(filepath.name) for filepath in filepaths if filepath.name.endswith(EVENT_LOG_DATA_SUFFIX)}
+    return [filepath for filepath in filepaths
+            if not (filepath.name.endswith(CSV_DATA_SUFFIX) and recording_key(filepath.name) in logged)]
+
+# Function to delete the outputs of CSVs now superseded by an event log of the same visits
+def drop_superseded(manifest, filepaths, output_directory, dataset_directory=None):
+    logged = {recording_key(filepath.name) for filepath in filepaths if filepath.name.endswith(EVENT_LOG_DATA_SUFFIX)}
+    for name in [name for name in manifest if name.endswith(CSV_DATA_SUFFIX) and recording_key(name) in logged]:
+        filepath = Path(name)
+        for path in output_files(filepath, output_directory):
+            path.unlink(missing_ok=True)
+        if dataset_directory is not None:
+            for path in dataset_directory.glob(f"*/date=*/hostname=*/{filepath.stem}.parquet"):
+                path.unlink()
+        del manifest[name]
+        print(f"Removed the outputs of {name}; its visits are taken from the event log instead.")
+
+# Function to denoise one data file into the per-date output directories
+def denoise_file(filepath, output_directory, dataset_directory=None, chunksize=None, treatments=None, offsets=None):
+    print(f"Processing file: {filepath}")
+
+    # Extract date from filename
+    date_part = extract_date_from_filename(filepath.name)
+    if date_part == "unknown_date":
+        print(f"Warning: Could not extract date from {filepath.name}. Skipping file.")
+        return "skipped"
+
+    # Create output directories for this specific date
+    grouped_directory, summed_directory = output_directories(date_part, output_directory)
+    grouped_directory.mkdir(parents=True, exist_ok=True)
+    summed_directory.mkdir(parents=True, exist_ok=True)
+
+    # Process the file
+    return process_file(filepath, grouped_directory, summed_directory, dataset_directory, chunksize, treatments, offsets)
+
+# Function to get the grouped/summed output directories for a date
+def output_directories(date_part, output_directory):
+    return (output_directory / f"{date_part}_timesGrouped",
+            output_directory / f"{date_part}_timesSummed")
+
+# Function to get the grouped/summed output files written for an input file
+def output_files(filepath, output_directory):
+    grouped_directory, summed_directory = output_directories(
+        extract_date_from_filename(filepath.name), output_directory)
+    return (grouped_directory / f"{filepath.stem}_timesGrouped.csv",
+            summed_directory / f"{filepath.stem}_timesSummed.csv")
+
+# Function to hash a file's contents without loading it all into memory
+def hash_file(filepath, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Function to load the processed-file manifest (empty if there is none yet)
+def load_manifest(output_directory):
+    manifest_path = output_directory / MANIFEST_NAME
+    if not manifest_path.exists():
+        return {}
+    try:
+        with open(manifest_path) as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read manifest {manifest_path} ({e}). Reprocessing everything.")
+        return {}
+
+# Function to save the manifest, replacing the old one only once fully written
+def save_manifest(manifest, output_directory):
+    output_directory.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_directory / MANIFEST_NAME
+    tmp_path = manifest_path.with_suffix(".tmp")
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+# Function to split inputs into files that need processing and unchanged files
+def select_changed_files(filepaths, manifest, output_directory, dataset=False, treatments=None, offsets=None):
+    """
+    Return (changed, unchanged) lists of input files.
+
+    A file is unchanged when its manifest entry matches its size and mtime and
+    its outputs still exist. Files whose size/mtime moved are hashed, so a file
+    that was only touched or re-copied is still recognised as unchanged. With
+    `dataset`, files not yet written to the columnar dataset count as changed,
+    and files processed with a different treatment mapping or different
+    clock offsets always do.
+    """
+    changed, unchanged = [], []
+    digest = treatment_digest(treatments)
+    clock_digest = offsets_digest(offsets)
+    for filepath in filepaths:
+        entry = manifest.get(filepath.name)
+        if entry is None or not all(path.exists() for path in output_files(filepath, output_directory)) \
+                or (dataset and not entry.get('dataset')) or entry.get('treatments') != digest \
+                or entry.get('clock_offsets') != clock_digest:
+            changed.append(filepath)
+            continue
+
+        stat = filepath.stat()
+        if stat.st_size == entry['size'] and stat.st_mtime == entry['mtime']:
+            unchanged.append(filepath)
+        elif stat.st_size == entry['size'] and hash_file(filepath) == entry['sha256']:
+            entry['mtime'] = stat.st_mtime
+            unchanged.append(filepath)
+        else:
+            changed.append(filepath)
+    return changed, unchanged
+
+# Function to record each input's size, mtime and hash before it is processed
+def snapshot_files(filepaths):
+    # Taken up front, so rows the collector appends during processing leave the
+    # file looking changed and get picked up on the next run
+    snapshots = {}
+    for filepath in filepaths:
+        stat = filepath.stat()
+        snapshots[filepath] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': hash_file(filepath)}
+    return snapshots
+
+# Function to record the processed files in the manifest, as they were before processing
+def update_manifest(manifest, results, snapshots, dataset=False, treatments=None, offsets=None):
+    digest = treatment_digest(treatments)
+    clock_digest = offsets_digest(offsets)
+    for filepath, status in results.items():
+        if status == "ok":
+            manifest[filepath.name] = {
+                **snapshots[filepath],
+                'dataset': dataset,
+                'treatments': digest,
+                'clock_offsets': clock_digest,
+            }
+    return manifest
+
+# Function to denoise many files, fanning out over a process pool when workers > 1
+def run_batch(filepaths, output_directory, workers=1, dataset_directory=None, chunksize=None, treatments=None,
+              offsets=None):
+    """
+    Denoise every file in `filepaths` and return a {filepath: status} dict.
+
+    Each input writes only its own output files, so the results are the same
+    for any worker count; only the order of the progress lines changes.
+    """
+    results = {}
+    total = len(filepaths)
+
+    def report(filepath, status):
+        results[filepath] = status
+        print(f"[{len(results)}/{total}] {filepath.name}: {status}")
+
+    if workers <= 1:
+        for filepath in filepaths:
+            report(filepath, denoise_file(filepath, output_directory, dataset_directory, chunksize, treatments, offsets))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(denoise_file, filepath, output_directory, dataset_directory, chunksize, treatments,
+                                offsets): filepath
+                for filepath in filepaths
+            }
+            for future in as_completed(futures):
+                try:
+                    status = future.result()
+                except Exception as e:
+                    print(f"Error processing file {futures[future]}: {e}")
+                    status = "failed"
+                report(futures[future], status)
+
+    return {filepath: results[filepath] for filepath in filepaths}
+
+# Function to print a per-status summary of a batch run
+def print_summary(results):
+    counts = {status: 0 for status in ("ok", "skipped", "failed")}
+    for status in results.values():
+        counts[status] = counts.get(status, 0) + 1
+    print(f"\nProcessed {len(results)} files: "
+          + ", ".join(f"{count} {status}" for status, count in counts.items()))
+    for filepath, status in results.items():
+        if status != "ok":
+            print(f"  {status}: {filepath}")
 
 # Main script
 if __name__ == "__main__":
-    # Prompt for the input directory
-    input_directory = input("Enter the directory containing data files: ").strip()
+    parser = argparse.ArgumentParser(description="Group IR visits into events and sum them per file.")
+    parser.add_argument('input_directory', nargs='?', help='Directory containing data files (prompted for if omitted)')
+    parser.add_argument('--output-dir', default=OUTPUT_DIRECTORY, type=Path, help=f'Output directory (default: {OUTPUT_DIRECTORY})')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes (default: 1)')
+    parser.add_argument('--force', action='store_true', help='Reprocess every file, ignoring the manifest')
+    parser.add_argument('--chunksize', type=int, help='Stream each file in chunks of this many rows to bound memory use')
+    parser.add_argument('--dataset-dir', type=Path, help='Also write visits to a Parquet dataset partitioned by date and hostname (needs pyarrow)')
+    parser.add_argument('--fleet-config', type=Path, default=Path(FLEET_FILE), help=f'Fleet file giving each Pi\'s treatment (default: {FLEET_FILE}; skipped if missing)')
+    parser.add_argument('--no-treatment', action='store_true', help='Do not add the treatment column')
+    parser.add_argument('--clock-offsets', type=Path, help=f'Clock offsets measured by clockAudit.py (default: {OFFSETS_FILE} in the input directory, if present)')
+    parser.add_argument('--no-clock-correction', action='store_true', help='Keep the times the Pis recorded')
+    args = parser.parse_args()
+
+    # Prompt for the input directory when it is not given on the command line
+    input_directory = args.input_directory
+    if input_directory is None:
+        input_directory = input("Enter the directory containing data files: ").strip()
 
     try:
         # Resolve input directory
@@ -82,30 +560,50 @@ if __name__ == "__main__":
         # Ensure the input directory exists
         if not input_directory.exists() or not input_directory.is_dir():
             print("The specified input directory does not exist or is not valid.")
-        else:
-            # Process files one by one
-            for filepath in input_directory.iterdir():
-                if filepath.is_file() and filepath.suffix.lower() == ".csv":
-                    print(f"Processing file: {filepath}")
+            sys.exit(1)
 
-                    # Extract date from filename
-                    date_part = extract_date_from_filename(filepath.name)
-                    if date_part == "unknown_date":
-                        print(f"Warning: Could not extract date from {filepath.name}. Skipping file.")
-                        continue
+        output_directory = args.output_dir.resolve()
+        dataset_directory = args.dataset_dir.resolve() if args.dataset_dir else None
+        if dataset_directory is not None:
+            visitDataset.require_parquet()
+        filepaths = find_data_files(input_directory)
 
-                    # Create output directories for this specific date
-                    grouped_directory = OUTPUT_DIRECTORY / f"{date_part}_timesGrouped"
-                    summed_directory = OUTPUT_DIRECTORY / f"{date_part}_timesSummed"
+        # Each Pi's treatment from the fleet file becomes a column of the outputs
+        treatments = None
+        if not args.no_treatment and args.fleet_config.exists():
+            treatments = load_fleet_config(args.fleet_config).treatments()
+        elif not args.no_treatment:
+            print(f"No fleet file at {args.fleet_config}; outputs will have no treatment column.")
 
-                    # Create directories
-                    grouped_directory.mkdir(parents=True, exist_ok=True)
-                    summed_directory.mkdir(parents=True, exist_ok=True)
+        # Clock offsets audited during the run move every Pi's times onto one clock
+        offsets = None
+        clock_offsets = args.clock_offsets or input_directory / OFFSETS_FILE
+        if not args.no_clock_correction and clock_offsets.exists():
+            offsets = read_offsets(clock_offsets)
+            print(f"Correcting times with the clock offsets in {clock_offsets}.")
+        elif args.clock_offsets and not args.no_clock_correction:
+            print(f"Clock offsets file {clock_offsets} does not exist.")
+            sys.exit(1)
 
-                    # Process the file
-                    process_file(filepath, grouped_directory, summed_directory)
+        # Only process files that are new or changed since the last run
+        manifest = load_manifest(output_directory)
+        drop_superseded(manifest, filepaths, output_directory, dataset_directory)
+        if args.force:
+            manifest = {}
+        filepaths, unchanged = select_changed_files(filepaths, manifest, output_directory, dataset_directory is not None,
+                                                    treatments, offsets)
+        if unchanged:
+            print(f"Skipping {len(unchanged)} unchanged files (use --force to reprocess).")
 
-            print("\nAll files processed successfully.")
+        snapshots = snapshot_files(filepaths)
+        results = run_batch(filepaths, output_directory, args.workers, dataset_directory, args.chunksize, treatments, offsets)
+        save_manifest(update_manifest(manifest, results, snapshots, dataset_directory is not None, treatments, offsets),
+                      output_directory)
+        print_summary(results)
+        if any(status == "failed" for status in results.values()):
+            sys.exit(1)
+        print("\nAll files processed successfully.")
 
     except Exception as e:
         print(f"An error occurred: {e}")
+        sys.exit(1)
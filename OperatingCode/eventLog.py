@@ -0,0 +1,155 @@
+import os
+import struct
+import time
+
+# Compact, append-only log of IR beam edges.
+#
+# The file starts with a 64-byte header (magic, format version, the Pi's UTC
+# offset, hostname and date) followed by fixed-width 9-byte records: the edge
+# time in nanoseconds since the Unix epoch (int64) and the beam level (uint8,
+# 0 = beam broken / bee detected, 1 = beam restored / bee left). All values are
+# little-endian. A crash can only leave a partial record at the end of the
+# file, which readers ignore.
+
+MAGIC = b"RFEV"
+VERSION = 1
+HEADER = struct.Struct("<4sHi32s10s12x")
+RECORD = struct.Struct("<qB")
+EVENT_LOG_SUFFIX = ".evlog"
+
+# Columns of the visit CSVs written by IR_Recording.py
+VISIT_COLUMNS = ["hostname", "date", "start_time", "end_time", "time_elapsed", "start_epoch", "end_epoch"]
+
+
+# Function to get the event log filename for a date and Pi
+def event_log_name(date, hostname):
+    return f"{date}_{hostname}_events{EVENT_LOG_SUFFIX}"
+
+# Writer used on the Pi; only needs the standard library
+class EventLogWriter:
+    """
+    Append edge records to an event log, creating it with a header if needed.
+
+    Records are buffered by the file object; call `sync` to force them out to
+    the SD card.
+    """
+
+    def __init__(self, filepath, hostname, date):
+        self.filepath = filepath
+        size = os.path.getsize(filepath) if os.path.exists(filepath) else 0
+        if size >= HEADER.size:
+            read_header(filepath)  # Refuse to append to something that is not an event log
+        self.file = open(filepath, "ab")
+        if size >= HEADER.size:
+            # Drop a partial record left by a crash so new records stay aligned
+            self.file.truncate(size - (size - HEADER.size) % RECORD.size)
+        else:
+            self.file.truncate(0)
+            self.file.write(HEADER.pack(MAGIC, VERSION, time.localtime().tm_gmtoff, hostname.encode()[:32], date.encode()[:10]))
+
+    def write(self, epoch, level):
+        self.file.write(RECORD.pack(round(epoch * 1e9), int(level)))
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+# Function to read and check an event log header
+def read_header(filepath):
+    with open(filepath, "rb") as file:
+        raw = file.read(HEADER.size)
+    if len(raw) < HEADER.size:
+        raise ValueError(f"{filepath} is too short to be an event log")
+    magic, version, utc_offset, hostname, date = HEADER.unpack(raw)
+    if magic != MAGIC:
+        raise ValueError(f"{filepath} is not an event log")
+    if version != VERSION:
+        raise ValueError(f"{filepath} has unsupported event log version {version}")
+    return {
+        "version": version,
+        "utc_offset": utc_offset,
+        "hostname": hostname.rstrip(b"\0").decode(),
+        "date": date.rstrip(b"\0").decode(),
+    }
+
+# Function to load the edge records as a NumPy structured array
+def read_events(filepath):
+    """
+    Return (header, records) for an event log.
+
+    `records` has fields `time_ns` (int64, ns since the Unix epoch) and
+    `level` (uint8), read straight from the file without parsing.
+    """
+    import numpy as np
+
+    header = read_header(filepath)
+    dtype = np.dtype([("time_ns", "<i8"), ("level", "u1")])
+    count = (os.path.getsize(filepath) - HEADER.size) // dtype.itemsize
+    records = np.fromfile(filepath, dtype=dtype, count=count, offset=HEADER.size)
+    return header, records
+
+# Function to load the edge records as a DataFrame
+def read_events_frame(filepath):
+    import pandas as pd
+
+    header, records = read_events(filepath)
+    frame = pd.DataFrame({
+        "time": pd.to_datetime(records["time_ns"], unit="ns"),
+        "level": records["level"],
+    })
+    frame.attrs.update(header)
+    return frame
+
+# Function to pair edges into visits in the same columns as the IR CSV files
+def read_visits(filepath):
+    """
+    Return the visits in an event log as a DataFrame shaped like the IR CSVs.
+
+    Each "bee detected" edge followed by a "bee left" edge is one visit;
+    clock times are given in the Pi's local time using the offset stored in
+    the header.
+    """
+    import numpy as np
+    import pandas as pd
+
+    header, records = read_events(filepath)
+    level = records["level"]
+    starts = np.flatnonzero((level[:-1] == 0) & (level[1:] == 1))
+    start_ns = records["time_ns"][starts]
+    end_ns = records["time_ns"][starts + 1]
+
+    offset = pd.Timedelta(seconds=header["utc_offset"])
+    start_local = pd.Series(pd.to_datetime(start_ns, unit="ns") + offset)
+    end_local = pd.Series(pd.to_datetime(end_ns, unit="ns") + offset)
+    return pd.DataFrame({
+        "hostname": header["hostname"],
+        "date": start_local.dt.strftime("%Y-%m-%d"),
+        "start_time": start_local.dt.strftime("%H:%M:%S"),
+        "end_time": end_local.dt.strftime("%H:%M:%S"),
+        "time_elapsed": (end_ns - start_ns) / 1e9,
+        "start_epoch": start_ns / 1e9,
+        "end_epoch": end_ns / 1e9,
+    }, columns=VISIT_COLUMNS)
+
+# Function to convert an event log into an IR CSV file
+def convert_to_csv(filepath, csv_filepath=None):
+    filepath = str(filepath)
+    if csv_filepath is None:
+        csv_filepath = filepath[:-len(EVENT_LOG_SUFFIX)].replace("_events", "_data") + ".csv"
+    read_visits(filepath).to_csv(csv_filepath, index=False, float_format="%.6f")
+    return csv_filepath
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert IR event logs into visit CSV files.")
+    parser.add_argument('event_logs', nargs='+', help='Event log files to convert')
+    args = parser.parse_args()
+
+    for event_log in args.event_logs:
+        print(f"{event_log} -> {convert_to_csv(event_log)}")
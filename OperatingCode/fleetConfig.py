@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+from collections import namedtuple
+
+# Fleet file next to the scripts on the control node
+FLEET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fleet.json")
+UNASSIGNED = "unassigned"  # Treatment of a Pi the fleet file gives none
+
+# One Pi in the fleet. `name` is the Pi's own hostname and login user (what the
+# recorders write in the hostname column); `hostname` is its network address.
+PiConfig = namedtuple("PiConfig", ["name", "hostname", "treatment", "color", "location", "ir_pin", "camera"])
+
+FIELDS = set(PiConfig._fields) - {"name", "hostname"}
+CAMERA_SETTINGS = {"width", "height"}  # Options both camera scripts accept, passed as --width/--height
+
+
+class FleetConfig:
+    """
+    The Pis in the field and what each one is measuring.
+
+    Loaded from a JSON fleet file:
+
+        {
+          "domain": "wifi.etsu.edu",
+          "defaults": {"treatment": "unassigned", "ir_pin": 17, "camera": {"width": 640, "height": 480}},
+          "pis": [
+            {"name": "pi1", "treatment": "control", "color": "yellow", "location": "bed A"},
+            {"name": "pi2", "treatment": "scented", "color": "blue", "location": "bed A", "ir_pin": 27}
+          ]
+        }
+
+    Each Pi's hostname is `{name}.{domain}` unless it sets "hostname" (which
+    must still start with the name, since that is also the login user). Any
+    field a Pi leaves out comes from "defaults". The Pis are kept in file
+    order and can be looked up by name or hostname.
+    """
+
+    def __init__(self, pis):
+        self.pis = list(pis)
+        self.by_host = {}
+        for pi in self.pis:
+            if pi.name in self.by_host or pi.hostname in self.by_host:
+                raise ValueError(f"{pi.name} is listed more than once in the fleet file")
+            self.by_host[pi.name] = self.by_host[pi.hostname] = pi
+
+    def __iter__(self):
+        return iter(self.pis)
+
+    def __len__(self):
+        return len(self.pis)
+
+    def __getitem__(self, host):
+        return self.by_host[host]
+
+    @property
+    def names(self):
+        return [pi.name for pi in self.pis]
+
+    @property
+    def hostnames(self):
+        return [pi.hostname for pi in self.pis]
+
+    def treatments(self):
+        """Return {name: treatment} for joining onto visit data by its hostname column."""
+        return {pi.name: pi.treatment for pi in self.pis}
+
+    def select(self, hosts):
+        """Return a FleetConfig with only the given Pis (names or hostnames), in fleet order."""
+        wanted = {self[host].name for host in hosts}
+        return FleetConfig(pi for pi in self.pis if pi.name in wanted)
+
+# Function to load and check the fleet file
+def load_fleet_config(path=FLEET_FILE):
+    with open(path) as file:
+        config = json.load(file)
+    domain = config.get("domain")
+    defaults = {"treatment": UNASSIGNED, "color": None, "location": None, "ir_pin": None, "camera": {}}
+    defaults.update(config.get("defaults", {}))
+    pis = []
+    for entry in config["pis"]:
+        unknown = set(entry) - FIELDS - {"name", "hostname"}
+        if unknown:
+            raise ValueError(f"Unknown fields for {entry.get('name')} in {path}: {', '.join(sorted(unknown))}")
+        name = entry["name"]
+        hostname = entry.get("hostname") or (f"{name}.{domain}" if domain else name)
+        if hostname.split('.')[0] != name:
+            raise ValueError(f"Hostname {hostname} in {path} does not start with the Pi's name {name}")
+        fields = {field: entry.get(field, defaults.get(field)) for field in FIELDS}
+        unknown = set(fields["camera"] or {}) - CAMERA_SETTINGS
+        if unknown:
+            raise ValueError(f"Unknown camera settings for {name} in {path}: {', '.join(sorted(unknown))}")
+        pis.append(PiConfig(name=name, hostname=hostname, **fields))
+    return FleetConfig(pis)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the fleet file and list its Pis.")
+    parser.add_argument('--fleet-config', default=FLEET_FILE, help=f'Fleet file (default: {FLEET_FILE})')
+    args = parser.parse_args()
+
+    fleet_config = load_fleet_config(args.fleet_config)
+    print(f"{'name':<8}{'hostname':<24}{'treatment':<14}{'color':<10}{'location':<14}{'IR pin':>7}  camera")
+    for pi in fleet_config:
+        print(f"{pi.name:<8}{pi.hostname:<24}{pi.treatment:<14}{pi.color or '-':<10}{pi.location or '-':<14}"
+              f"{pi.ir_pin if pi.ir_pin is not None else '-':>7}  {pi.camera or '-'}")
+    counts = {}
+    for pi in fleet_config:
+        counts[pi.treatment] = counts.get(pi.treatment, 0) + 1
+    print(f"\n{len(fleet_config)} Pis: " + ", ".join(f"{count} {treatment}" for treatment, count in sorted(counts.items())))
@@ -0,0 +1,126 @@
+import asyncio
+import subprocess
+import time
+from collections import namedtuple
+
+from sshPool import SSHConnectionPool
+
+HOST_TIMEOUT = 120.0  # Seconds one Pi gets for a whole phase before it is marked "timeout"
+
+# Outcome of one command, and of one host's part of a phase
+CommandResult = namedtuple("CommandResult", ["returncode", "stdout", "stderr"])
+HostResult = namedtuple("HostResult", ["host", "status", "duration", "value", "error"])
+
+
+class CommandError(Exception):
+    """A remote command or transfer exited with a non-zero status."""
+
+    def __init__(self, argv, result):
+        self.argv = argv
+        self.result = result
+        detail = result.stderr.strip()
+        super().__init__(f"{argv[0]} exited with status {result.returncode}" + (f": {detail}" if detail else ""))
+
+
+# Function to run one local command without blocking the event loop
+async def run_command(argv, check=True, input=None, decode=True):
+    """
+    Run `argv` as a subprocess and return a CommandResult with decoded output
+    (stdout stays bytes with `decode=False`). `input` (str or bytes) is sent
+    to its stdin.
+
+    If the awaiting task is cancelled (e.g. by a host timeout) the process is
+    killed, so no ssh/scp is left running behind a timed-out host.
+    """
+    if isinstance(input, str):
+        input = input.encode()
+    process = await asyncio.create_subprocess_exec(*argv, stdin=subprocess.DEVNULL if input is None else subprocess.PIPE,
+                                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        stdout, stderr = await process.communicate(input)
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+    result = CommandResult(process.returncode, stdout.decode(errors="replace") if decode else stdout,
+                           stderr.decode(errors="replace"))
+    if check and result.returncode != 0:
+        raise CommandError(argv, result)
+    return result
+
+
+class FleetOrchestrator:
+    """
+    Run one coroutine per Pi on a single event loop.
+
+    Every host's job runs as its own task, so a slow or dead Pi only holds up
+    itself. `concurrency` caps how many jobs run at once (None = all of them),
+    and each job is cancelled after `timeout` seconds. `run_all` never raises
+    for a host; it returns one HostResult per host, in input order, with
+    status "ok", "failed" or "timeout", the job's duration and either its
+    return value or the error.
+
+    The ssh/scp helpers go through an SSHConnectionPool, so each Pi still
+    costs one handshake per run.
+    """
+
+    def __init__(self, pool=None, concurrency=None, timeout=HOST_TIMEOUT):
+        self.pool = pool if pool is not None else SSHConnectionPool()
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+    async def ssh(self, username, hostname, command, check=True, input=None, decode=True):
+        await self.pool.connect_async(username, hostname)
+        return await run_command(self.pool.ssh_args(username, hostname, command), check=check, input=input, decode=decode)
+
+    async def upload(self, username, hostname, sources, destination):
+        await self.pool.connect_async(username, hostname)
+        return await run_command(self.pool.scp_args(username, hostname, sources, destination, upload=True))
+
+    async def download(self, username, hostname, sources, destination):
+        await self.pool.connect_async(username, hostname)
+        return await run_command(self.pool.scp_args(username, hostname, sources, destination, upload=False))
+
+    async def _run_host(self, semaphore, host, job, args, timeout):
+        async with semaphore:
+            start = time.monotonic()
+            try:
+                value = await asyncio.wait_for(job(host, *args), timeout)
+                return HostResult(host, "ok", time.monotonic() - start, value, None)
+            except asyncio.TimeoutError:
+                return HostResult(host, "timeout", time.monotonic() - start, None,
+                                  f"no result after {timeout:g} s")
+            except Exception as e:
+                return HostResult(host, "failed", time.monotonic() - start, None, str(e) or type(e).__name__)
+
+    async def run_all(self, hosts, job, *args, timeout=None):
+        """Run `await job(host, *args)` for every host and return their HostResults; `timeout` overrides the default."""
+        hosts = list(hosts)
+        semaphore = asyncio.Semaphore(self.concurrency or max(1, len(hosts)))
+        timeout = timeout or self.timeout
+        return await asyncio.gather(*(self._run_host(semaphore, host, job, args, timeout) for host in hosts))
+
+    def run(self, hosts, job, *args, timeout=None):
+        """Blocking `run_all` for scripts that are not async themselves."""
+        return asyncio.run(self.run_all(hosts, job, *args, timeout=timeout))
+
+    def close(self):
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# Function to print a one-line-per-problem summary of a phase
+def report_results(phase, results):
+    counts = {status: sum(result.status == status for result in results) for status in ("ok", "failed", "timeout")}
+    slowest = max((result.duration for result in results), default=0.0)
+    print(f"{phase}: {counts['ok']} ok, {counts['failed']} failed, {counts['timeout']} timed out "
+          f"(slowest host {slowest:.1f} s)")
+    for result in results:
+        if result.status != "ok":
+            print(f"  {result.host}: {result.status} - {result.error}")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# Checks one Pi's hardware and prints the results as a single JSON object.
+# Pretest2_eb.py pipes this file into `ssh pi python3 -`, so it must run on a
+# bare Pi with only the standard library (RPi.GPIO is used if present).
+import argparse
+import glob
+import json
+import os
+import shutil
+import socket
+import subprocess
+import time
+
+BEAM_PIN = 17
+CAMERA_KEYWORDS = ["camera", "pixel"]
+THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"
+
+
+# Function to look for a USB camera in lsusb and for video devices
+def check_camera():
+    try:
+        usb_output = subprocess.check_output(["lsusb"], stderr=subprocess.STDOUT, universal_newlines=True, timeout=5)
+        usb_camera = any(keyword in usb_output.lower() for keyword in CAMERA_KEYWORDS)
+        error = None
+    except (OSError, subprocess.SubprocessError) as e:
+        usb_camera, error = False, str(e)
+    devices = sorted(glob.glob("/dev/video*"))
+    return {"ok": usb_camera, "usb_camera": usb_camera, "video_devices": devices, "error": error}
+
+# Function to simulate a beam break (same test as test_ir_sensor.py)
+def check_ir_sensor(pin=BEAM_PIN):
+    try:
+        import RPi.GPIO as GPIO
+    except ImportError as e:
+        return {"ok": False, "error": str(e)}
+    try:
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        time.sleep(0.5)
+        initial_state = GPIO.input(pin)
+
+        # Force the pin LOW, as a broken beam would
+        GPIO.setup(pin, GPIO.OUT)
+        GPIO.output(pin, GPIO.LOW)
+        time.sleep(1)
+
+        GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        time.sleep(0.5)
+        final_state = GPIO.input(pin)
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    finally:
+        GPIO.cleanup()
+    ok = initial_state == GPIO.HIGH and final_state == GPIO.LOW
+    return {"ok": ok, "initial_state": int(initial_state), "final_state": int(final_state), "error": None}
+
+# Function to report free space where the scripts write their data
+def check_disk(path):
+    usage = shutil.disk_usage(path)
+    return {"path": path, "free_gb": round(usage.free / 1e9, 2), "total_gb": round(usage.total / 1e9, 2)}
+
+# Function to read the SoC temperature in degrees C
+def check_cpu_temperature():
+    try:
+        with open(THERMAL_ZONE) as file:
+            return round(int(file.read().strip()) / 1000, 1)
+    except (OSError, ValueError):
+        return None
+
+def run_checks(data_path, skip_ir=False, pin=BEAM_PIN):
+    return {
+        "hostname": socket.gethostname(),
+        "camera": check_camera(),
+        "ir_sensor": None if skip_ir else check_ir_sensor(pin),
+        "disk": check_disk(data_path if os.path.exists(data_path) else os.path.expanduser("~")),
+        "cpu_temperature": check_cpu_temperature(),
+        # Read last, so the controller can compare it with the time the reply arrives
+        "time": time.time(),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print camera, IR sensor, disk, temperature and clock checks as JSON.")
+    parser.add_argument('--data-dir', default=os.path.expanduser("~/Data"), help='Directory whose free space is reported (default: ~/Data)')
+    parser.add_argument('--pin', type=int, default=BEAM_PIN, help=f'BCM pin of the IR beam (default: {BEAM_PIN})')
+    parser.add_argument('--skip-ir', action='store_true', help='Skip the ~2 s IR beam test')
+    args = parser.parse_args()
+
+    print(json.dumps(run_checks(args.data_dir, args.skip_ir, args.pin)))
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import subprocess
+import time
+
+HARVEST_CONCURRENCY = 4  # Pis streaming images at the same time
+COMPRESSION_LEVEL = 1    # gzip level; PNGs barely shrink, so spend as little Pi CPU as possible
+CHUNK_SIZE = 64 * 1024
+
+
+class RateLimiter:
+    """
+    Cap a byte stream at `rate` bytes per second.
+
+    Each `consume(n)` books the next n/rate seconds of the link and sleeps
+    until its slot starts. One limiter can be shared by several transfers on
+    the same event loop to cap their combined rate. A rate of None or 0
+    means no cap.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.available_at = 0.0
+
+    async def consume(self, size):
+        if not self.rate:
+            return
+        now = time.monotonic()
+        start = max(now, self.available_at)
+        self.available_at = start + size / self.rate
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class ImageHarvester:
+    """
+    Stream a Pi's images to the control node as one compressed tar archive.
+
+    The Pi runs `tar | gzip` into the SSH session and the control node pipes
+    the stream straight into `tar -x`, so nothing is staged on the SD card and
+    thousands of small files cost one transfer instead of one scp each.
+    Every chunk passes through a per-Pi limiter (`per_pi_rate`, bytes/s) and
+    a limiter shared by all Pis (`total_rate`); at most `concurrency` Pis
+    stream at once. Each harvest returns its file count, bytes on the wire,
+    duration and throughput.
+    """
+
+    def __init__(self, fleet, concurrency=HARVEST_CONCURRENCY, per_pi_rate=None, total_rate=None,
+                 compression_level=COMPRESSION_LEVEL):
+        self.fleet = fleet
+        self.concurrency = concurrency
+        self.per_pi_rate = per_pi_rate
+        self.total = RateLimiter(total_rate)
+        self.compression_level = compression_level
+        self.loop = None
+        self.slots = None
+
+    def _slots(self):
+        # asyncio semaphores belong to one event loop; each fleet.run starts a new one
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop, self.slots = loop, asyncio.Semaphore(self.concurrency or 1 << 30)
+        return self.slots
+
+    def remote_command(self):
+        if self.compression_level:
+            return f"tar -cf - -T - | gzip -{self.compression_level}"
+        return "tar -cf - -T -"
+
+    async def harvest(self, username, hostname, paths, local_directory):
+        """Fetch `paths` (relative to the Pi user's home) into `local_directory`."""
+        async with self._slots():
+            return await self._harvest(username, hostname, paths, local_directory)
+
+    async def _harvest(self, username, hostname, paths, local_directory):
+        os.makedirs(local_directory, exist_ok=True)
+        await self.fleet.pool.connect_async(username, hostname)
+        start = time.monotonic()
+        ssh = await asyncio.create_subprocess_exec(
+            *self.fleet.pool.ssh_args(username, hostname, self.remote_command()),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        untar = await asyncio.create_subprocess_exec(
+            "tar", "-xzf" if self.compression_level else "-xf", "-", "-C", local_directory,
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            # The file list goes over stdin, so thousands of files do not overflow the command line
+            ssh.stdin.write("\n".join(paths).encode() + b"\n")
+            ssh.stdin.close()
+            copied, ssh_error, untar_error = await asyncio.gather(
+                self._pump(ssh.stdout, untar.stdin), ssh.stderr.read(), untar.stderr.read())
+            await asyncio.gather(ssh.wait(), untar.wait())
+        except BaseException:
+            for process in (ssh, untar):
+                if process.returncode is None:
+                    process.kill()
+            raise
+        if ssh.returncode != 0 or untar.returncode != 0:
+            raise RuntimeError(f"image transfer from {hostname} failed: "
+                               f"{(ssh_error or untar_error).decode(errors='replace').strip()}")
+        seconds = time.monotonic() - start
+        return {"files": len(paths), "bytes": copied, "seconds": seconds,
+                "rate": copied / seconds if seconds > 0 else 0.0}
+
+    async def _pump(self, source, sink):
+        # Copy the archive stream, pausing to respect the caps (TCP backpressure slows the Pi)
+        limiter = RateLimiter(self.per_pi_rate)
+        copied = 0
+        while chunk := await source.read(CHUNK_SIZE):
+            await limiter.consume(len(chunk))
+            await self.total.consume(len(chunk))
+            sink.write(chunk)
+            await sink.drain()
+            copied += len(chunk)
+        sink.close()
+        return copied
+
+# Function to print one line per Pi with the image throughput of a harvest
+def report_throughput(hostname, stats):
+    print(f"  {hostname}: {stats['files']} images, {stats['bytes'] / 1e6:.1f} MB in {stats['seconds']:.1f} s "
+          f"({stats['rate'] / 1e6:.2f} MB/s)")
@@ -1,153 +1,135 @@
 import os
 import sys
-import time
+import asyncio
 import argparse
-from datetime import datetime
 import subprocess
 import logging
 import pandas as pd
-from concurrent.futures import ThreadPoolExecutor
+from fleetOrchestrator import FleetOrchestrator, HOST_TIMEOUT, report_results
+from scriptDeploy import build_manifest, deploy_scripts, recorder_modules
+from dataCollector import COLLECT_INTERVAL, DataCollector, kb_per_second
+from imageHarvest import HARVEST_CONCURRENCY, ImageHarvester
+from runScheduler import HEARTBEAT_INTERVAL, RUN_HOURS, Recorder, RunScheduler, run_window
+from fleetConfig import FLEET_FILE, load_fleet_config
+from clockAudit import CLOCK_INTERVAL, OFFSETS_FILE, ClockAuditor, report_offsets
 
 # Script paths (local machine)
 IRScript = '/home/rpimain/Scripts/IR_Recording.py'
 CameraScript = '/home/rpimain/Scripts/20241114_Camera.py'
 RollCallScript = '/home/rpimain/Scripts/BetterRollCall.py'
 
-def get_pi_credentials(pi_num):
-    username = f"pi{pi_num}"
-    hostname = f"{username}.wifi.etsu.edu"
-    return username, hostname
+# Modules the recorder scripts import are deployed from here, next to them
+ScriptsDirectory = os.path.dirname(IRScript)
 
-def check_file_exists(pi_num, remote_path):
-    username, hostname = get_pi_credentials(pi_num)
-    check_command = f"ssh {username}@{hostname} '[ -f {remote_path} ] && echo Exists || echo Missing'"
-    try:
-        result = subprocess.check_output(check_command, shell=True, text=True).strip()
-        return result == "Exists"
-    except subprocess.CalledProcessError:
-        return False
+# Runs each phase on all Pis at once, over one multiplexed SSH session per Pi
+fleet = FleetOrchestrator()
+
+def get_pi_credentials(hostname):
+    username = hostname.split('.')[0]
+    return username, hostname
 
-def send_scripts_to_pi(pi_num, ir_only=False):
-    username, hostname = get_pi_credentials(pi_num)
-    scripts_to_send = [(IRScript, "IR_Recording.py")]
+def scripts_to_send(ir_only=False):
+    scripts = [(IRScript, "IR_Recording.py")]
     if not ir_only:
-        scripts_to_send.append((CameraScript, "CameraScript.py"))
-
-    for script, remote_name in scripts_to_send:
-        remote_path = f"/home/{username}/{remote_name}"
-        if not check_file_exists(pi_num, remote_path):
-            try:
-                scp_command = f"scp {script} {username}@{hostname}:{remote_path}"
-                subprocess.check_call(scp_command, shell=True)
-                print(f"{remote_name} sent to {hostname}.")
-                logging.info(f"{remote_name} sent to {hostname}.")
-            except subprocess.CalledProcessError as e:
-                print(f"Error sending {remote_name} to {hostname}: {e}")
-                logging.error(f"Error sending {remote_name} to {hostname}: {e}")
-
-def execute_scripts_on_pi(pi_num, ir_only=False):
-    username, hostname = get_pi_credentials(pi_num)
-    commands = []
-    commands.append((
-        f"screen -dmS IRScript_{pi_num} bash -c 'mkdir -p Logs; python3 IR_Recording.py > Logs/IR_Recording.log 2>&1'",
+        scripts.append((CameraScript, "CameraScript.py"))
+    return scripts + recorder_modules(ScriptsDirectory, camera=not ir_only)
+
+async def send_scripts_to_pi(hostname, ir_only=False):
+    # Only scripts whose contents differ from the Pi's copy are sent
+    username, hostname = get_pi_credentials(hostname)
+    manifest = build_manifest(scripts_to_send(ir_only), f"/home/{username}")
+    sent = await deploy_scripts(fleet, username, hostname, manifest)
+    for remote_path in sent:
+        remote_name = os.path.basename(remote_path)
+        print(f"{remote_name} sent to {hostname}.")
+        logging.info(f"{remote_name} sent to {hostname}.")
+    if not sent:
+        print(f"Scripts on {hostname} are up to date.")
+    return sent
+
+def recorder_commands(pi, ir_only=False, telemetry=None):
+    # Logs are appended, so a restarted recorder keeps the log of the run that crashed;
+    # the IR pin and camera settings come from the Pi's entry in the fleet file
+    ir_options = f" --pin {pi.ir_pin}" if pi.ir_pin is not None else ""
+    ir_options += f" --telemetry {telemetry}" if telemetry else ""
+    camera_options = "".join(f" --{setting} {value}" for setting, value in pi.camera.items())
+    camera_options += f" --telemetry {telemetry}" if telemetry else ""
+    recorders = [Recorder(
+        f"IRScript_{pi.name}",
+        f"screen -dmS IRScript_{pi.name} bash -c 'mkdir -p Logs; python3 IR_Recording.py{ir_options} >> Logs/IR_Recording.log 2>&1'",
         "IR_Recording.py"
-    ))
+    )]
     if not ir_only:
-        commands.append((
-            f"screen -dmS CameraScript_{pi_num} bash -c 'mkdir -p Logs; python3 CameraScript.py > Logs/CameraScript.log 2>&1'",
+        recorders.append(Recorder(
+            f"CameraScript_{pi.name}",
+            f"screen -dmS CameraScript_{pi.name} bash -c 'mkdir -p Logs; python3 CameraScript.py{camera_options} >> Logs/CameraScript.log 2>&1'",
             "CameraScript.py"
         ))
+    return recorders
 
-    try:
-        for cmd, script_name in commands:
-            ssh_command = f"ssh {username}@{hostname} \"{cmd}\""
-            subprocess.check_call(ssh_command, shell=True)
-            print(f"{script_name} successfully started on {hostname}.")
-            logging.info(f"{script_name} successfully started on {hostname}.")
-    except subprocess.CalledProcessError as e:
-        print(f"Error executing scripts on {hostname}: {e}")
-        logging.error(f"Error executing scripts on {hostname}: {e}")
-
-def fetch_csv_files(pi_hosts, base_local_directory):
-    current_date = datetime.now().strftime("%Y-%m-%d")
-    local_directory = os.path.join(base_local_directory, current_date)
-    os.makedirs(local_directory, exist_ok=True)
-
-    print("\nFetching CSV files from remote Pis...")
-    failed_fetches = []
-
-    def fetch_from_host(host):
-        user = host.split('.')[0]
-        remote_directory = f"/home/{user}/Data"
-        try:
-            subprocess.run([
-                "scp", f"{user}@{host}:{remote_directory}/{current_date}*.csv", local_directory
-            ], check=True)
-            print(f"Fetched files from {host}.")
-        except subprocess.CalledProcessError:
-            print(f"Error fetching files from {host}.")
-            failed_fetches.append(host)
-
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        executor.map(fetch_from_host, pi_hosts)
-
-    if failed_fetches:
-        print("\nThe following Pis failed to transfer CSV files:")
-        for failed_host in failed_fetches:
-            print(failed_host)
-
-def cleanup(pi_hosts):
-    print("\nPerforming cleanup...")
-
-    def cleanup_host(host):
-        user = host.split('.')[0]
-        try:
-            subprocess.run(["ssh", f"{user}@{host}", "pkill screen"], check=True)
-            print(f"Screen sessions terminated on {host}.")
-        except subprocess.CalledProcessError:
-            print(f"Error terminating screen sessions on {host}.")
-
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        executor.map(cleanup_host, pi_hosts)
+# Function to log every host that did not finish a phase
+def log_failures(phase, results):
+    for result in results:
+        if result.status != "ok":
+            logging.error(f"{phase} {result.status} on {result.host}: {result.error}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Control script for sending/executing IR and Camera scripts on Pis.")
     parser.add_argument('--ir-only', action='store_true', help='Only run the IR script (skip Camera script)')
+    parser.add_argument('--start', default="now", help='When to start recording: now, HH:MM or dawn (default: now)')
+    parser.add_argument('--stop', default=None, help='When to stop recording: HH:MM or dusk (default: --hours after the start)')
+    parser.add_argument('--hours', type=float, default=RUN_HOURS, help=f'Run length when --stop is not given (default: {RUN_HOURS:g})')
+    parser.add_argument('--heartbeat', type=float, default=HEARTBEAT_INTERVAL, help=f'Seconds between recorder checks (default: {HEARTBEAT_INTERVAL:g})')
+    parser.add_argument('--no-restart', action='store_true', help='Report crashed recorders without restarting them')
+    parser.add_argument('--telemetry', metavar='HOST:PORT', default=None, help="Have IR_Recording.py stream visits live to this telemetry collector (run telemetry.py there)")
+    parser.add_argument('--concurrency', type=int, default=None, help='Maximum Pis worked on at once (default: all)')
+    parser.add_argument('--collect-interval', type=float, default=COLLECT_INTERVAL / 60, help=f'Minutes between data collection passes during the run (default: {COLLECT_INTERVAL // 60})')
+    parser.add_argument('--clock-interval', type=float, default=CLOCK_INTERVAL / 60, help=f'Minutes between clock offset audits during the run (default: {CLOCK_INTERVAL // 60})')
+    parser.add_argument('--harvest-concurrency', type=int, default=HARVEST_CONCURRENCY, help=f'Pis streaming images at once (default: {HARVEST_CONCURRENCY})')
+    parser.add_argument('--bwlimit', type=float, default=None, help='Image bandwidth cap per Pi in KB/s (default: none)')
+    parser.add_argument('--timeout', type=float, default=HOST_TIMEOUT, help=f'Seconds each Pi gets per phase (default: {HOST_TIMEOUT:g})')
+    parser.add_argument('--fleet-config', default=FLEET_FILE, help=f'Fleet file listing the Pis and their treatments (default: {FLEET_FILE})')
     args = parser.parse_args()
 
-    pi_hosts = [f"pi{i}.wifi.etsu.edu" for i in range(1, 21)]
-    current_date = datetime.now().strftime("%Y-%m-%d")
-    current_time = datetime.now().strftime("%H%M%S")
+    fleet.concurrency = args.concurrency
+    fleet.timeout = args.timeout
+    fleet_config = load_fleet_config(args.fleet_config)
+    pi_hosts = fleet_config.hostnames
+    start_time, stop_time = run_window(args.start, args.stop, args.hours)
 
-    local_directory = "/home/rpimain/Data"
+    # Everything from this run goes under its start date, even if it runs past midnight
+    local_directory = os.path.join("/home/rpimain/Data", start_time.strftime("%Y-%m-%d"))
 
     logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s', handlers=[
         logging.StreamHandler(sys.stdout)
     ])
 
     try:
-        subprocess.check_call(["python3", RollCallScript])
+        subprocess.check_call(["python3", RollCallScript, "--fleet-config", args.fleet_config])
     except subprocess.CalledProcessError:
         print("Roll call failed. Halting execution.")
         sys.exit(1)
 
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        for pi_num in range(1, 21):
-            executor.submit(send_scripts_to_pi, pi_num, args.ir_only)
-
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        for pi_num in range(1, 21):
-            executor.submit(execute_scripts_on_pi, pi_num, args.ir_only)
-
-    print("All scripts started on Pis.")
-    logging.info("All scripts started on Pis.")
-
-    duration = 12 * 3600
-    print("\nWaiting for 12 hours ...")
-    time.sleep(duration)
-
-    fetch_csv_files(pi_hosts, local_directory)
-    cleanup(pi_hosts)
+    # Clock offsets go next to the data, where dataDenoising.py picks them up
+    clock_auditor = ClockAuditor(fleet, os.path.join(local_directory, OFFSETS_FILE))
+    report_offsets(clock_auditor.audit(pi_hosts))
+
+    results = fleet.run(pi_hosts, send_scripts_to_pi, args.ir_only)
+    report_results("Send scripts", results)
+    log_failures("Sending scripts", results)
+
+    harvester = ImageHarvester(fleet, args.harvest_concurrency, kb_per_second(args.bwlimit))
+    # Only this run's files, so old data is not fetched again or corrected with this run's clock offsets
+    collector = DataCollector(fleet, local_directory, harvester=harvester, since=start_time.timestamp())
+    recorders = {pi.hostname: recorder_commands(pi, args.ir_only, args.telemetry) for pi in fleet_config}
+    scheduler = RunScheduler(fleet, recorders, collector, heartbeat_interval=args.heartbeat,
+                             collect_interval=args.collect_interval * 60, restart=not args.no_restart,
+                             clock_auditor=clock_auditor, clock_interval=args.clock_interval * 60)
+
+    print(f"Run scheduled from {start_time:%Y-%m-%d %H:%M} to {stop_time:%Y-%m-%d %H:%M}.")
+    logging.info(f"Run scheduled from {start_time:%Y-%m-%d %H:%M} to {stop_time:%Y-%m-%d %H:%M}.")
+    asyncio.run(scheduler.run(start_time, stop_time))
+    fleet.close()
 
     print("All screen sessions terminated.")
     logging.info("All screen sessions terminated.")
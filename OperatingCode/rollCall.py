@@ -4,6 +4,7 @@ import time
 from datetime import datetime
 import subprocess
 import logging
+from fleetConfig import load_fleet_config
 
 def check_online(hostname):
     """
@@ -21,12 +22,11 @@ def check_online(hostname):
         logging.error(f"Failed to ping {hostname}: {e.output}")
         return False
 
-def check_cameras(pi_num):
+def check_cameras(hostname):
     """
     Check if a USB camera is connected to a remote device.
     """
-    hostname = f"pi{pi_num}.wifi.edu" #replace this with your own hostname pattern
-    username = f"pi{pi_num}"
+    username = hostname.split('.')[0]
     try:
 
         # SSH into the host and run `lsusb` to check for USB devices
@@ -50,7 +50,7 @@ def check_cameras(pi_num):
 
 if __name__ == "__main__":
 
-    pi_hosts = [f"pi{i}.wifi.etsu.edu" for i in range(1, 21)]
+    pi_hosts = load_fleet_config().hostnames  # Pis listed in fleet.json
     current_date = datetime.now().strftime("%Y-%m-%d")
     current_time = datetime.now().strftime("%H%M%S")
 
@@ -93,14 +93,14 @@ if __name__ == "__main__":
 
     # Camera check phase
     noncamera_pis = []
-    for pi_num in range(1,21):
+    for host in pi_hosts:
         try:
-            if not check_cameras(pi_num):
-                logging.info(f"{pi_num} has no camera.")
-                noncamera_pis.append(pi_num)
+            if not check_cameras(host):
+                logging.info(f"{host} has no camera.")
+                noncamera_pis.append(host)
         except Exception as e:
-            logging.error(f"An error occurred for {pi_num}: {e}")
-            noncamera_pis.append(pi_num)
+            logging.error(f"An error occurred for {host}: {e}")
+            noncamera_pis.append(host)
 
     # Print list of Pis with no camera to the console
     if noncamera_pis:
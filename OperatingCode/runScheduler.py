@@ -0,0 +1,225 @@
+import asyncio
+import math
+import re
+import shlex
+import signal
+from collections import namedtuple
+from datetime import datetime, time as dt_time, timedelta, timezone
+
+from fleetOrchestrator import report_results
+from dataCollector import report_collection
+from clockAudit import report_offsets
+
+HEARTBEAT_INTERVAL = 60.0  # Seconds between checks that every recorder is still running
+STOP_TIMEOUT = 30.0  # Seconds recorders get to flush their files and exit after being stopped
+STOP_POLL = 1.0
+RUN_HOURS = 12.0
+
+# Field site (ETSU, Johnson City TN), used for dawn/dusk start and stop times
+LATITUDE = 36.30
+LONGITUDE = -82.37
+
+# A recorder runs in its own screen session on a Pi; `command` (re)starts it
+Recorder = namedtuple("Recorder", ["session", "command", "name"])
+
+SCREEN_SESSION = re.compile(r"^\s*\d+\.(\S+)", re.MULTILINE)
+
+
+# Function to compute sunrise and sunset (local time) with the NOAA solar equations
+def sun_times(day, latitude=LATITUDE, longitude=LONGITUDE):
+    gamma = 2 * math.pi / 365 * (day.timetuple().tm_yday - 1)
+    eqtime = 229.18 * (0.000075 + 0.001868 * math.cos(gamma) - 0.032077 * math.sin(gamma)
+                       - 0.014615 * math.cos(2 * gamma) - 0.040849 * math.sin(2 * gamma))
+    decl = (0.006918 - 0.399912 * math.cos(gamma) + 0.070257 * math.sin(gamma)
+            - 0.006758 * math.cos(2 * gamma) + 0.000907 * math.sin(2 * gamma)
+            - 0.002697 * math.cos(3 * gamma) + 0.00148 * math.sin(3 * gamma))
+    lat = math.radians(latitude)
+    cos_ha = math.cos(math.radians(90.833)) / (math.cos(lat) * math.cos(decl)) - math.tan(lat) * math.tan(decl)
+    if not -1 <= cos_ha <= 1:
+        raise ValueError(f"No sunrise/sunset at latitude {latitude} on {day}")
+    ha = math.degrees(math.acos(cos_ha))
+    midnight = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    sunrise = midnight + timedelta(minutes=720 - 4 * (longitude + ha) - eqtime)
+    sunset = midnight + timedelta(minutes=720 - 4 * (longitude - ha) - eqtime)
+    return sunrise.astimezone().replace(tzinfo=None), sunset.astimezone().replace(tzinfo=None)
+
+# Function to turn "now", "HH:MM", "dawn" or "dusk" into the next matching local time
+def parse_run_time(spec, after=None):
+    after = after or datetime.now()
+    if spec == "now":
+        return after
+    for offset in range(3):
+        day = after.date() + timedelta(days=offset)
+        if spec in ("dawn", "dusk"):
+            candidate = sun_times(day)[0 if spec == "dawn" else 1]
+        else:
+            candidate = datetime.combine(day, dt_time.fromisoformat(spec))
+        if candidate > after:
+            return candidate
+    raise ValueError(f"Could not schedule {spec!r}")
+
+# Function to work out the run window from --start, --stop and --hours
+def run_window(start="now", stop=None, hours=RUN_HOURS):
+    start_time = parse_run_time(start)
+    stop_time = parse_run_time(stop, start_time) if stop else start_time + timedelta(hours=hours)
+    return start_time, stop_time
+
+
+class RunScheduler:
+    """
+    Drive a recording run on one event loop instead of sleeping through it.
+
+    `recorders` maps each Pi's hostname to its Recorder list. The scheduler
+    waits for `start`, starts every recorder, then until `stop`:
+
+    - every `heartbeat_interval` seconds checks each Pi's screen sessions and
+      (with `restart`) starts any recorder whose session has ended, so a
+      crashed IR or camera script is back within a minute;
+    - every `collect_interval` seconds runs a `collector` pass, if given;
+    - every `clock_interval` seconds runs a `clock_auditor` (ClockAuditor)
+      pass, if given, which also runs as the recorders start and stop.
+
+    At `stop`, or on Ctrl-C / SIGTERM at any point, it ends the recorder
+    sessions (which makes the scripts flush and close their files), waits up
+    to `stop_timeout` seconds for the scripts to exit, and runs a final
+    collection.
+    """
+
+    def __init__(self, fleet, recorders, collector=None, heartbeat_interval=HEARTBEAT_INTERVAL,
+                 collect_interval=None, restart=True, clock_auditor=None, clock_interval=None, stop_timeout=STOP_TIMEOUT):
+        self.fleet = fleet
+        self.stop_timeout = stop_timeout
+        self.recorders = recorders
+        self.collector = collector
+        self.heartbeat_interval = heartbeat_interval
+        self.collect_interval = collect_interval
+        self.clock_auditor = clock_auditor
+        self.clock_interval = clock_interval
+        self.restart = restart
+        self.stop_requested = None
+        self.restarts = {host: 0 for host in recorders}
+
+    @property
+    def hosts(self):
+        return list(self.recorders)
+
+    def request_stop(self):
+        if not self.stop_requested.is_set():
+            print("\nStop requested; stopping recorders and fetching data...")
+        self.stop_requested.set()
+
+    async def wait_until(self, when):
+        """Sleep until `when` (local time); returns False if a stop was requested first."""
+        while (remaining := (when - datetime.now()).total_seconds()) > 0:
+            try:
+                # Re-check the wall clock at least every minute (NTP steps, suspend)
+                await asyncio.wait_for(self.stop_requested.wait(), min(remaining, 60))
+                return False
+            except asyncio.TimeoutError:
+                pass
+        return not self.stop_requested.is_set()
+
+    async def _start_host(self, host):
+        username = host.split('.')[0]
+        for recorder in self.recorders[host]:
+            await self.fleet.ssh(username, host, recorder.command)
+            print(f"{recorder.name} successfully started on {host}.")
+
+    async def _heartbeat_host(self, host):
+        username = host.split('.')[0]
+        result = await self.fleet.ssh(username, host, "screen -ls; true")
+        running = set(SCREEN_SESSION.findall(result.stdout))
+        restarted = []
+        for recorder in self.recorders[host]:
+            if recorder.session in running:
+                continue
+            if not self.restart:
+                raise RuntimeError(f"{recorder.name} is not running")
+            await self.fleet.ssh(username, host, recorder.command)
+            restarted.append(recorder.name)
+            self.restarts[host] += 1
+        return restarted
+
+    async def _stop_host(self, host):
+        username = host.split('.')[0]
+        sessions = " ".join(f"screen -S {recorder.session} -X quit;" for recorder in self.recorders[host])
+        await self.fleet.ssh(username, host, f"{sessions} true")
+
+        # `quit` returns once the hangup is sent; wait until the sessions and the recorder
+        # processes are gone, so their last rows, clips and event log tail are on disk
+        # before the final collect. "[I]R_Recording.py" keeps pgrep from matching this command.
+        patterns = " ".join(shlex.quote(f"[{recorder.name[0]}]{recorder.name[1:]}") for recorder in self.recorders[host])
+        check = f"screen -ls; for p in {patterns}; do pgrep -f \"$p\" >/dev/null && echo \"RUNNING $p\"; done; true"
+        deadline = asyncio.get_running_loop().time() + self.stop_timeout
+        while True:
+            result = await self.fleet.ssh(username, host, check)
+            running = set(SCREEN_SESSION.findall(result.stdout)) & {recorder.session for recorder in self.recorders[host]}
+            running |= {line.split(" ", 1)[1].replace("[", "").replace("]", "")
+                        for line in result.stdout.splitlines() if line.startswith("RUNNING ")}
+            if not running:
+                break
+            if asyncio.get_running_loop().time() >= deadline:
+                raise RuntimeError(f"still running {self.stop_timeout:g} s after stopping: {', '.join(sorted(running))}")
+            await asyncio.sleep(STOP_POLL)
+        print(f"Screen sessions terminated on {host}.")
+
+    async def heartbeat(self):
+        results = await self.fleet.run_all(self.hosts, self._heartbeat_host)
+        for result in results:
+            if result.status == "ok" and result.value:
+                print(f"Restarted {', '.join(result.value)} on {result.host} "
+                      f"({self.restarts[result.host]} restarts this run).")
+        if any(result.status != "ok" for result in results):
+            report_results("Heartbeat", results)
+        return results
+
+    async def collect(self):
+        if self.collector is not None:
+            print(f"\nCollecting data ({datetime.now():%H:%M})...")
+            report_collection(await self.collector.collect_async(self.hosts))
+
+    async def audit_clocks(self):
+        if self.clock_auditor is not None:
+            report_offsets(await self.clock_auditor.audit_async(self.hosts))
+
+    async def _every(self, interval, action):
+        while not self.stop_requested.is_set():
+            try:
+                await asyncio.wait_for(self.stop_requested.wait(), interval)
+            except asyncio.TimeoutError:
+                await action()
+
+    async def run(self, start, stop):
+        self.stop_requested = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.request_stop)
+        started = False
+        try:
+            if start > datetime.now():
+                print(f"Waiting until {start:%Y-%m-%d %H:%M} to start recording...")
+            if not await self.wait_until(start):
+                return
+            await self.audit_clocks()
+            report_results("Start recorders", await self.fleet.run_all(self.hosts, self._start_host))
+            started = True
+            print(f"Recording until {stop:%Y-%m-%d %H:%M}.")
+
+            periodic = [asyncio.create_task(self._every(self.heartbeat_interval, self.heartbeat))]
+            if self.collector is not None and self.collect_interval:
+                periodic.append(asyncio.create_task(self._every(self.collect_interval, self.collect)))
+            if self.clock_auditor is not None and self.clock_interval:
+                periodic.append(asyncio.create_task(self._every(self.clock_interval, self.audit_clocks)))
+            await self.wait_until(stop)
+            for task in periodic:
+                task.cancel()
+            await asyncio.gather(*periodic, return_exceptions=True)
+        finally:
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(sig)
+            if started:
+                # Stop first so the recorders flush their files, then fetch everything
+                print("\nPerforming cleanup...")
+                report_results("Cleanup", await self.fleet.run_all(self.hosts, self._stop_host))
+                await self.audit_clocks()
+                await self.collect()
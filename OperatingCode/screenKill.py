@@ -5,6 +5,7 @@ from datetime import datetime
 import subprocess
 import logging
 import pandas as pd
+from fleetConfig import load_fleet_config
 
 
 def cleanup(pi_hosts):
@@ -22,7 +23,7 @@ def cleanup(pi_hosts):
 
 if __name__ == "__main__":
 
-    pi_hosts = [f"pi{i}.wifi.edu" for i in range(1, 21)] #replace this with your own hostname pattern
+    pi_hosts = load_fleet_config().hostnames  # Pis listed in fleet.json
     current_date = datetime.now().strftime("%Y-%m-%d")
     current_time = datetime.now().strftime("%H%M%S")
 
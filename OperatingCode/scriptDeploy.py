@@ -0,0 +1,72 @@
+import logging
+import os
+import shlex
+import shutil
+
+from dataDenoising import hash_file
+from fleetOrchestrator import CommandError, run_command
+
+# rsync only sends the changed blocks of a file that already exists remotely;
+# without it (locally or on the Pi) whole files are copied with scp
+USE_RSYNC = shutil.which("rsync") is not None
+
+# Modules the recorder scripts import, deployed next to them
+IR_MODULES = ["eventLog.py", "telemetry.py"]
+CAMERA_MODULES = ["cameraPipeline.py", "motionDetection.py", "telemetry.py"]
+
+
+# Function to list the helper modules the recorders need as (local_path, remote_name) pairs, each once
+def recorder_modules(modules_directory, camera=True):
+    modules = list(IR_MODULES)
+    if camera:
+        modules += [module for module in CAMERA_MODULES if module not in modules]
+    return [(os.path.join(modules_directory, module), module) for module in modules]
+
+# Function to build the deployment manifest: remote path -> (local path, sha256)
+def build_manifest(scripts, remote_directory):
+    """
+    `scripts` is a list of (local_path, remote_name) pairs, as in
+    parallel.send_scripts_to_pi. Hash each local script once per run and key
+    it by the path it should have on the Pi.
+    """
+    return {f"{remote_directory}/{remote_name}": (local_path, hash_file(local_path))
+            for local_path, remote_name in scripts}
+
+# Function to hash every deployed script on a Pi in one SSH call
+async def remote_hashes(fleet, username, hostname, remote_paths):
+    """Return {remote path: sha256} for the paths that exist on the Pi."""
+    command = "sha256sum " + " ".join(shlex.quote(path) for path in remote_paths) + " 2>/dev/null; true"
+    result = await fleet.ssh(username, hostname, command)
+    hashes = {}
+    for line in result.stdout.splitlines():
+        digest, _, path = line.partition("  ")
+        if path:
+            hashes[path] = digest
+    return hashes
+
+# Function to copy one file to a Pi, with rsync's delta transfer when available
+async def push_file(fleet, username, hostname, local_path, remote_path, use_rsync=USE_RSYNC):
+    if use_rsync:
+        await fleet.pool.connect_async(username, hostname)
+        ssh_command = shlex.join(["ssh", *fleet.pool.options()])
+        try:
+            await run_command(["rsync", "--checksum", "--inplace", "-e", ssh_command,
+                               local_path, f"{username}@{hostname}:{remote_path}"])
+            return
+        except CommandError as e:
+            logging.warning(f"rsync to {hostname} failed, copying {remote_path} with scp instead: {e}")
+    await fleet.upload(username, hostname, [local_path], remote_path)
+
+async def deploy_scripts(fleet, username, hostname, manifest, use_rsync=USE_RSYNC):
+    """
+    Bring a Pi's scripts up to date with `manifest` (see build_manifest).
+
+    One SSH call collects the remote hashes; only scripts that are missing or
+    whose contents differ are pushed. Returns the remote paths that were sent,
+    so an unchanged redeploy costs a single round-trip and returns [].
+    """
+    deployed = await remote_hashes(fleet, username, hostname, list(manifest))
+    changed = [path for path, (_, digest) in manifest.items() if deployed.get(path) != digest]
+    for remote_path in changed:
+        await push_file(fleet, username, hostname, manifest[remote_path][0], remote_path, use_rsync)
+    return changed
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+# Seconds an idle master connection stays open after its last command
+CONTROL_PERSIST = 600
+CONNECT_TIMEOUT = 10
+
+
+class SSHConnectionPool:
+    """
+    Reuse one multiplexed OpenSSH session per Pi for every ssh/scp in a run.
+
+    The first command to a host starts a background ControlMaster connection
+    (with its output sent to /dev/null, so it never holds a caller's pipes
+    open). Every later ssh or scp to that host rides on the same authenticated
+    session instead of doing a new TCP + key-exchange handshake. `close` (or
+    leaving a `with` block) shuts the masters down. `options` are extra `-o`
+    settings passed to both ssh and scp, e.g. {"Port": "2222"}.
+    """
+
+    def __init__(self, control_persist=CONTROL_PERSIST, connect_timeout=CONNECT_TIMEOUT, options=None):
+        # Short socket directory: Unix socket paths are limited to ~100 characters
+        self.control_dir = tempfile.mkdtemp(prefix="rf-ssh-")
+        self.control_persist = control_persist
+        self.connect_timeout = connect_timeout
+        self.extra_options = dict(options or {})
+        self.targets = {}  # target -> lock, held while its master starts
+        self.async_targets = {}  # Same, for callers on `async_loop` (asyncio locks belong to one loop)
+        self.async_loop = None
+        self.started = set()
+        self.lock = threading.Lock()
+
+    def options(self):
+        options = {
+            "ControlMaster": "auto",
+            "ControlPath": os.path.join(self.control_dir, "%C"),
+            "ControlPersist": str(self.control_persist),
+            "ConnectTimeout": str(self.connect_timeout),
+            "BatchMode": "yes",
+        }
+        options.update(self.extra_options)
+        args = []
+        for key, value in options.items():
+            args += ["-o", f"{key}={value}"]
+        return args
+
+    def control_args(self, target, operation):
+        # `ssh -O check|exit` talks to the master over its socket
+        return ["ssh", *self.options(), "-O", operation, target]
+
+    def master_args(self, target):
+        # Background master with no remote command; -f returns once it is authenticated
+        return ["ssh", *self.options(), "-N", "-f", target]
+
+    def connect(self, username, hostname):
+        """Start the master connection for a Pi if it is not running yet; returns True when it is up."""
+        target = f"{username}@{hostname}"
+        with self.lock:
+            target_lock = self.targets.setdefault(target, threading.Lock())
+        with target_lock:
+            if target in self.started:
+                return True
+            quiet = dict(stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            check = subprocess.run(self.control_args(target, "check"), **quiet)
+            if check.returncode != 0:
+                subprocess.run(self.master_args(target), **quiet)
+                check = subprocess.run(self.control_args(target, "check"), **quiet)
+            # Marked even on failure, so a down Pi is not retried as a master on every command
+            self.started.add(target)
+            return check.returncode == 0
+
+    async def connect_async(self, username, hostname):
+        """`connect` for asyncio callers: starts the master without blocking the event loop."""
+        target = f"{username}@{hostname}"
+        if target in self.started:
+            return True
+        with self.lock:
+            self.targets.setdefault(target, threading.Lock())
+        loop = asyncio.get_running_loop()
+        if loop is not self.async_loop:
+            self.async_loop, self.async_targets = loop, {}
+        target_lock = self.async_targets.setdefault(target, asyncio.Lock())
+        async with target_lock:
+            if target in self.started:
+                return True
+            quiet = dict(stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            check = await asyncio.create_subprocess_exec(*self.control_args(target, "check"), **quiet)
+            if await check.wait() != 0:
+                master = await asyncio.create_subprocess_exec(*self.master_args(target), **quiet)
+                await master.wait()
+                check = await asyncio.create_subprocess_exec(*self.control_args(target, "check"), **quiet)
+                await check.wait()
+            self.started.add(target)
+            return check.returncode == 0
+
+    def _track(self, target):
+        # Start the master once per host; later commands go straight to the socket
+        if target not in self.started:
+            self.connect(*target.split("@", 1))
+
+    def ssh_args(self, username, hostname, command):
+        target = f"{username}@{hostname}"
+        self._track(target)
+        return ["ssh", *self.options(), target, command]
+
+    def scp_args(self, username, hostname, sources, destination, upload=True):
+        """Build an scp command; with `upload` the sources are local, otherwise remote."""
+        target = f"{username}@{hostname}"
+        self._track(target)
+        if upload:
+            return ["scp", *self.options(), *sources, f"{target}:{destination}"]
+        return ["scp", *self.options(), *(f"{target}:{source}" for source in sources), destination]
+
+    def run(self, username, hostname, command, **kwargs):
+        return subprocess.run(self.ssh_args(username, hostname, command), **kwargs)
+
+    def check_output(self, username, hostname, command, **kwargs):
+        return subprocess.check_output(self.ssh_args(username, hostname, command), text=True, **kwargs)
+
+    def check_call(self, username, hostname, command, **kwargs):
+        return subprocess.check_call(self.ssh_args(username, hostname, command), **kwargs)
+
+    def upload(self, username, hostname, sources, destination, **kwargs):
+        return subprocess.check_call(self.scp_args(username, hostname, sources, destination, upload=True), **kwargs)
+
+    def download(self, username, hostname, sources, destination, **kwargs):
+        return subprocess.check_call(self.scp_args(username, hostname, sources, destination, upload=False), **kwargs)
+
+    def close(self):
+        # Ask each master to exit, then remove the socket directory
+        for target in sorted(self.targets):
+            subprocess.run(self.control_args(target, "exit"),
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.targets.clear()
+        self.async_targets.clear()
+        self.started.clear()
+        shutil.rmtree(self.control_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
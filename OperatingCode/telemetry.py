@@ -0,0 +1,411 @@
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+# Wire format: every message is a 4-byte big-endian length followed by that
+# many bytes of UTF-8 JSON. A publisher opens with
+#   {"type": "hello", "host", "source", "session"}
+# and the collector answers {"last_seq": n}, the newest sequence number it
+# already wrote to disk for that (host, source, session). The publisher then
+# (re)sends everything newer (the collector skips events it still holds in
+# memory), and the collector acks with {"ack": seq} once the events up to seq
+# are written to disk.
+FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME = 1 << 20
+TELEMETRY_PORT = 5140
+
+HEARTBEAT_INTERVAL = 30.0
+BUFFER_SIZE = 100_000  # Unacknowledged events kept on the Pi while the collector is unreachable
+RECONNECT_MAX = 30.0   # Longest wait between connection attempts
+REORDER_SECONDS = 60.0  # How late an event may arrive and still be written in time order
+MEMORY_HOURS = 6.0  # Events kept in memory for live queries; older ones are read back from disk
+
+
+# Function to split "host:port" (port optional) into an address tuple
+def parse_address(address, default_port=TELEMETRY_PORT):
+    host, _, port = address.rpartition(":") if ":" in address else (address, "", "")
+    return host or "0.0.0.0", int(port) if port else default_port
+
+# Function to encode one message as a length-prefixed frame
+def encode_frame(message):
+    payload = json.dumps(message, separators=(",", ":")).encode()
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+# Function to read one frame from a blocking socket (None at end of stream)
+def recv_frame(sock):
+    header = _recv_exact(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME:
+        raise ValueError(f"Frame of {length} bytes is too large")
+    payload = _recv_exact(sock, length)
+    if payload is None:
+        return None
+    return json.loads(payload)
+
+def _recv_exact(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+# Function to read one frame from an asyncio stream (None at end of stream)
+async def read_frame(reader):
+    try:
+        (length,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+        if length > MAX_FRAME:
+            raise ValueError(f"Frame of {length} bytes is too large")
+        return json.loads(await reader.readexactly(length))
+    except asyncio.IncompleteReadError:
+        return None
+
+
+class TelemetryPublisher:
+    """
+    Stream events from a Pi script to the control node's collector.
+
+    `publish` only appends to an in-memory buffer, so the recording threads
+    never wait on the network. A background thread keeps one TCP connection
+    open, sends buffered events in order, and drops them once the collector
+    has written them to disk and acknowledged them. If the link drops, events
+    stay buffered (up to `buffer_size`, oldest dropped first) and are replayed
+    after reconnecting; the collector skips any it already stored. Heartbeats go out every
+    `heartbeat_interval` seconds while connected, with `status()` merged in.
+
+    The CSV / event log on the SD card stays the authoritative record; this is
+    a live copy.
+    """
+
+    def __init__(self, address, source, host=None, status=None, heartbeat_interval=HEARTBEAT_INTERVAL,
+                 buffer_size=BUFFER_SIZE):
+        self.address = parse_address(address) if isinstance(address, str) else address
+        self.host = host or socket.gethostname()
+        self.source = source
+        self.session = time.time_ns()  # Sequence numbers restart with every run of the script
+        self.status = status
+        self.heartbeat_interval = heartbeat_interval
+        self.buffer = deque(maxlen=buffer_size)
+        self.seq = 0
+        self.sent_seq = 0
+        self.dropped = 0
+        self.connected = False
+        self.condition = threading.Condition()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def publish(self, kind, event_time=None, **fields):
+        with self.condition:
+            self.seq += 1
+            if len(self.buffer) == self.buffer.maxlen:
+                self.dropped += 1
+            self.buffer.append(dict(fields, type=kind, seq=self.seq,
+                                    time=event_time if event_time is not None else time.time()))
+            self.condition.notify()
+
+    def stop(self, timeout=5.0):
+        """Try for up to `timeout` seconds to send what is buffered, then stop."""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.sent_seq < self.seq and self.connected and time.monotonic() < deadline:
+                self.condition.wait(0.1)
+            self.stopping.set()
+            self.condition.notify()
+        self.thread.join(max(0.0, deadline - time.monotonic()) + 1.0)
+
+    def _run(self):
+        delay = 1.0
+        while not self.stopping.is_set():
+            try:
+                with socket.create_connection(self.address, timeout=10) as sock:
+                    # Acks can be a minute apart; keepalives notice a dead link instead of a read timeout
+                    sock.settimeout(None)
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                    delay = 1.0
+                    self._session(sock)
+            except (OSError, ValueError) as e:
+                if not self.stopping.is_set():
+                    print(f"Telemetry connection to {self.address[0]}:{self.address[1]} lost: {e}")
+            finally:
+                with self.condition:
+                    self.connected = False
+                    self.condition.notify_all()
+            self.stopping.wait(delay)
+            delay = min(delay * 2, RECONNECT_MAX)
+
+    def _session(self, sock):
+        sock.sendall(encode_frame({"type": "hello", "host": self.host, "source": self.source,
+                                   "session": self.session}))
+        reply = recv_frame(sock)
+        if reply is None:
+            raise ConnectionError("collector closed the connection")
+        self._acknowledge(reply.get("last_seq", 0))
+        with self.condition:
+            self.connected = True
+        threading.Thread(target=self._read_acks, args=(sock,), daemon=True).start()
+
+        sent = reply.get("last_seq", 0)
+        next_heartbeat = time.monotonic()
+        while not self.stopping.is_set():
+            with self.condition:
+                pending = [event for event in self.buffer if event["seq"] > sent]
+                if not pending and self.connected:
+                    self.condition.wait(max(0.0, next_heartbeat - time.monotonic()))
+                    pending = [event for event in self.buffer if event["seq"] > sent]
+                if not self.connected:
+                    raise ConnectionError("collector stopped acknowledging")
+            if pending:
+                sock.sendall(b"".join(encode_frame(dict(event, host=self.host, source=self.source))
+                                      for event in pending))
+                sent = pending[-1]["seq"]
+                with self.condition:
+                    self.sent_seq = sent
+                    self.condition.notify_all()
+            if time.monotonic() >= next_heartbeat:
+                heartbeat = {"type": "heartbeat", "host": self.host, "source": self.source,
+                             "time": time.time(), "buffered": len(self.buffer), "dropped": self.dropped}
+                if self.status is not None:
+                    heartbeat.update(self.status())
+                sock.sendall(encode_frame(heartbeat))
+                next_heartbeat = time.monotonic() + self.heartbeat_interval
+
+    def _read_acks(self, sock):
+        try:
+            while (reply := recv_frame(sock)) is not None:
+                self._acknowledge(reply.get("ack", 0))
+        except (OSError, ValueError):
+            pass
+        with self.condition:
+            self.connected = False
+            self.condition.notify_all()
+
+    def _acknowledge(self, seq):
+        with self.condition:
+            while self.buffer and self.buffer[0]["seq"] <= seq:
+                self.buffer.popleft()
+            self.condition.notify_all()
+
+
+class EventStore:
+    """
+    Time-ordered store of the events from every Pi.
+
+    The last `memory_hours` of events are kept sorted by (time, host, source,
+    seq) in memory for live queries, so inserting stays cheap however long
+    the collector runs. Events are appended to `{date}_telemetry.jsonl` in
+    `directory` once they are `reorder_seconds` old, so the file is mostly in
+    time order even though the streams arrive interleaved; `since` reads
+    anything older than the memory window back from these files. Callbacks in
+    `subscribers` see every new event as it is stored. `last_seq` remembers
+    the newest event received per publisher session, so replays are not
+    stored twice; `flushed_seq` is the newest one written to disk, which is
+    all a reconnecting publisher may forget.
+    """
+
+    def __init__(self, directory, reorder_seconds=REORDER_SECONDS, memory_hours=MEMORY_HOURS):
+        self.directory = directory
+        self.reorder_seconds = reorder_seconds
+        self.memory_seconds = memory_hours * 3600
+        self.events = []
+        self.memory_start = time.time() - self.memory_seconds  # Events before this are only on disk
+        self.pending = []
+        self.last_seq = {}
+        self.flushed_seq = {}
+        self.beyond_gap = {}  # Sessions with a gap on disk -> the seqs already written after it
+        self.last_seen = {}  # (host, source) -> latest heartbeat
+        self.subscribers = []
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def _key(event):
+        return (event["time"], event["host"], event["source"], event["seq"])
+
+    def _path(self, event_time):
+        return os.path.join(self.directory, f"{time.strftime('%Y-%m-%d', time.localtime(event_time))}_telemetry.jsonl")
+
+    def _load(self):
+        # Rebuild the replay positions, and the memory window, from what was already
+        # written. A crash can leave gaps, so a session counts as flushed only up to its first gap.
+        written = {}
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith("_telemetry.jsonl"):
+                with open(os.path.join(self.directory, name)) as file:
+                    for line in file:
+                        event = json.loads(line)
+                        written.setdefault((event["host"], event["source"], event["session"]), set()).add(event["seq"])
+                        if event["time"] >= self.memory_start:
+                            self.events.append(event)
+        self.events.sort(key=self._key)
+        for session, seqs in written.items():
+            flushed = 0
+            while flushed + 1 in seqs:
+                flushed += 1
+            self.last_seq[session] = self.flushed_seq[session] = flushed
+            if len(seqs) > flushed:
+                self.beyond_gap[session] = {seq for seq in seqs if seq > flushed}
+
+    def add(self, event, session):
+        key = (event["host"], event["source"], session)
+        if event["seq"] <= self.last_seq.get(key, 0) or event["seq"] in self.beyond_gap.get(key, ()):
+            return False
+        self.last_seq[key] = max(self.last_seq.get(key, 0), event["seq"])
+        event["session"] = session
+        if event["time"] >= self.memory_start:
+            bisect.insort(self.events, event, key=self._key)
+        bisect.insort(self.pending, event, key=self._key)
+        for subscriber in self.subscribers:
+            subscriber(event)
+        return True
+
+    def heartbeat(self, message):
+        self.last_seen[(message["host"], message["source"])] = message
+
+    def since(self, start_time):
+        """Return the stored events at or after `start_time`, in time order."""
+        older = self._read_back(start_time, self.memory_start) if start_time < self.memory_start else []
+        start = bisect.bisect_left(self.events, max(start_time, self.memory_start), key=lambda event: event["time"])
+        return older + self.events[start:]
+
+    def _read_back(self, start_time, end_time):
+        # Events in [start_time, end_time) from the daily files (late replays can be out of order)
+        first = os.path.basename(self._path(start_time))
+        events = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith("_telemetry.jsonl") and name >= first:
+                with open(os.path.join(self.directory, name)) as file:
+                    for line in file:
+                        event = json.loads(line)
+                        if start_time <= event["time"] < end_time:
+                            events.append(event)
+        events.sort(key=self._key)
+        return events
+
+    def _forget(self):
+        # Drop in-memory events older than the memory window; they are on disk
+        # by then, as the window is much longer than the reorder delay
+        memory_start = time.time() - self.memory_seconds
+        if memory_start > self.memory_start:
+            self.memory_start = memory_start
+            del self.events[:bisect.bisect_left(self.events, memory_start, key=lambda event: event["time"])]
+
+    def flush(self, everything=False):
+        """Write out the events older than the reorder window; returns the events written."""
+        self._forget()
+        cutoff = float("inf") if everything else time.time() - self.reorder_seconds
+        count = bisect.bisect_right(self.pending, cutoff, key=lambda event: event["time"])
+        if not count:
+            return []
+        ready, self.pending = self.pending[:count], self.pending[count:]
+        files = {}
+        try:
+            for event in ready:
+                path = self._path(event["time"])
+                if path not in files:
+                    files[path] = open(path, "a")
+                files[path].write(json.dumps(event, separators=(",", ":")) + "\n")
+        finally:
+            for file in files.values():
+                file.close()
+        # A session is flushed up to just before its oldest event still waiting (events can arrive out of time order)
+        sessions = {(event["host"], event["source"], event["session"]) for event in ready}
+        waiting = {}
+        for event in self.pending:
+            session = (event["host"], event["source"], event["session"])
+            if session in sessions:
+                waiting[session] = min(waiting.get(session, event["seq"]), event["seq"])
+        for session in sessions:
+            self.flushed_seq[session] = waiting[session] - 1 if session in waiting else self.last_seq[session]
+        return ready
+
+
+class TelemetryCollector:
+    """
+    asyncio TCP server that feeds every publisher's stream into an EventStore.
+
+    Events are acknowledged only after the store has written them to disk,
+    so anything lost in a collector crash is still buffered on its Pi and is
+    replayed when the Pi reconnects.
+    """
+
+    def __init__(self, store, flush_interval=5.0):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.connections = {}
+
+    async def handle(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        hello = await read_frame(reader)
+        if not hello or hello.get("type") != "hello":
+            writer.close()
+            return
+        session = (hello["host"], hello["source"], hello["session"])
+        self.connections[session] = writer
+        print(f"Telemetry from {hello['host']} ({hello['source']}) connected from {peer[0]}")
+        try:
+            writer.write(encode_frame({"last_seq": self.store.flushed_seq.get(session, 0)}))
+            await writer.drain()
+            while (message := await read_frame(reader)) is not None:
+                if message.get("type") == "heartbeat":
+                    self.store.heartbeat(message)
+                    continue
+                self.store.add(message, hello["session"])
+        except (ConnectionError, ValueError) as e:
+            print(f"Telemetry from {hello['host']} ({hello['source']}) failed: {e}")
+        except asyncio.CancelledError:
+            pass  # Collector shutting down; the publisher reconnects and replays
+        finally:
+            if self.connections.get(session) is writer:
+                del self.connections[session]
+            writer.close()
+            print(f"Telemetry from {hello['host']} ({hello['source']}) disconnected")
+
+    def flush(self, everything=False):
+        # Acknowledge, per publisher, everything now safely on disk
+        sessions = {(event["host"], event["source"], event["session"]) for event in self.store.flush(everything)}
+        for session in sessions:
+            writer = self.connections.get(session)
+            if writer is not None and not writer.is_closing():
+                writer.write(encode_frame({"ack": self.store.flushed_seq[session]}))
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    async def serve(self, host="0.0.0.0", port=TELEMETRY_PORT):
+        server = await asyncio.start_server(self.handle, host, port)
+        flusher = asyncio.create_task(self._flush_periodically())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            flusher.cancel()
+            self.flush(everything=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collect live visit/motion events and heartbeats from the Pis into one time-ordered store.")
+    parser.add_argument('--listen', default=f"0.0.0.0:{TELEMETRY_PORT}", help=f'Address to listen on (default: 0.0.0.0:{TELEMETRY_PORT})')
+    parser.add_argument('--store-dir', default="/home/rpimain/Data/Telemetry", help='Where {date}_telemetry.jsonl files are written')
+    args = parser.parse_args()
+
+    collector = TelemetryCollector(EventStore(args.store_dir))
+    try:
+        asyncio.run(collector.serve(*parse_address(args.listen)))
+    except KeyboardInterrupt:
+        print("Collector stopped.")
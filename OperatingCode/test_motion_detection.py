@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+import cv2
+import numpy as np
+
+from motionDetection import make_detector
+
+BEE_RADIUS = 10  # Pixels in a 640x480 frame, about the size of a bee on the flower top
+BEE_FRAMES = range(40, 60)
+
+
+# Function to build a textured, noisy 640x480 scene with a small dark bee crossing it during BEE_FRAMES
+def make_scene(count=80, seed=0):
+    rng = np.random.default_rng(seed)
+    base = cv2.GaussianBlur(rng.integers(60, 200, size=(480, 640, 3), dtype=np.uint8), (15, 15), 0)
+    frames = []
+    for i in range(count):
+        noise = rng.integers(-3, 4, size=base.shape, dtype=np.int16)
+        frame = np.clip(base.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+        if i in BEE_FRAMES:
+            cv2.circle(frame, (250 + 3 * (i - BEE_FRAMES.start), 240), BEE_RADIUS, (20, 20, 20), thickness=-1)
+        frames.append(frame)
+    return frames
+
+# Function to list the frames a detector fires on
+def fired_frames(name, frames, **roi):
+    detector = make_detector(name, **roi)
+    return [i for i, frame in enumerate(frames) if detector(frame)]
+
+def test_bee_triggers_default_detectors():
+    # With the default settings (no ROI), both detectors must see a bee-sized blob
+    frames = make_scene()
+    for name in ("background", "difference"):
+        fired = fired_frames(name, frames)
+        hits = [i for i in fired if i in BEE_FRAMES]
+        assert len(hits) >= len(BEE_FRAMES) - 1, f"{name} fired on {len(hits)} of {len(BEE_FRAMES)} bee frames"
+        # The only other frame allowed is the one where the bee leaves
+        assert set(fired) - set(BEE_FRAMES) <= {BEE_FRAMES.stop}, f"{name} fired without a bee: {fired}"
+
+def test_bee_triggers_with_roi():
+    frames = make_scene()
+    for name in ("background", "difference"):
+        hits = [i for i in fired_frames(name, frames, circles=[(0.5, 0.5, 0.3)]) if i in BEE_FRAMES]
+        assert len(hits) >= len(BEE_FRAMES) - 1, f"{name} + ROI fired on {len(hits)} of {len(BEE_FRAMES)} bee frames"
+
+def test_lighting_change_does_not_trigger():
+    # A sudden whole-frame brightness jump is lighting, not a visitor
+    frames = make_scene(count=30)
+    frames[20:] = [cv2.add(frame, np.full_like(frame, 60)) for frame in frames[20:]]
+    for name in ("background", "difference"):
+        assert fired_frames(name, frames) == [], f"{name} fired on a lighting change"
+
+
+if __name__ == "__main__":
+    test_bee_triggers_default_detectors()
+    test_bee_triggers_with_roi()
+    test_lighting_change_does_not_trigger()
+    print("Motion detection OK")
@@ -0,0 +1,291 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import eventLog
+from dataDenoising import CSV_DATA_SUFFIX, EVENT_LOG_DATA_SUFFIX, TIME_TOLERANCE, recording_key
+from telemetry import EventStore, TelemetryCollector, parse_address
+from fleetConfig import FLEET_FILE, UNASSIGNED, load_fleet_config
+
+WINDOW_HOURS = 24  # Hourly buckets kept per Pi
+REFRESH_SECONDS = 10.0
+HTTP_PORT = 8080
+
+
+class VisitAggregator:
+    """
+    Rolling per-Pi, per-hour visit statistics, updated one visit at a time.
+
+    Each Pi keeps a deque of hourly buckets [hour, visits, dwell seconds,
+    event groups] plus running totals over the window. `add_visit` touches
+    only the newest bucket (late visits walk back from it) and drops buckets
+    that fell out of the window, so an update is O(1) amortised and nothing
+    is recomputed from raw files. A visit opens a new event group when it
+    starts more than `group_gap` seconds after the Pi's previous visit ended,
+    the same rule dataDenoising uses. The window follows the newest visit
+    seen, so replays of old CSVs aggregate the same way as live data.
+    """
+
+    def __init__(self, window_hours=WINDOW_HOURS, group_gap=TIME_TOLERANCE.total_seconds(), treatments=None):
+        self.window_hours = window_hours
+        self.group_gap = group_gap
+        self.treatments = dict(treatments or {})
+        self.hosts = {}
+        self.latest = 0.0
+        self.lock = threading.Lock()
+
+    def _host(self, hostname):
+        if hostname not in self.hosts:
+            self.hosts[hostname] = {"buckets": deque(), "visits": 0, "dwell": 0.0, "groups": 0,
+                                    "last_end": None, "last_visit": None}
+        return self.hosts[hostname]
+
+    def add_visit(self, hostname, start, end, time_elapsed=None):
+        """Add one visit; `start`/`end` are epoch seconds."""
+        dwell = float(time_elapsed) if time_elapsed is not None else end - start
+        hour = int(start // 3600) * 3600
+        with self.lock:
+            host = self._host(hostname)
+            new_group = host["last_end"] is None or start - host["last_end"] > self.group_gap
+            host["last_end"] = end if host["last_end"] is None else max(host["last_end"], end)
+            host["last_visit"] = start if host["last_visit"] is None else max(host["last_visit"], start)
+            self.latest = max(self.latest, start)
+
+            buckets = host["buckets"]
+            if not buckets or buckets[-1][0] < hour:
+                buckets.append([hour, 0, 0.0, 0])
+                bucket = buckets[-1]
+            else:
+                # Late visit: find (or insert) its hour, walking back from the newest bucket
+                index = len(buckets) - 1
+                while index > 0 and buckets[index][0] > hour:
+                    index -= 1
+                if buckets[index][0] != hour:
+                    index += buckets[index][0] < hour
+                    buckets.insert(index, [hour, 0, 0.0, 0])
+                bucket = buckets[index]
+            bucket[1] += 1
+            bucket[2] += dwell
+            bucket[3] += new_group
+            host["visits"] += 1
+            host["dwell"] += dwell
+            host["groups"] += new_group
+            self._evict(host)
+
+    def _evict(self, host):
+        oldest = int(self.latest // 3600) * 3600 - (self.window_hours - 1) * 3600
+        buckets = host["buckets"]
+        while buckets and buckets[0][0] < oldest:
+            _, visits, dwell, groups = buckets.popleft()
+            host["visits"] -= visits
+            host["dwell"] -= dwell
+            host["groups"] -= groups
+
+    def add_event(self, event):
+        # EventStore subscriber: only visit events carry visits
+        if event.get("type") == "visit":
+            self.add_visit(event["host"], float(event["start_epoch"]), float(event["end_epoch"]),
+                           event.get("time_elapsed"))
+
+    def snapshot(self):
+        """Return the current window as a JSON-ready dict (per Pi, per hour and per treatment)."""
+        with self.lock:
+            hosts, treatments = {}, {}
+            for hostname, host in sorted(self.hosts.items()):
+                self._evict(host)
+                treatment = self.treatments.get(hostname, UNASSIGNED)
+                hosts[hostname] = {
+                    "treatment": treatment,
+                    "visits": host["visits"],
+                    "dwell_seconds": round(host["dwell"], 3),
+                    "event_groups": host["groups"],
+                    "last_visit": host["last_visit"],
+                    "hours": [{"hour": datetime.fromtimestamp(hour).isoformat(timespec="minutes"), "visits": visits,
+                               "dwell_seconds": round(dwell, 3), "event_groups": groups}
+                              for hour, visits, dwell, groups in host["buckets"]],
+                }
+                total = treatments.setdefault(treatment, {"hosts": 0, "visits": 0, "dwell_seconds": 0.0, "event_groups": 0})
+                total["hosts"] += 1
+                total["visits"] += host["visits"]
+                total["dwell_seconds"] += host["dwell"]
+                total["event_groups"] += host["groups"]
+            for total in treatments.values():
+                total["dwell_seconds"] = round(total["dwell_seconds"], 3)
+                total["visits_per_host"] = round(total["visits"] / total["hosts"], 2)
+            return {"window_hours": self.window_hours, "latest": self.latest, "hosts": hosts, "treatments": treatments}
+
+
+class VisitFollower:
+    """
+    Feed visits from fetched `*_data.csv` files and `*_events.evlog` event
+    logs into an aggregator as they grow.
+
+    Each file's read position is remembered, and only complete new rows or
+    records are parsed on each `poll`, so polling costs O(new rows). As in
+    dataDenoising, a recording with both a CSV and an event log is read from
+    the event log only. A file that became shorter than the position was
+    rewritten and is read again from the start, skipping the visits that
+    start no later than the last one already added from it.
+    """
+
+    def __init__(self, directory, aggregator):
+        self.directory = Path(directory)
+        self.aggregator = aggregator
+        self.files = {}  # path -> {"offset", "header", "last_start", "previous"}
+
+    def poll(self):
+        paths = sorted(self.directory.rglob(f"*{CSV_DATA_SUFFIX}")) + sorted(self.directory.rglob(f"*{EVENT_LOG_DATA_SUFFIX}"))
+        logged = {recording_key(path.name) for path in paths if path.name.endswith(EVENT_LOG_DATA_SUFFIX)}
+        added = 0
+        for path in paths:
+            if path.name.endswith(CSV_DATA_SUFFIX) and recording_key(path.name) in logged:
+                continue
+            state = self.files.setdefault(path, {"offset": 0, "header": None, "last_start": None, "previous": None})
+            size = path.stat().st_size
+            if size < state["offset"]:
+                state.update(offset=0, header=None, previous=None)
+            if size <= state["offset"]:
+                continue
+            read = self._read_event_log if path.name.endswith(EVENT_LOG_DATA_SUFFIX) else self._read_csv
+            for hostname, start, end, elapsed in read(path, state):
+                if state["last_start"] is not None and start <= state["last_start"]:
+                    continue  # Already added before the file was rewritten
+                state["last_start"] = start
+                self.aggregator.add_visit(hostname, start, end, elapsed)
+                added += 1
+        return added
+
+    @staticmethod
+    def _read_csv(path, state):
+        with open(path, "rb") as file:
+            file.seek(state["offset"])
+            data = file.read()
+        complete = data[:data.rfind(b"\n") + 1]  # Leave a half-written last row for next time
+        state["offset"] += len(complete)
+        lines = complete.decode().splitlines()
+        if state["header"] is None and lines:
+            state["header"], lines = next(csv.reader([lines[0]])), lines[1:]
+        for row in csv.DictReader(lines, fieldnames=state["header"]):
+            yield (row["hostname"], *visit_times(row), row["time_elapsed"])
+
+    @staticmethod
+    def _read_event_log(path, state):
+        if state["header"] is None:
+            if path.stat().st_size < eventLog.HEADER.size:
+                return
+            state["header"] = eventLog.read_header(path)
+            state["offset"] = eventLog.HEADER.size
+        with open(path, "rb") as file:
+            file.seek(state["offset"])
+            data = file.read()
+        data = data[:len(data) - len(data) % eventLog.RECORD.size]  # Whole records only
+        state["offset"] += len(data)
+        for time_ns, level in eventLog.RECORD.iter_unpack(data):
+            previous, state["previous"] = state["previous"], (time_ns, level)
+            # A "bee detected" edge followed by a "bee left" edge is one visit, as in eventLog.read_visits
+            if level == 1 and previous is not None and previous[1] == 0:
+                start, end = previous[0] / 1e9, time_ns / 1e9
+                yield state["header"]["hostname"], start, end, end - start
+
+# Function to get epoch start/end times from a visit row (old rows have no epoch columns)
+def visit_times(row):
+    if row.get("start_epoch"):
+        return float(row["start_epoch"]), float(row["end_epoch"])
+    start = datetime.strptime(f"{row['date']} {row['start_time']}", "%Y-%m-%d %H:%M:%S").timestamp()
+    end = datetime.strptime(f"{row['date']} {row['end_time']}", "%Y-%m-%d %H:%M:%S").timestamp()
+    return start, end if end >= start else end + 86400
+
+# Function to render a snapshot as a plain-text table
+def format_dashboard(snapshot):
+    lines = [f"Visits over the last {snapshot['window_hours']} h "
+             f"(as of {datetime.fromtimestamp(snapshot['latest']):%Y-%m-%d %H:%M:%S})" if snapshot["latest"] else
+             f"Visits over the last {snapshot['window_hours']} h (no visits yet)",
+             f"{'host':<12}{'treatment':<14}{'visits':>8}{'dwell (min)':>13}{'groups':>8}{'this hour':>11}"]
+    for hostname, host in snapshot["hosts"].items():
+        this_hour = host["hours"][-1]["visits"] if host["hours"] else 0
+        lines.append(f"{hostname:<12}{host['treatment']:<14}{host['visits']:>8}{host['dwell_seconds'] / 60:>13.1f}"
+                     f"{host['event_groups']:>8}{this_hour:>11}")
+    if snapshot["treatments"]:
+        lines.append("")
+        lines.append(f"{'treatment':<14}{'Pis':>5}{'visits':>8}{'per Pi':>9}{'dwell (min)':>13}{'groups':>8}")
+        for treatment, total in sorted(snapshot["treatments"].items()):
+            lines.append(f"{treatment:<14}{total['hosts']:>5}{total['visits']:>8}{total['visits_per_host']:>9}"
+                         f"{total['dwell_seconds'] / 60:>13.1f}{total['event_groups']:>8}")
+    return "\n".join(lines)
+
+# Function to serve the aggregates over HTTP: / is the text dashboard, /summary.json the data
+def start_http_server(aggregator, address):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            snapshot = aggregator.snapshot()
+            if self.path.startswith("/summary.json"):
+                body, content_type = json.dumps(snapshot).encode(), "application/json"
+            elif self.path == "/":
+                body, content_type = format_dashboard(snapshot).encode(), "text/plain; charset=utf-8"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Keep the console for the dashboard
+
+    server = ThreadingHTTPServer(address, Handler)
+    threading.Thread(target=server.serve_forever, name="http", daemon=True).start()
+    return server
+
+
+async def main(args):
+    treatments = load_fleet_config(args.fleet_config).treatments() if os.path.exists(args.fleet_config) else None
+    aggregator = VisitAggregator(args.window_hours, treatments=treatments)
+    tasks = []
+    if args.telemetry:
+        store = EventStore(args.store_dir)
+        store.subscribers.append(aggregator.add_event)
+        tasks.append(asyncio.create_task(TelemetryCollector(store).serve(*parse_address(args.telemetry))))
+    follower = VisitFollower(args.data_dir, aggregator) if args.data_dir else None
+    if args.http:
+        host, port = parse_address(args.http, HTTP_PORT)
+        start_http_server(aggregator, (host, port))
+        print(f"Dashboard at http://{host}:{port}/ (JSON at /summary.json)")
+
+    while True:
+        if follower:
+            follower.poll()
+        if args.dashboard:
+            print("\033[2J\033[H" + format_dashboard(aggregator.snapshot()), flush=True)
+        done = [task for task in tasks if task.done()]
+        for task in done:
+            task.result()  # Surface a collector that failed to start
+        await asyncio.sleep(args.refresh)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live rolling visit counts, dwell time and event groups per Pi and treatment.")
+    # Visits reach both the collector and the fetched files, so aggregating both would count each one twice
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--telemetry', metavar='HOST:PORT', default=None, help='Run a telemetry collector here and aggregate its visits')
+    source.add_argument('--data-dir', default=None, help='Follow fetched *_data.csv / *_events.evlog files in this directory (e.g. the collector output)')
+    parser.add_argument('--store-dir', default="/home/rpimain/Data/Telemetry", help='Event store directory for --telemetry')
+    parser.add_argument('--http', metavar='HOST:PORT', default=None, help=f'Serve the dashboard and JSON over HTTP (e.g. 0.0.0.0:{HTTP_PORT})')
+    parser.add_argument('--dashboard', action='store_true', help='Redraw a text dashboard in this terminal')
+    parser.add_argument('--window-hours', type=int, default=WINDOW_HOURS, help=f'Hours kept in the rolling window (default: {WINDOW_HOURS})')
+    parser.add_argument('--fleet-config', default=FLEET_FILE, help=f'Fleet file giving each Pi\'s treatment (default: {FLEET_FILE})')
+    parser.add_argument('--refresh', type=float, default=REFRESH_SECONDS, help=f'Seconds between data file polls / redraws (default: {REFRESH_SECONDS:g})')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        print("Stopped.")
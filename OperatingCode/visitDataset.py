@@ -0,0 +1,165 @@
+import pandas as pd
+from pathlib import Path
+
+# Tables kept in the dataset, one per kind of dataDenoising output
+TABLES = ("grouped", "summed")
+
+
+# Function to check that a Parquet engine is available before writing or reading
+def require_parquet():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError("The visit dataset needs pyarrow (pip install pyarrow).")
+
+# Function to get the partition directory for one table, date and Pi
+def partition_directory(dataset_directory, table, date, hostname):
+    return Path(dataset_directory) / table / f"date={date}" / f"hostname={hostname}"
+
+# Function to normalise a YYYYMMDD / YYYY-MM-DD date into the partition form
+def partition_date(date):
+    return pd.Timestamp(str(date)).strftime("%Y-%m-%d")
+
+# Function to turn the visit times into typed timestamp columns
+def typed_visits(df):
+    """
+    Return a copy of `df` with `start_time`/`end_time` as datetime64 columns.
+
+    Rows with `start_epoch`/`end_epoch` keep their sub-second precision: the
+    epochs are shifted into the Pi's local time, whose UTC offset is recovered
+    from the recorded date and clock time. Older rows combine their clock
+    times with the row's `date`; a visit whose end is earlier than its start
+    crossed midnight and ends on the following day.
+    """
+    typed = df.copy()
+    day = pd.to_datetime(typed['date'])
+    start = day + pd.to_timedelta(typed['start_time'].astype(str))
+    end = day + pd.to_timedelta(typed['end_time'].astype(str))
+    end = end.where(end >= start, end + pd.Timedelta(days=1))
+    if 'start_epoch' in typed.columns and 'end_epoch' in typed.columns:
+        start_utc = pd.to_datetime(typed['start_epoch'], unit='s')
+        utc_offset = (start - start_utc).dt.round('15min')
+        # Epochs are recorded to the microsecond; rounding drops float noise
+        start = (start_utc + utc_offset).dt.round('us')
+        end = (pd.to_datetime(typed['end_epoch'], unit='s') + utc_offset).dt.round('us')
+    typed['start_time'] = start
+    typed['end_time'] = end
+    # Date and hostname are stored in the partition path, not in every row
+    return typed.drop(columns=['date', 'hostname'])
+
+# Writer that streams one input file's visits into its date/hostname partitions
+class PartitionWriter:
+    """
+    Write frames as `{name}.parquet` in the partitions for `hostname`.
+
+    Each row goes to the partition of its own `date`, so visits recorded
+    after midnight land under the day they happened even when the input file
+    is named after the day the recording started. Frames passed to `write`
+    are appended, so large inputs can be written chunk by chunk. The files
+    only replace the existing ones when the writer closes cleanly (along
+    with removing this input's files from dates it no longer has rows for);
+    on an exception the partial files are discarded. Each input file owns
+    one file per partition, so reprocessing an input replaces its rows
+    instead of appending duplicates.
+    """
+
+    def __init__(self, dataset_directory, table, hostname, name):
+        require_parquet()
+        self.dataset_directory = dataset_directory
+        self.table = table
+        self.hostname = hostname
+        self.name = name
+        self.writers = {}  # date -> (ParquetWriter, file path, tmp path)
+        self.schema = None
+
+    def write(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        for date, rows in df.groupby(df['date'].map(partition_date), sort=True):
+            table = pa.Table.from_pandas(typed_visits(rows), schema=self.schema, preserve_index=False)
+            self.schema = table.schema
+            if date not in self.writers:
+                directory = partition_directory(self.dataset_directory, self.table, date, self.hostname)
+                directory.mkdir(parents=True, exist_ok=True)
+                tmp_path = directory / f".{self.name}.parquet.tmp"
+                self.writers[date] = (pq.ParquetWriter(tmp_path, self.schema), directory / f"{self.name}.parquet", tmp_path)
+            self.writers[date][0].write_table(table)
+
+    def close(self):
+        written = set()
+        for writer, filepath, tmp_path in self.writers.values():
+            writer.close()
+            tmp_path.replace(filepath)
+            written.add(filepath)
+        for filepath in (Path(self.dataset_directory) / self.table).glob(f"date=*/hostname={self.hostname}/{self.name}.parquet"):
+            if filepath not in written:
+                filepath.unlink()
+
+    def abort(self):
+        for writer, _, tmp_path in self.writers.values():
+            writer.close()
+            tmp_path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+# Function to write one input file's visits into its date/hostname partitions
+def write_partition(df, dataset_directory, table, hostname, name):
+    with PartitionWriter(dataset_directory, table, hostname, name) as writer:
+        writer.write(df)
+    return [filepath for _, filepath, _ in writer.writers.values()]
+
+# Function to list partition files matching a date range and/or set of Pis
+def find_partitions(dataset_directory, table="summed", start_date=None, end_date=None, hostnames=None):
+    table_directory = Path(dataset_directory) / table
+    if not table_directory.is_dir():
+        return []
+    start_date = partition_date(start_date) if start_date is not None else None
+    end_date = partition_date(end_date) if end_date is not None else None
+    hostnames = {hostnames} if isinstance(hostnames, str) else hostnames
+
+    # Prune on directory names only; files outside the filter are never opened
+    filepaths = []
+    for date_directory in sorted(table_directory.glob("date=*")):
+        date = date_directory.name.split("=", 1)[1]
+        if (start_date and date < start_date) or (end_date and date > end_date):
+            continue
+        for host_directory in sorted(date_directory.glob("hostname=*")):
+            hostname = host_directory.name.split("=", 1)[1]
+            if hostnames is not None and hostname not in hostnames:
+                continue
+            filepaths.extend((date, hostname, path) for path in sorted(host_directory.glob("*.parquet")))
+    return filepaths
+
+# Function to load visits back from the dataset, filtered by date range and/or Pi
+def load_visits(dataset_directory, table="summed", start_date=None, end_date=None, hostnames=None):
+    """
+    Load the `grouped` or `summed` table as one DataFrame.
+
+    `start_date`/`end_date` are inclusive and accept YYYYMMDD or YYYY-MM-DD;
+    `hostnames` is a hostname or a list of them. The `date` and `hostname`
+    partition columns are added back as datetime64 and categorical columns.
+    """
+    if table not in TABLES:
+        raise ValueError(f"Unknown table {table!r}; expected one of {TABLES}")
+    require_parquet()
+
+    frames = []
+    for date, hostname, path in find_partitions(dataset_directory, table, start_date, end_date, hostnames):
+        frame = pd.read_parquet(path)
+        frame.insert(0, 'date', pd.Timestamp(date))
+        frame.insert(0, 'hostname', hostname)
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=['hostname', 'date', 'start_time', 'end_time', 'time_elapsed'])
+
+    visits = pd.concat(frames, ignore_index=True)
+    visits['hostname'] = visits['hostname'].astype('category')
+    return visits
@@ -0,0 +1,201 @@
+import argparse
+import json
+import re
+from datetime import datetime, time, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from clockAudit import OFFSETS_FILE, offset_at, read_offsets
+from dataDenoising import CSV_DATA_SUFFIX, correct_clock, has_epochs
+
+# Media saved by the camera scripts: BeeImages/{date}_{host}/HH-MM-SS[_n].png|.avi,
+# clips with a HH-MM-SS[_n].json sidecar giving the times of their first and last frames
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg"}
+CLIP_SUFFIXES = {".avi", ".mp4", ".mkv"}
+CLIP_INFO_SUFFIX = ".json"
+CLIP_SECONDS = 10.0  # Assumed length of clips recorded before sidecars existed
+MARGIN_SECONDS = 2.0  # Media this close to a visit still counts as part of it
+WRITE_SLACK = timedelta(minutes=1)  # How far a file's mtime may read before its capture time
+
+MEDIA_DIRECTORY = re.compile(r"^(\d{4}-\d{2}-\d{2})_(.+)$")
+MEDIA_NAME = re.compile(r"^(\d{2})-(\d{2})-(\d{2})")
+
+
+# Function to date a HH-MM-SS file name from the file's mtime, as epoch seconds
+def capture_time(path, clock_time):
+    """
+    The folder date is the day the script started, so after midnight it is a
+    day behind. A file is written at or after its capture, so its capture
+    time is the last `clock_time` at or before its mtime.
+    """
+    written = datetime.fromtimestamp(path.stat().st_mtime)
+    captured = datetime.combine(written.date(), time.fromisoformat(clock_time))
+    if captured > written + WRITE_SLACK:
+        captured -= timedelta(days=1)
+    return captured.timestamp()
+
+# Function to list every saved image/clip with its host and the span it covers
+def scan_media(images_root, clip_seconds=CLIP_SECONDS, offsets=None):
+    """
+    Return one row per file with `start`/`end` capture times. Images cover a
+    single instant; clips cover their first to last frame as recorded in
+    their sidecar, or `clip_seconds` from the name's time for older clips.
+    With `offsets` (clockAudit.read_offsets), each Pi's clock offset is
+    removed, as dataDenoising does for the visits.
+    """
+    rows = []
+    for directory in sorted(Path(images_root).iterdir()):
+        match = MEDIA_DIRECTORY.match(directory.name)
+        if not directory.is_dir() or not match:
+            continue
+        hostname = match.group(2)
+        for path in directory.iterdir():
+            suffix = path.suffix.lower()
+            name = MEDIA_NAME.match(path.stem)
+            if not name or suffix not in IMAGE_SUFFIXES | CLIP_SUFFIXES:
+                continue
+            if suffix in IMAGE_SUFFIXES:
+                start = end = capture_time(path, ":".join(name.groups()))
+            elif path.with_suffix(CLIP_INFO_SUFFIX).exists():
+                info = json.loads(path.with_suffix(CLIP_INFO_SUFFIX).read_text())
+                start, end = info["start_epoch"], info["end_epoch"]
+            else:
+                start = capture_time(path, ":".join(name.groups()))
+                end = start + clip_seconds
+            rows.append((hostname, start, end, str(path), "clip" if suffix in CLIP_SUFFIXES else "image"))
+    media = pd.DataFrame(rows, columns=["hostname", "start", "end", "path", "kind"])
+
+    if offsets is not None:
+        for hostname, index in media.groupby("hostname").indices.items():
+            offset = offset_at(offsets, hostname, media["start"].to_numpy()[index])
+            if offset is not None:
+                media.loc[media.index[index], ["start", "end"]] -= offset[:, None]
+    # Epochs to local clock times, like the visits' date and start/end times
+    media["start"] = pd.to_datetime(media["start"].map(datetime.fromtimestamp))
+    media["end"] = pd.to_datetime(media["end"].map(datetime.fromtimestamp))
+    return media
+
+# Function to load visits or event groups from IR / dataDenoising CSV files
+def load_visits(filepaths, offsets=None):
+    """
+    Return one row per visit with typed `start`/`end` times.
+
+    Works on raw `{date}_{host}_data.csv` files (one row per visit) and on
+    `_timesSummed.csv` files (one row per event group). `source` and `visit`
+    (the row number in that file, i.e. the event_group of a summed file)
+    identify each row. With `offsets`, raw files with epoch columns get the
+    clock correction dataDenoising already applied to its outputs.
+    """
+    frames = []
+    for filepath in filepaths:
+        df = pd.read_csv(filepath)
+        if offsets is not None and Path(filepath).name.endswith(CSV_DATA_SUFFIX) and has_epochs(df):
+            df = correct_clock(df, offsets)
+        df = df[["hostname", "date", "start_time", "end_time", "time_elapsed"]].copy()
+        df["source"] = Path(filepath).name
+        df["visit"] = np.arange(len(df))
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=["hostname", "date", "start", "end", "time_elapsed", "source", "visit"])
+    visits = pd.concat(frames, ignore_index=True)
+
+    day = pd.to_datetime(visits["date"])
+    visits["start"] = day + pd.to_timedelta(visits["start_time"].astype(str))
+    visits["end"] = day + pd.to_timedelta(visits["end_time"].astype(str))
+    visits["end"] = visits["end"].where(visits["end"] >= visits["start"], visits["end"] + pd.Timedelta(days=1))
+    return visits.drop(columns=["start_time", "end_time"])
+
+
+class MediaIndex:
+    """
+    Per-Pi sorted arrays of media capture spans for fast interval queries.
+
+    A query binary-searches the sorted start times, so finding the media for a
+    visit costs O(log n) no matter how much of the season is indexed. Each
+    Pi's longest span bounds how far back the search has to reach.
+    """
+
+    def __init__(self, media):
+        self.hosts = {}
+        for hostname, group in media.sort_values("start", kind="stable").groupby("hostname", sort=False):
+            starts = group["start"].to_numpy(dtype="datetime64[ns]")
+            ends = group["end"].to_numpy(dtype="datetime64[ns]")
+            longest = (ends - starts).max() if len(starts) else np.timedelta64(0, "ns")
+            self.hosts[hostname] = (starts, ends, longest, group["path"].to_numpy(), group["kind"].to_numpy())
+
+    def lookup(self, hostname, start, end, margin=MARGIN_SECONDS):
+        """Return (paths, kinds) of the media on `hostname` that overlap [start, end] +/- margin."""
+        if hostname not in self.hosts:
+            return np.array([], dtype=object), np.array([], dtype=object)
+        starts, ends, longest, paths, kinds = self.hosts[hostname]
+        margin = np.timedelta64(int(margin * 1e9), "ns")
+        lo_time = np.datetime64(start, "ns") - margin
+        hi_time = np.datetime64(end, "ns") + margin
+
+        # Nothing starting more than the longest span before the visit can overlap it
+        lo = np.searchsorted(starts, lo_time - longest, side="left")
+        hi = np.searchsorted(starts, hi_time, side="right")
+        hit = ends[lo:hi] >= lo_time
+        return paths[lo:hi][hit], kinds[lo:hi][hit]
+
+# Function to match every visit with the media captured during it
+def build_index(visits, media_index, margin=MARGIN_SECONDS):
+    """
+    Return a long table with one row per (visit, media file) match.
+
+    Visits without any media are kept with an empty `path`, so the index also
+    shows which visits the camera missed.
+    """
+    rows = []
+    for visit in visits.itertuples(index=False):
+        paths, kinds = media_index.lookup(visit.hostname, visit.start, visit.end, margin)
+        base = (visit.hostname, visit.date, visit.source, visit.visit, visit.start, visit.end, visit.time_elapsed)
+        if len(paths) == 0:
+            rows.append(base + ("", ""))
+        rows.extend(base + (path, kind) for path, kind in zip(paths, kinds))
+    return pd.DataFrame(rows, columns=["hostname", "date", "source", "visit", "start", "end",
+                                       "time_elapsed", "path", "kind"])
+
+# Function to write one index CSV per day
+def write_daily_indexes(index, output_directory):
+    output_directory = Path(output_directory)
+    output_directory.mkdir(parents=True, exist_ok=True)
+    written = []
+    for date, day in index.groupby("date", sort=True):
+        filepath = output_directory / f"{date}_visitIndex.csv"
+        day.to_csv(filepath, index=False)
+        written.append(filepath)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Link IR visits / event groups to the camera images and clips captured during them.")
+    parser.add_argument('data_directory', type=Path, help='Directory searched (recursively) for visit CSVs')
+    parser.add_argument('images_directory', type=Path, help='BeeImages directory with {date}_{host} folders')
+    parser.add_argument('--output-dir', type=Path, default=Path("VisitIndex"), help='Where to write {date}_visitIndex.csv files (default: ./VisitIndex)')
+    parser.add_argument('--pattern', default="*_timesSummed.csv", help='Visit files to index: *_timesSummed.csv for event groups (default) or *_data.csv for raw visits')
+    parser.add_argument('--margin', type=float, default=MARGIN_SECONDS, help=f'Seconds of slack around each visit (default: {MARGIN_SECONDS})')
+    parser.add_argument('--clip-seconds', type=float, default=CLIP_SECONDS, help=f'Assumed length of clips without a sidecar, in seconds (default: {CLIP_SECONDS})')
+    parser.add_argument('--clock-offsets', type=Path, help=f'Clock offsets measured by clockAudit.py (default: {OFFSETS_FILE} next to the images directory, if present)')
+    parser.add_argument('--no-clock-correction', action='store_true', help='Keep the times the Pis recorded')
+    args = parser.parse_args()
+
+    offsets = None
+    clock_offsets = args.clock_offsets or args.images_directory.parent / OFFSETS_FILE
+    if not args.no_clock_correction and clock_offsets.exists():
+        offsets = read_offsets(clock_offsets)
+        print(f"Correcting media times with the clock offsets in {clock_offsets}.")
+    elif args.clock_offsets and not args.no_clock_correction:
+        print(f"Clock offsets file {clock_offsets} does not exist.")
+
+    visits = load_visits(sorted(args.data_directory.rglob(args.pattern)), offsets)
+    media = scan_media(args.images_directory, args.clip_seconds, offsets)
+    print(f"Indexing {len(visits)} visits against {len(media)} images/clips...")
+
+    index = build_index(visits, MediaIndex(media), args.margin)
+    for filepath in write_daily_indexes(index, args.output_dir):
+        print(f"Index saved to: {filepath}")
+    matched = index.loc[index["path"] != "", ["source", "visit"]].drop_duplicates()
+    print(f"{len(matched)} of {len(visits)} visits have images or clips.")